@@ -13,21 +13,70 @@ Cara pakai (singkat):
 2. Isi TOKEN_BOT di bawah.
 3. Jalankan: python legends_of_aruna_bot.py
 4. Chat bot di Telegram, pakai /start
-
-NB: Untuk produksi, sebaiknya simpan state di database, bukan di memory seperti contoh ini.
+5. Opsional: --convert-saves (ubah save JSON ke format compact), --bench-save-format
+   Test perilaku (save, autosave, sharding, webhook, router): pytest tests/
+   Benchmark hot path (butuh pytest-benchmark): pytest benchmarks/ --benchmark-autosave
+   Simulasi balance offline: --simulate-balance --sim-level 5 --sim-battles 100000 --seed 1
+6. Mode webhook (butuh aiohttp): --mode webhook --port 8081, satu port per worker di belakang
+   reverse proxy. Uji lokal: jalankan worker dengan --api-base-url http://127.0.0.1:8090/bot
+   lalu --fake-telegram --webhook-target http://127.0.0.1:8081/telegram
+
+7. Sharding multi-proses: --mode shard-front --shards 4 --spawn-shards. Front menerima update
+   (webhook atau --shard-source polling) dan meneruskannya ke worker shard per consistent hash
+   user_id. Uji lokal: --fake-telegram --webhook-target http://127.0.0.1:8081/telegram ke front,
+   dengan --api-base-url http://127.0.0.1:8090/bot pada front.
+
+NB: Untuk produksi, set SAVE_BACKEND = "sqlite" agar save tersimpan di database (WAL),
+bukan ribuan file JSON kecil.
 """
 
 from __future__ import annotations
 
+import argparse
 import asyncio
+import bisect
+import concurrent.futures
+import contextvars
+import copy
+import hashlib
 import json
 import logging
+import math
+import mmap
 import os
-from collections import Counter, defaultdict
+import re
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, defaultdict, deque
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 import random
+import signal
+
+try:
+    import msgpack  # opsional: save compact memakai msgpack bila terpasang
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np  # opsional: mempercepat batch damage yang besar (simulasi)
+except ImportError:
+    np = None
+
+try:
+    import aiohttp  # opsional: hanya dibutuhkan untuk mode webhook
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+    web = None
 
 from telegram import (
     Update,
@@ -35,7 +84,8 @@ from telegram import (
     InlineKeyboardMarkup,
     CallbackQuery,
 )
-from telegram.error import BadRequest
+from telegram.error import BadRequest, RetryAfter
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -80,9 +130,293 @@ AUTOSAVE_BOSS_KEYS = {
     "FEBRI_LORD",
 }
 AUTOSAVE_NOTICE_TEXT = "Progress otomatis disimpan."
-PENDING_AUTOSAVE_FLAG = "_PENDING_AUTOSAVE"
+EDIT_FAILED_FALLBACK_TEXT = "Terjadi kesalahan saat memperbarui pesan. Coba lagi."
 UNKNOWN_CALLBACK_MESSAGE = "Perintah ini tidak dikenal. Coba tekan menu lagi."
 
+BOT_MODE = "polling"  # "polling" atau "webhook" (bisa ditimpa dengan --mode)
+WEBHOOK_LISTEN = "127.0.0.1"  # worker berada di belakang reverse proxy lokal
+WEBHOOK_PORT = 8081
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_HEALTH_PATH = "/healthz"
+WEBHOOK_URL = ""  # URL publik lengkap untuk setWebhook; kosong = tidak diatur otomatis
+WEBHOOK_SECRET_TOKEN = ""  # dicocokkan dengan header X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_CONCURRENT_UPDATES = 64  # update paralel per worker; urutan per user dijaga lock user
+TELEGRAM_API_BASE_URL = ""  # kosong = api.telegram.org; isi untuk Bot API lokal/palsu
+
+SHARD_COUNT = 1  # >1 = mode sharding: front meneruskan update ke SHARD_COUNT worker
+SHARD_INDEX: Optional[int] = None  # diisi di proses worker shard (--shard-index)
+SHARD_BASE_PORT = 8101  # worker shard i listen di SHARD_BASE_PORT + i
+SHARD_VIRTUAL_NODES = 64  # titik per shard di hash ring
+SHARD_FORWARD_QUEUE_MAX = 10000  # update yang boleh menunggu per shard sebelum front menolak (503)
+SHARD_FORWARD_RETRY_DELAY = 0.5
+METRICS_HOST = "127.0.0.1"  # endpoint Prometheus hanya untuk jaringan lokal
+METRICS_PORT = 0  # 0 = nonaktif; isi (mis. 9108) atau pakai --metrics-port
+METRICS_PATH = "/metrics"
+METRICS_PREFIX = "aruna_"
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ==========================
+# INSTRUMENTASI (LATENSI & THROUGHPUT)
+# ==========================
+
+class LatencyHistogram:
+    """Histogram kumulatif ala Prometheus (detik) plus total dan maksimum."""
+
+    __slots__ = ("buckets", "counts", "count", "total", "max")
+
+    def __init__(self, buckets: Tuple[float, ...] = METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def cumulative(self) -> List[int]:
+        running = 0
+        result = []
+        for value in self.counts:
+            running += value
+            result.append(running)
+        return result
+
+    def quantile(self, q: float) -> float:
+        """Perkiraan kuantil dari batas bucket (batas atas bucket yang memuat kuantil)."""
+
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets, self.cumulative()):
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+def _format_metric_labels(labels: Tuple[Tuple[str, str], ...], le: Optional[str] = None) -> str:
+    if le is not None:
+        labels = labels + (("le", le),)
+    parts = [
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    ]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """Histogram latensi dan counter ber-label, bisa diekspor sebagai teks Prometheus.
+
+    observe() dipanggil dari event loop maupun thread worker autosave, jadi
+    dijaga dengan threading.Lock.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], LatencyHistogram]] = defaultdict(dict)
+        self.counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = defaultdict(dict)
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.help: Dict[str, str] = {}
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = LatencyHistogram()
+                self.histograms[name][key] = histogram
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self.counters[name]
+            family[key] = family.get(key, 0.0) + amount
+
+    def register_gauge(self, name: str, func: Callable[[], float], help_text: str = "") -> None:
+        self.gauges[name] = func
+        if help_text:
+            self.describe(name, help_text)
+
+    def timer(self, name: str, **labels: Any) -> "MetricsTimer":
+        return MetricsTimer(self, name, labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started_at = time.time()
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        for name in sorted(histograms):
+            full = self.prefix + name
+            if name in self.help:
+                lines.append(f"# HELP {full} {self.help[name]}")
+            lines.append(f"# TYPE {full} histogram")
+            for labels, histogram in sorted(histograms[name].items()):
+                for bound, cumulative in zip(histogram.buckets, histogram.cumulative()):
+                    bucket_labels = _format_metric_labels(labels, format(bound, "g"))
+                    lines.append(f"{full}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{full}_bucket{_format_metric_labels(labels, '+Inf')} {histogram.count}")
+                lines.append(f"{full}_sum{_format_metric_labels(labels)} {histogram.total:.6f}")
+                lines.append(f"{full}_count{_format_metric_labels(labels)} {histogram.count}")
+        for name in sorted(counters):
+            full = self.prefix + name
+            if name in self.help:
+                lines.append(f"# HELP {full} {self.help[name]}")
+            lines.append(f"# TYPE {full} counter")
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{full}{_format_metric_labels(labels)} {value:g}")
+        for name in sorted(self.gauges):
+            full = self.prefix + name
+            try:
+                value = float(self.gauges[name]())
+            except Exception:
+                logger.debug("Gauge %s gagal dibaca", name, exc_info=True)
+                continue
+            if name in self.help:
+                lines.append(f"# HELP {full} {self.help[name]}")
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str, limit: int = 8) -> List[Dict[str, Any]]:
+        with self._lock:
+            series = list(self.histograms.get(name, {}).items())
+        rows = []
+        for labels, histogram in series:
+            rows.append(
+                {
+                    "labels": ",".join(value for _, value in labels) or "-",
+                    "count": histogram.count,
+                    "avg_ms": histogram.total / histogram.count * 1000 if histogram.count else 0.0,
+                    "p95_ms": histogram.quantile(0.95) * 1000,
+                    "max_ms": histogram.max * 1000,
+                }
+            )
+        rows.sort(key=lambda row: row["count"] * row["avg_ms"], reverse=True)
+        return rows[:limit]
+
+
+class MetricsTimer:
+    """Context manager pengukur durasi; aman dipakai di sekitar await."""
+
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry: MetricsRegistry, name: str, labels: Dict[str, Any]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> "MetricsTimer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.labels = dict(self.labels, outcome="error")
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("handler_seconds", "Durasi handler command/callback Telegram.")
+METRICS.describe("callback_route_seconds", "Durasi per route callback di CALLBACK_ROUTER.")
+METRICS.describe("lock_wait_seconds", "Waktu menunggu lock per user.")
+METRICS.describe("telegram_api_seconds", "Latensi panggilan Bot API.")
+METRICS.describe("save_seconds", "Durasi penulisan save ke backend.")
+METRICS.describe("lock_hold_seconds", "Lama lock per user dipegang.")
+METRICS.describe("lock_network_calls_total", "Panggilan Bot API saat lock user dipegang.")
+METRICS.describe("lock_slow_holds_total", "Hold lock user di atas LOCK_SLOW_HOLD_THRESHOLD per call site.")
+METRICS.register_gauge("sessions", lambda: len(SESSION_CACHE), "Jumlah state user di memory.")
+METRICS.register_gauge("autosave_queue_depth", lambda: AUTOSAVE_QUEUE.metrics()["depth"], "User menunggu autosave.")
+METRICS.register_gauge("edit_queue_depth", lambda: EDIT_SCHEDULER.depth, "Edit pesan yang menunggu dikirim.")
+METRICS.register_gauge("uptime_seconds", lambda: time.time() - METRICS.started_at, "Umur proses sejak metrics dimulai.")
+
+
+def timed_handler(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Bungkus handler telegram.ext supaya durasinya tercatat di METRICS."""
+
+    async def wrapper(update, context):
+        with METRICS.timer("handler_seconds", handler=name):
+            return await func(update, context)
+
+    wrapper.__name__ = getattr(func, "__name__", name)
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+async def handle_metrics_request(request):
+    return web.Response(text=METRICS.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int):
+    """Endpoint Prometheus mandiri (mode polling); butuh aiohttp."""
+
+    if web is None:
+        logger.warning("Endpoint metrics butuh aiohttp; METRICS hanya tersedia lewat /metrics admin.")
+        return None
+    app = web.Application()
+    app.router.add_get(METRICS_PATH, handle_metrics_request)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics Prometheus aktif di http://%s:%s%s", host, port, METRICS_PATH)
+    return runner
+
+
+async def handle_edit_failure(
+    exc: BadRequest,
+    message: Any,
+    context_info: str,
+    user_id: Any,
+) -> bool:
+    """Tangani BadRequest dari edit pesan; True jika edit benar-benar gagal.
+
+    "message is not modified" diabaikan, selain itu user dikirimi pesan baru
+    supaya tidak dibiarkan tanpa balasan.
+    """
+
+    error_text = str(exc)
+    if "message is not modified" in error_text.lower():
+        logger.debug(
+            "Edit pesan diabaikan (%s) karena tidak ada perubahan: %s",
+            context_info or "tanpa konteks",
+            error_text,
+        )
+        return False
+    logger.warning(
+        "Gagal mengedit pesan (%s) untuk user %s: %s",
+        context_info or "callback",
+        user_id,
+        error_text,
+    )
+    if message is not None:
+        try:
+            await message.reply_text(EDIT_FAILED_FALLBACK_TEXT)
+        except Exception:
+            logger.exception(
+                "Gagal mengirim pesan fallback setelah error edit (%s)",
+                context_info or "callback",
+            )
+    return True
+
 
 async def safe_edit_text(
     query: Optional[CallbackQuery],
@@ -95,33 +429,15 @@ async def safe_edit_text(
     if not query:
         return
     try:
-        await query.edit_message_text(text=text, reply_markup=reply_markup)
+        if isinstance(query, DeferringProxy) and query.defers_sends():
+            # Hanya masuk antrian; error & pesan fallback ditangani ChatOutbox saat benar-benar dikirim.
+            await query.edit_message_text(text=text, reply_markup=reply_markup)
+        else:
+            with METRICS.timer("telegram_api_seconds", method="edit_message_text", source="callback"):
+                await query.edit_message_text(text=text, reply_markup=reply_markup)
     except BadRequest as exc:
-        message = str(exc)
-        if "message is not modified" in message.lower():
-            logger.debug(
-                "Edit pesan diabaikan (%s) karena tidak ada perubahan: %s",
-                context_info or "tanpa konteks",
-                message,
-            )
-            return
         user_id = query.from_user.id if query.from_user else "unknown"
-        logger.warning(
-            "Gagal mengedit pesan (%s) untuk user %s: %s",
-            context_info or "callback",
-            user_id,
-            message,
-        )
-        if query.message:
-            try:
-                await query.message.reply_text(
-                    "Terjadi kesalahan saat memperbarui pesan. Coba lagi."
-                )
-            except Exception:
-                logger.exception(
-                    "Gagal mengirim pesan fallback setelah error edit (%s)",
-                    context_info or "callback",
-                )
+        await handle_edit_failure(exc, query.message, context_info, user_id)
 
 
 def parse_callback_parts(data: str, min_parts: int) -> Optional[List[str]]:
@@ -948,6 +1264,10 @@ ELEMENTAL_ADVANTAGE: Dict[str, Dict[str, float]] = {
 
 
 def reset_auto_hunt_state(state: "GameState") -> None:
+    stats = state.auto_hunt_stats or {}
+    if stats.get("auto_chat_id") and stats.get("auto_message_id"):
+        # Panel sesi ini selesai; scheduler tidak perlu lagi mengingat isinya.
+        EDIT_SCHEDULER.forget(stats["auto_chat_id"], stats["auto_message_id"])
     state.auto_hunt = False
     state.auto_hunt_area = None
     state.auto_hunt_stats = {}
@@ -1002,6 +1322,7 @@ def complete_guild_quest(state: GameState, quest_id: str) -> Tuple[bool, str]:
     for item_id, qty in quest.reward_items.items():
         adjust_inventory(state, item_id, qty)
     state.quests_completed.append(quest)
+    state.mark_dirty("quests")
     state.quests_active.pop(quest_id, None)
     reward_parts = []
     if quest.reward_gold:
@@ -1013,28 +1334,50 @@ def complete_guild_quest(state: GameState, quest_id: str) -> Tuple[bool, str]:
     return True, f"Quest '{quest.id}' selesai. Hadiah: {reward_text}."
 
 
-def update_hunt_quest_progress(state: GameState, defeated_ids: List[str]) -> List[str]:
+@dataclass
+class HuntQuestProgress:
+    quest_id: str
+    progress: int
+    required_amount: int
+    gained: int
+    completed: bool = False  # baru selesai pada update ini
+
+
+def advance_hunt_quests(state: GameState, defeated_ids: List[str]) -> List[HuntQuestProgress]:
     if not defeated_ids or not state.quests_active:
         return []
     counts = Counter([mid for mid in defeated_ids if mid])
-    logs: List[str] = []
+    updates: List[HuntQuestProgress] = []
     for quest in state.quests_active.values():
         if quest.type != "HUNT" or not quest.target:
             continue
         gained = counts.get(quest.target, 0)
         if not gained:
             continue
-        before = quest.progress
         quest.progress = min(quest.required_amount, quest.progress + gained)
-        logs.append(
-            f"{quest.id}: {quest.progress}/{quest.required_amount} target terbunuh (+'{gained}')."
-        )
+        entry = HuntQuestProgress(quest.id, quest.progress, quest.required_amount, gained)
         if quest.progress >= quest.required_amount and quest.status != "COMPLETED":
             quest.status = "COMPLETED"
             quest.completion_time = datetime.utcnow().isoformat()
-            logs.append(f"{quest.id}: Laporkan ke guild untuk klaim hadiah.")
+            entry.completed = True
+        updates.append(entry)
+    return updates
+
+
+def format_hunt_quest_progress(updates: List[HuntQuestProgress]) -> List[str]:
+    logs: List[str] = []
+    for entry in updates:
+        logs.append(
+            f"{entry.quest_id}: {entry.progress}/{entry.required_amount} target terbunuh (+'{entry.gained}')."
+        )
+        if entry.completed:
+            logs.append(f"{entry.quest_id}: Laporkan ke guild untuk klaim hadiah.")
     return logs
 
+
+def update_hunt_quest_progress(state: GameState, defeated_ids: List[str]) -> List[str]:
+    return format_hunt_quest_progress(advance_hunt_quests(state, defeated_ids))
+
 # Drop tables per area
 DROP_TABLES = {
     "HUTAN_SELATPANJANG": [
@@ -1329,7 +1672,15 @@ CHAR_SKILL_UNLOCKS = {
 # STORY DATA LOADER
 # Story/story data diambil dari file eksternal
 SCENE_FILES = [os.path.join("data", "scenes_main.json")]
-SCENES: Dict[str, Dict[str, Any]] = {}
+SCENE_CACHE_PATH = os.path.join("data", ".scenes.cache")  # artefak hasil kompilasi, aman dihapus
+SCENE_CACHE_MAGIC = b"ARSC"
+SCENE_CACHE_VERSION = 3  # naikkan bila bentuk scene ternormalisasi berubah
+SCENE_CACHE_HEADER = struct.Struct("<4sBIQI")  # magic, versi, panjang index JSON, panjang body, CRC32 body
+SCENE_LRU_SIZE = 128  # scene yang tetap ter-decode di memori
+CONTENT_TABLE_DIR = os.path.join("data", "tables")  # override opsional tabel data (hasil --export-content)
+CONTENT_TABLE_NAMES = ("ITEMS", "MONSTERS", "SKILLS", "DROP_TABLES", "HUNTING_AREAS", "GUILD_QUESTS")
+CONTENT_WATCH_INTERVAL = 0.0  # detik; >0 = cek perubahan file konten dan reload otomatis
+SCENES: "SceneStore"
 
 
 def _normalize_flags(flag_data: Any) -> Dict[str, List[str]]:
@@ -1348,8 +1699,11 @@ def _normalize_flags(flag_data: Any) -> Dict[str, List[str]]:
 
 
 def _normalize_requirements(req_data: Any) -> Dict[str, Any]:
+    """flags (semua harus aktif) dan min_level selalu ada; any_flags/not_flags/items/any_of hanya bila dipakai."""
+
     req_flags: List[str] = []
     min_level: Optional[int] = None
+    extra: Dict[str, Any] = {}
     if isinstance(req_data, dict):
         flags_raw = req_data.get("flags", [])
         if isinstance(flags_raw, list):
@@ -1357,7 +1711,154 @@ def _normalize_requirements(req_data: Any) -> Dict[str, Any]:
         level_raw = req_data.get("min_level")
         if isinstance(level_raw, int):
             min_level = level_raw
-    return {"flags": req_flags, "min_level": min_level}
+        for key in ("any_flags", "not_flags"):
+            raw = req_data.get(key)
+            names = [f for f in raw if isinstance(f, str)] if isinstance(raw, list) else []
+            if names:
+                extra[key] = names
+        items_raw = req_data.get("items")
+        if isinstance(items_raw, dict):
+            items = {str(item_id): qty for item_id, qty in items_raw.items() if isinstance(qty, int) and qty > 0}
+            if items:
+                extra["items"] = items
+        any_raw = req_data.get("any_of")
+        if isinstance(any_raw, list):
+            alternatives = [_normalize_requirements(alt) for alt in any_raw if isinstance(alt, dict)]
+            if alternatives:
+                extra["any_of"] = alternatives
+    return {"flags": req_flags, "min_level": min_level, **extra}
+
+
+# Flag cerita yang dipakai kode; flag lain dari data scene ikut di-intern saat scene dimuat.
+STORY_FLAG_NAMES = (
+    "HAS_UMAR",
+    "HAS_REZA",
+    "UMAR_QUEST_DONE",
+    "REZA_QUEST_DONE",
+    "QUEST_WEAPON_STARTED",
+    "QUEST_WEAPON_DONE",
+    "WEAPON_QUEST_STARTED",
+    "WEAPON_QUEST_DONE",
+    "SIAK_GATE_EVENT_DONE",
+    "PEKANBARU_RUMOR_DONE",
+    "VISITED_SIAK",
+    "VISITED_RENGAT",
+    "VISITED_PEKANBARU",
+    "VISITED_KAMPAR",
+)
+
+
+class FlagRegistry:
+    """Kosakata flag cerita yang di-intern: satu bit per nama flag, diberikan saat pertama kali muncul."""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._bits: Dict[str, int] = {}
+        self.names: List[str] = []
+        for name in names:
+            self.bit(name)
+
+    def bit(self, name: str) -> int:
+        bit = self._bits.get(name)
+        if bit is None:
+            bit = 1 << len(self.names)
+            self._bits[name] = bit
+            self.names.append(name)
+        return bit
+
+    def lookup(self, name: str) -> Optional[int]:
+        """Bit untuk nama flag, atau None bila belum pernah di-intern (tanpa mendaftarkannya)."""
+
+        return self._bits.get(name)
+
+    def mask(self, names: Iterable[str]) -> int:
+        mask = 0
+        for name in names:
+            mask |= self.bit(name)
+        return mask
+
+    def items(self):
+        return self._bits.items()
+
+    def names_in(self, mask: int) -> List[str]:
+        return [name for name, bit in self._bits.items() if mask & bit]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+STORY_FLAGS = FlagRegistry(STORY_FLAG_NAMES)
+
+
+def state_flag_mask(state: "GameState") -> int:
+    """Bitset flag cerita yang aktif pada state (bit sesuai STORY_FLAGS)."""
+
+    return state.flags.bits
+
+
+@dataclass(frozen=True)
+class RequirementPredicate:
+    """Syarat scene/pilihan yang sudah dikompilasi: cek flag jadi operasi bitmask."""
+
+    all_mask: int = 0
+    any_mask: int = 0
+    none_mask: int = 0
+    min_level: Optional[int] = None
+    items: Tuple[Tuple[str, int], ...] = ()
+    alternatives: Tuple["RequirementPredicate", ...] = ()
+    needs_flags: bool = False
+
+    def test(self, state: "GameState", flag_mask: Optional[int] = None) -> bool:
+        if self.needs_flags:
+            if flag_mask is None:
+                flag_mask = state_flag_mask(state)
+            if flag_mask & self.all_mask != self.all_mask:
+                return False
+            if self.any_mask and not flag_mask & self.any_mask:
+                return False
+            if flag_mask & self.none_mask:
+                return False
+        if self.min_level is not None and highest_party_level(state) < self.min_level:
+            return False
+        if self.items:
+            inventory = state.inventory
+            for item_id, qty in self.items:
+                if inventory.get(item_id, 0) < qty:
+                    return False
+        if self.alternatives:
+            return any(alt.test(state, flag_mask) for alt in self.alternatives)
+        return True
+
+
+ALWAYS_MET = RequirementPredicate()
+
+
+def compile_requirements(requirements: Optional[Dict[str, Any]]) -> RequirementPredicate:
+    if not requirements:
+        return ALWAYS_MET
+    alternatives = tuple(compile_requirements(alt) for alt in requirements.get("any_of", []))
+    all_mask = STORY_FLAGS.mask(requirements.get("flags") or [])
+    any_mask = STORY_FLAGS.mask(requirements.get("any_flags") or [])
+    none_mask = STORY_FLAGS.mask(requirements.get("not_flags") or [])
+    min_level = requirements.get("min_level")
+    predicate = RequirementPredicate(
+        all_mask=all_mask,
+        any_mask=any_mask,
+        none_mask=none_mask,
+        min_level=min_level if isinstance(min_level, int) else None,
+        items=tuple(sorted((requirements.get("items") or {}).items())),
+        alternatives=alternatives,
+        needs_flags=bool(all_mask or any_mask or none_mask) or any(alt.needs_flags for alt in alternatives),
+    )
+    return ALWAYS_MET if predicate == ALWAYS_MET else predicate
+
+
+def compile_scene_predicates(scene: Dict[str, Any]) -> Dict[str, Any]:
+    """Pasang "predicate" hasil kompilasi di scene dan tiap pilihannya (dipanggil saat scene di-decode)."""
+
+    scene["predicate"] = compile_requirements(scene.get("requirements"))
+    for choice in scene.get("choices", []):
+        choice["predicate"] = compile_requirements(choice.get("requirements"))
+    return scene
 
 
 def _normalize_choice(choice: Any, scene_id: str, index: int) -> Optional[Dict[str, Any]]:
@@ -1393,12 +1894,40 @@ def _normalize_text(text_data: Any) -> List[str]:
     return []
 
 
-def load_scenes(paths: Optional[List[str]] = None) -> None:
-    """Muat semua file scene eksternal ke dalam kamus global SCENES."""
+def _normalize_scene(scene_id: str, scene_data: Dict[str, Any]) -> Dict[str, Any]:
+    choices_raw = scene_data.get("choices", [])
+    choices: List[Dict[str, Any]] = []
+    if isinstance(choices_raw, list):
+        for idx, choice in enumerate(choices_raw):
+            normalized = _normalize_choice(choice, scene_id, idx)
+            if normalized:
+                choices.append(normalized)
+    return {
+        "text": _normalize_text(scene_data.get("text", [])),
+        "choices": choices,
+        "flags": _normalize_flags(scene_data.get("flags")),
+        "requirements": _normalize_requirements(scene_data.get("requirements")),
+    }
 
-    global SCENES
-    paths = paths or SCENE_FILES
-    loaded: Dict[str, Dict[str, Any]] = {}
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scene_source_info(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def compile_scene_files(paths: List[str]) -> bytes:
+    """Normalisasi semua scene sekali dan kemas jadi artefak: header + index + blob per scene."""
+
+    sources: List[Dict[str, Any]] = []
+    blobs: Dict[str, bytes] = {}
     for path in paths:
         if not os.path.exists(path):
             logger.warning("Scene file tidak ditemukan: %s", path)
@@ -1412,24 +1941,175 @@ def load_scenes(paths: Optional[List[str]] = None) -> None:
         if not isinstance(data, dict):
             logger.warning("Format scene file tidak valid (harus dict): %s", path)
             continue
+        sources.append({**_scene_source_info(path), "sha256": _file_sha256(path)})
         for scene_id, scene_data in data.items():
-            text_lines = _normalize_text(scene_data.get("text", []))
-            flags = _normalize_flags(scene_data.get("flags"))
-            requirements = _normalize_requirements(scene_data.get("requirements"))
-            choices_raw = scene_data.get("choices", [])
-            choices: List[Dict[str, Any]] = []
-            if isinstance(choices_raw, list):
-                for idx, choice in enumerate(choices_raw):
-                    normalized = _normalize_choice(choice, scene_id, idx)
-                    if normalized:
-                        choices.append(normalized)
-            loaded[scene_id] = {
-                "text": text_lines,
-                "choices": choices,
-                "flags": flags,
-                "requirements": requirements,
-            }
-    SCENES = loaded
+            scene = _normalize_scene(scene_id, scene_data)
+            blobs[scene_id] = json.dumps(scene, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    index: Dict[str, List[int]] = {}
+    offset = 0
+    for scene_id, blob in blobs.items():
+        index[scene_id] = [offset, len(blob)]
+        offset += len(blob)
+    header = json.dumps({"sources": sources, "index": index}, separators=(",", ":")).encode("utf-8")
+    body = b"".join(blobs.values())
+    return (
+        SCENE_CACHE_HEADER.pack(SCENE_CACHE_MAGIC, SCENE_CACHE_VERSION, len(header), len(body), zlib.crc32(body))
+        + header
+        + body
+    )
+
+
+def _parse_scene_cache(buffer: Any) -> Optional[Tuple[Dict[str, Any], int]]:
+    if len(buffer) < SCENE_CACHE_HEADER.size:
+        return None
+    magic, version, header_len, body_len, body_crc = SCENE_CACHE_HEADER.unpack_from(buffer, 0)
+    if magic != SCENE_CACHE_MAGIC or version != SCENE_CACHE_VERSION:
+        return None
+    body_start = SCENE_CACHE_HEADER.size + header_len
+    # File terpotong atau rusak ditolak di sini, bukan saat scene-nya di-decode nanti.
+    if len(buffer) != body_start + body_len or zlib.crc32(buffer[body_start:]) != body_crc:
+        return None
+    try:
+        header = json.loads(bytes(buffer[SCENE_CACHE_HEADER.size:body_start]).decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    return header, body_start
+
+
+def _scene_cache_is_fresh(header: Dict[str, Any], paths: List[str]) -> bool:
+    """Cocokkan mtime/ukuran dulu; hash hanya dihitung bila stat berubah (mis. setelah git checkout)."""
+
+    sources = header.get("sources", [])
+    existing = [path for path in paths if os.path.exists(path)]
+    if [src.get("path") for src in sources] != existing:
+        return False
+    for src in sources:
+        info = _scene_source_info(src["path"])
+        if info["mtime_ns"] == src.get("mtime_ns") and info["size"] == src.get("size"):
+            continue
+        if _file_sha256(src["path"]) != src.get("sha256"):
+            return False
+    return True
+
+
+class SceneStore:
+    """Akses scene read-only dari artefak terkompilasi; scene di-decode saat diminta lalu disimpan di LRU.
+
+    Berperilaku seperti dict (``in``, ``get``, iterasi id) supaya pemanggil SCENES lama tetap jalan.
+    """
+
+    def __init__(self, buffer: Any, index: Dict[str, List[int]], body_start: int, lru_size: int = SCENE_LRU_SIZE):
+        self._buffer = buffer
+        self._index = index
+        self._body_start = body_start
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, scene_id: object) -> bool:
+        return scene_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def __getitem__(self, scene_id: str) -> Dict[str, Any]:
+        scene = self.get(scene_id)
+        if scene is None:
+            raise KeyError(scene_id)
+        return scene
+
+    def get(self, scene_id: str, default: Any = None) -> Any:
+        scene = self._lru.get(scene_id)
+        if scene is not None:
+            self._lru.move_to_end(scene_id)
+            self.hits += 1
+            return scene
+        location = self._index.get(scene_id)
+        if location is None:
+            return default
+        self.misses += 1
+        offset, length = location
+        start = self._body_start + offset
+        scene = compile_scene_predicates(json.loads(bytes(self._buffer[start:start + length]).decode("utf-8")))
+        self._lru[scene_id] = scene
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+        return scene
+
+    def items(self):
+        for scene_id in self._index:
+            yield scene_id, self.get(scene_id)
+
+    def values(self):
+        for scene_id in self._index:
+            yield self.get(scene_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"scenes": len(self._index), "resident": len(self._lru), "hits": self.hits, "misses": self.misses}
+
+
+def _open_scene_cache(cache_path: str, paths: List[str]) -> Optional[SceneStore]:
+    try:
+        with open(cache_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    parsed = _parse_scene_cache(buffer)
+    if parsed is None or not _scene_cache_is_fresh(parsed[0], paths):
+        buffer.close()
+        return None
+    header, body_start = parsed
+    return SceneStore(buffer, header["index"], body_start)
+
+
+def build_scene_store(paths: Optional[List[str]] = None, cache_path: Optional[str] = SCENE_CACHE_PATH) -> SceneStore:
+    """SceneStore dari cache terkompilasi; kompilasi ulang bila file sumber berubah."""
+
+    paths = paths or SCENE_FILES
+    if cache_path:
+        store = _open_scene_cache(cache_path, paths)
+        if store is not None:
+            return store
+    artifact = compile_scene_files(paths)
+    if cache_path:
+        tmp_path = None
+        try:
+            # Nama temporary unik per proses: worker shard yang start bersamaan tidak saling menimpa.
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f"{os.path.basename(cache_path)}.", suffix=".tmp", dir=os.path.dirname(cache_path) or "."
+            )
+            with os.fdopen(fd, "wb") as f:
+                f.write(artifact)
+            os.replace(tmp_path, cache_path)
+        except OSError as exc:
+            # Folder data read-only: tetap jalan dari artefak di memori.
+            logger.warning("Gagal menulis cache scene %s: %s", cache_path, exc)
+            if tmp_path and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        else:
+            store = _open_scene_cache(cache_path, paths)
+            if store is not None:
+                return store
+    header, body_start = _parse_scene_cache(artifact)
+    return SceneStore(artifact, header["index"], body_start)
+
+
+def load_scenes(paths: Optional[List[str]] = None, cache_path: Optional[str] = SCENE_CACHE_PATH) -> None:
+    """Muat scene ke kamus global SCENES (lihat juga CONTENT.reload untuk hot reload)."""
+
+    global SCENES
+    SCENES = build_scene_store(paths, cache_path)
 
 
 def get_scene(scene_id: str) -> Optional[Dict[str, Any]]:
@@ -1443,6 +2123,185 @@ load_scenes()
 # STRUKTUR STATE GAME
 # ==========================
 
+# Bagian GameState yang dilacak perubahannya supaya save yang tidak perlu bisa dilewati.
+STATE_SECTION_FIELDS = {
+    "core": (
+        "scene_id",
+        "location",
+        "player_name",
+        "main_progress",
+        "gold",
+        "auto_hunt",
+        "auto_hunt_area",
+        "last_hunt_area",
+        "awaiting_player_name",
+    ),
+    "party": ("party", "party_order"),
+    "xp_pool": ("xp_pool",),
+    "inventory": ("inventory",),
+    "flags": ("flags",),
+    "quests": ("quests_active", "quests_completed"),
+}
+STATE_FIELD_SECTIONS = {
+    name: section for section, names in STATE_SECTION_FIELDS.items() for name in names
+}
+TRACKED_DICT_FIELDS = {"party", "xp_pool", "inventory", "quests_active"}
+# Kunci non-cerita yang dulu ikut tercampur di dict flags (save v2); dibuang saat migrasi.
+LEGACY_SCRATCH_FLAG_KEYS = frozenset(
+    {
+        "ACTIVE_BUFFS",
+        "DEFENDING",
+        "LIGHT_BUFF_TURNS",
+        "ARUNA_LIMIT_USED",
+        "CURRENT_BATTLE_AREA",
+        "MANA_SHIELD",
+        "LAST_BATTLE_RESULT",
+        "LAST_BATTLE_SOURCE",
+        "PENDING_TARGET",
+        "MANUAL_TARGETING",
+        "_PENDING_AUTOSAVE",
+        "LAST_HUNT_AREA",
+        "AWAITING_PLAYER_NAME",
+    }
+)
+# Field yang memengaruhi stat efektif; hanya perubahan di sini yang mengosongkan cache.
+EFFECTIVE_STAT_ATTRS = ("atk", "defense", "mag", "spd", "luck", "max_hp", "max_mp")
+STAT_CACHE_FIELDS = frozenset(EFFECTIVE_STAT_ATTRS + ("weapon_id", "armor_id"))
+
+
+class TrackedDict(dict):
+    """dict yang menandai bagian GameState pemiliknya setiap kali isinya berubah."""
+
+    _owner = None
+    _section = ""
+    _ignored: frozenset = frozenset()
+    _adopt_values = False
+
+    def __init__(self, data=None, owner=None, section: str = "", ignored: frozenset = frozenset(), adopt_values: bool = False):
+        super().__init__(data or {})
+        self._owner = owner
+        self._section = section
+        self._ignored = ignored
+        self._adopt_values = adopt_values
+        if adopt_values:
+            for value in self.values():
+                object.__setattr__(value, "_owner", owner)
+
+    def _changed(self, key: Any = None) -> None:
+        if self._owner is not None and (key is None or key not in self._ignored):
+            self._owner.mark_dirty(self._section)
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        if self._adopt_values:
+            object.__setattr__(value, "_owner", self._owner)
+        self._changed(key)
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self._changed(key)
+
+    def pop(self, key, *default):
+        existed = key in self
+        result = super().pop(key, *default)
+        if existed:
+            self._changed(key)
+        return result
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed(item[0])
+        return item
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        super().clear()
+        self._changed()
+
+    def __reduce_ex__(self, protocol):
+        # Salinan/pickle menjadi dict biasa, tanpa ikut membawa GameState pemilik.
+        return (dict, (dict(self),))
+
+
+class StoryFlagSet:
+    """Flag cerita sebagai bitset di atas STORY_FLAGS; API-nya mirip dict nama -> bool."""
+
+    __slots__ = ("bits", "_owner")
+
+    def __init__(self, data: Any = None, owner=None):
+        self.bits = 0
+        self._owner = owner
+        if isinstance(data, StoryFlagSet):
+            self.bits = data.bits
+        elif isinstance(data, dict):
+            self.bits = STORY_FLAGS.mask(name for name, value in data.items() if value is True)
+        elif data:
+            self.bits = STORY_FLAGS.mask(name for name in data if isinstance(name, str))
+
+    def _set_bits(self, bits: int) -> None:
+        if bits != self.bits:
+            self.bits = bits
+            if self._owner is not None:
+                self._owner.mark_dirty("flags")
+
+    def get(self, name: str, default: Any = False) -> Any:
+        bit = STORY_FLAGS.lookup(name)
+        if bit is None or not self.bits & bit:
+            return default
+        return True
+
+    def __getitem__(self, name: str) -> bool:
+        return self.get(name, False)
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        bit = STORY_FLAGS.bit(name)
+        self._set_bits(self.bits | bit if value else self.bits & ~bit)
+
+    def __delitem__(self, name: str) -> None:
+        self[name] = False
+
+    def pop(self, name: str, default: Any = False) -> Any:
+        value = self.get(name, default)
+        if STORY_FLAGS.lookup(name) is not None:
+            self[name] = False
+        return value
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.get(name) is True
+
+    def __iter__(self):
+        return iter(STORY_FLAGS.names_in(self.bits))
+
+    def __len__(self) -> int:
+        return bin(self.bits).count("1")
+
+    def items(self):
+        return [(name, True) for name in self]
+
+    def update_bits(self, set_mask: int = 0, unset_mask: int = 0) -> None:
+        """Set lalu hapus sekumpulan flag sekaligus (urutan sama dengan set/unset per nama)."""
+
+        self._set_bits((self.bits | set_mask) & ~unset_mask)
+
+    def clear(self) -> None:
+        self._set_bits(0)
+
+    def to_list(self) -> List[str]:
+        # Disimpan sebagai nama (bukan bit) supaya tidak bergantung urutan intern registry.
+        return sorted(self)
+
+    def __repr__(self) -> str:
+        return f"StoryFlagSet({self.to_list()!r})"
+
 
 @dataclass
 class CharacterState:
@@ -1462,6 +2321,35 @@ class CharacterState:
     weapon_id: Optional[str] = None
     armor_id: Optional[str] = None
 
+    _owner = None  # GameState pemilik, diisi oleh TrackedDict party
+    _effective_stats = None  # (generasi, tabel item terkompilasi, stat efektif) hasil cache
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name in STAT_CACHE_FIELDS:
+            object.__setattr__(self, "_effective_stats", None)
+        if self._owner is not None:
+            self._owner.mark_dirty("party")
+
+    def effective_stats(self) -> Dict[str, int]:
+        """Stat dasar + bonus equipment, dihitung ulang hanya jika stat/equipment berubah."""
+
+        compiled_items = character_compiled_items(self)
+        cached = self._effective_stats
+        if cached is not None and cached[0] == EQUIPMENT_STATS_GENERATION and cached[1] is compiled_items:
+            return cached[2]
+        stats = {attr: getattr(self, attr) for attr in EFFECTIVE_STAT_ATTRS}
+        for attr, bonus in zip(EQUIP_BONUS_ATTRS, get_equipment_bonus_vector(self, compiled_items)):
+            stats[attr] += bonus
+        object.__setattr__(self, "_effective_stats", (EQUIPMENT_STATS_GENERATION, compiled_items, stats))
+        return stats
+
+    def mark_dirty(self) -> None:
+        """Panggil setelah mengubah isi list (mis. skills) secara langsung."""
+
+        if self._owner is not None:
+            self._owner.mark_dirty("party")
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
@@ -1510,6 +2398,26 @@ class BattleTurnState:
     awaiting_player_input: bool = False
     active_token: Optional[str] = None
     pending_action: Optional[Dict[str, Any]] = None
+    # Snapshot konten saat battle dimulai; hot reload tidak mengubah battle yang sedang berjalan.
+    content: Optional["ContentSnapshot"] = None
+
+
+@dataclass
+class BattleScratch:
+    """Data sementara battle/alur UI; tidak pernah disimpan ke save."""
+
+    active_buffs: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    defending: Dict[str, bool] = field(default_factory=dict)
+    mana_shield: Dict[str, int] = field(default_factory=dict)
+    light_buff_turns: int = 0
+    aruna_limit_used: bool = False
+    current_battle_area: Optional[str] = None
+    last_battle_result: Optional[str] = None
+    last_battle_source: Optional[str] = None
+    pending_target: Optional[Any] = None
+    manual_targeting: bool = False
+    pending_autosave: Optional[Dict[str, Any]] = None
+    fast_hunt_ready_at: float = 0.0  # time.monotonic() saat fast hunt boleh dijalankan lagi
 
 
 @dataclass
@@ -1526,6 +2434,13 @@ class QuestState:
     completion_time: Optional[str] = None
     reward_received: bool = False
 
+    _owner = None  # GameState pemilik, diisi oleh TrackedDict quests_active
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if self._owner is not None:
+            self._owner.mark_dirty("quests")
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
@@ -1574,65 +2489,116 @@ class GameState:
     party_order: List[str] = field(default_factory=list)
     inventory: Dict[str, int] = field(default_factory=dict)
     xp_pool: Dict[str, int] = field(default_factory=dict)
-    flags: Dict[str, Any] = field(default_factory=dict)
+    flags: StoryFlagSet = field(default_factory=StoryFlagSet)
+    scratch: BattleScratch = field(default_factory=BattleScratch)
     return_scene_after_battle: Optional[str] = None
     loss_scene_after_battle: Optional[str] = None
     auto_hunt: bool = False
     auto_hunt_area: Optional[str] = None
     auto_hunt_stats: Dict[str, Any] = field(default_factory=dict)
+    last_hunt_area: Optional[str] = None
+    awaiting_player_name: bool = False
     quests_active: Dict[str, QuestState] = field(default_factory=dict)
     quests_completed: List[QuestState] = field(default_factory=list)
 
-    def __post_init__(self):
-        self.ensure_flag_defaults()
-
-    def ensure_flag_defaults(self):
-        default_flags = {
-            "HAS_UMAR": False,
-            "HAS_REZA": False,
-            "UMAR_QUEST_DONE": False,
-            "REZA_QUEST_DONE": False,
-            "QUEST_WEAPON_STARTED": False,
-            "QUEST_WEAPON_DONE": False,
-            "WEAPON_QUEST_STARTED": False,
-            "WEAPON_QUEST_DONE": False,
-        }
-        for key, value in default_flags.items():
-            self.flags.setdefault(key, value)
+    def __setattr__(self, name: str, value: Any) -> None:
+        section = STATE_FIELD_SECTIONS.get(name)
+        if section is None:
+            object.__setattr__(self, name, value)
+            return
+        if name == "flags":
+            value = StoryFlagSet(value, owner=self)
+        elif name in TRACKED_DICT_FIELDS and not (
+            isinstance(value, TrackedDict) and value._owner is self
+        ):
+            value = TrackedDict(
+                value,
+                owner=self,
+                section=section,
+                adopt_values=name in ("party", "quests_active"),
+            )
+        object.__setattr__(self, name, value)
+        self.mark_dirty(section)
 
-    def to_dict(self) -> Dict[str, Any]:
-        safe_flags = {
-            k: v
-            for k, v in self.flags.items()
-            if k
-            not in {
-                "ACTIVE_BUFFS",
-                "DEFENDING",
-                "LIGHT_BUFF_TURNS",
-                "ARUNA_LIMIT_USED",
-                "CURRENT_BATTLE_AREA",
-                "MANA_SHIELD",
+    def mark_dirty(self, *sections: str) -> None:
+        """Tandai bagian state berubah (tanpa argumen: semua bagian)."""
+
+        try:
+            unsaved = self._unsaved_sections
+            cache = self._section_cache
+            generations = self._section_generations
+        except AttributeError:
+            # State baru: semuanya dianggap belum tersimpan.
+            unsaved = set(STATE_SECTION_FIELDS)
+            cache = {}
+            generations = dict.fromkeys(STATE_SECTION_FIELDS, 0)
+            object.__setattr__(self, "_unsaved_sections", unsaved)
+            object.__setattr__(self, "_section_cache", cache)
+            object.__setattr__(self, "_section_generations", generations)
+        targets = sections or tuple(STATE_SECTION_FIELDS)
+        unsaved.update(targets)
+        for section in targets:
+            cache.pop(section, None)
+            generations[section] += 1
+
+    def has_unsaved_changes(self) -> bool:
+        return bool(self.__dict__.get("_unsaved_sections", True))
+
+    def save_generations(self) -> Dict[str, int]:
+        """Nomor generasi tiap bagian; diambil bersamaan dengan snapshot yang akan ditulis."""
+
+        if "_section_generations" not in self.__dict__:
+            self.mark_dirty()
+        return dict(self._section_generations)
+
+    def mark_saved(self, generations: Optional[Dict[str, int]] = None) -> None:
+        """Tandai state tersimpan. Dengan generations, hanya bagian yang belum berubah sejak snapshot."""
+
+        if "_unsaved_sections" not in self.__dict__:
+            self.mark_dirty()
+        if generations is None:
+            self._unsaved_sections.clear()
+            return
+        current = self._section_generations
+        self._unsaved_sections.difference_update(
+            [section for section, generation in generations.items() if current.get(section) == generation]
+        )
+
+    def _serialize_section(self, section: str) -> Dict[str, Any]:
+        if section == "core":
+            return {name: getattr(self, name) for name in STATE_SECTION_FIELDS["core"]}
+        if section == "party":
+            return {
+                "party_order": list(self.party_order),
+                "party": {cid: ch.to_dict() for cid, ch in self.party.items()},
             }
-        }
+        if section == "xp_pool":
+            return {"xp_pool": dict(self.xp_pool)}
+        if section == "inventory":
+            return {"inventory": dict(self.inventory)}
+        if section == "flags":
+            return {"flags": self.flags.to_list()}
         return {
-            "scene_id": self.scene_id,
-            "location": self.location,
-            "player_name": self.player_name,
-            "main_progress": self.main_progress,
-            "gold": self.gold,
-            "party_order": list(self.party_order),
-            "party": {cid: ch.to_dict() for cid, ch in self.party.items()},
-            "inventory": dict(self.inventory),
-            "xp_pool": dict(self.xp_pool),
-            "flags": safe_flags,
-            "auto_hunt": self.auto_hunt,
-            "auto_hunt_area": self.auto_hunt_area,
             "quests_active": {qid: quest.to_dict() for qid, quest in self.quests_active.items()},
             "quests_completed": [quest.to_dict() for quest in self.quests_completed],
         }
 
+    def to_dict(self) -> Dict[str, Any]:
+        # Bagian yang tidak berubah memakai hasil serialisasi sebelumnya (jangan dimutasi).
+        if "_section_cache" not in self.__dict__:
+            self.mark_dirty()
+        cache = self._section_cache
+        data: Dict[str, Any] = {"schema_version": SAVE_SCHEMA_VERSION}
+        for section in STATE_SECTION_FIELDS:
+            part = cache.get(section)
+            if part is None:
+                part = cache[section] = self._serialize_section(section)
+            data.update(part)
+        return data
+
     @classmethod
     def from_dict(cls, user_id: int, data: Dict[str, Any]) -> "GameState":
+        data = migrate_save_data(data)
         state = cls(user_id=user_id)
         state.scene_id = data.get("scene_id", state.scene_id)
         state.location = data.get("location", state.location)
@@ -1652,11 +2618,12 @@ class GameState:
         state.xp_pool = data.get("xp_pool", {})
         for cid in state.party_order:
             state.xp_pool.setdefault(cid, 0)
-        state.flags = data.get("flags", {})
-        state.ensure_flag_defaults()
+        state.flags = data.get("flags", [])
         state.auto_hunt = False
         state.auto_hunt_area = None
         state.auto_hunt_stats = {}
+        state.last_hunt_area = data.get("last_hunt_area")
+        state.awaiting_player_name = bool(data.get("awaiting_player_name", False))
         quests_active_raw = data.get("quests_active", {}) or {}
         state.quests_active = {
             qid: QuestState.from_dict(qdata)
@@ -1677,6 +2644,7 @@ class GameState:
             hero = state.party.get("ARUNA")
             if hero:
                 state.player_name = hero.name
+        state.mark_saved()
         return state
 
     def ensure_aruna(self):
@@ -1717,13 +2685,14 @@ class GameState:
         self.party_order = []
         self.inventory = {}
         self.xp_pool = {}
-        self.flags = {}
+        self.flags = []
+        self.scratch = BattleScratch()
         self.auto_hunt = False
         self.auto_hunt_area = None
         self.auto_hunt_stats = {}
+        self.last_hunt_area = None
         self.quests_active = {}
         self.quests_completed = []
-        self.ensure_flag_defaults()
         self.ensure_aruna()
 
     def add_umar(self):
@@ -1771,93 +2740,816 @@ class GameState:
             self.flags["HAS_REZA"] = True
 
 
-# Storage in-memory
-USER_STATES: Dict[int, "GameState"] = {}
-USER_LOCKS: Dict[int, asyncio.Lock] = {}
-
 SAVE_DIR = "saves"  # Untuk VPS, pastikan folder ini ada & bisa ditulis (chmod/chown sesuai user bot)
+SAVE_BACKEND = "json"  # "json" (satu file per user) atau "sqlite" (satu database WAL)
+SAVE_FORMAT = "json"  # "json" (teks, mudah dibaca) atau "compact" (biner berversi, lebih kecil & cepat)
+SAVE_DB_PATH = os.path.join(SAVE_DIR, "aruna_saves.db")
+SAVE_DB_BULK_CHUNK = 500
+SAVE_DB_BUSY_TIMEOUT = 10.0  # detik menunggu lock tulis; worker shard berbagi satu database
+
+SAVE_SCHEMA_VERSION = 3
+COMPACT_SAVE_MAGIC = b"ARS"
+COMPACT_SAVE_HEADER = struct.Struct("<3sBH")  # magic, codec, schema version
+COMPACT_CODEC_JSON_ZLIB = 1
+COMPACT_CODEC_MSGPACK = 2
+# Urutan field CharacterState di save compact (disimpan sebagai list posisi, bukan dict).
+CHARACTER_PACK_FIELDS = (
+    "id",
+    "name",
+    "level",
+    "hp",
+    "max_hp",
+    "mp",
+    "max_mp",
+    "atk",
+    "defense",
+    "mag",
+    "spd",
+    "luck",
+    "skills",
+    "weapon_id",
+    "armor_id",
+)
+# Urutan di atas adalah format file: field baru ditambahkan di akhir, jangan disisipkan.
+# Field to_dict() yang tidak ada di sini akan hilang diam-diam dari save compact.
+if set(CHARACTER_PACK_FIELDS) != set(CharacterState.from_dict({}).to_dict()):
+    raise RuntimeError("CHARACTER_PACK_FIELDS tidak sama dengan field CharacterState.to_dict()")
+SAVE_FILE_EXTENSIONS = {"json": ".json", "compact": ".sav"}
 
 
 def get_save_path(user_id: int) -> str:
-    return os.path.join(SAVE_DIR, f"{user_id}.json")
+    return os.path.join(SAVE_DIR, f"{user_id}{SAVE_FILE_EXTENSIONS.get(SAVE_FORMAT, '.json')}")
 
 
 def serialize_game_state(state: "GameState") -> Dict[str, Any]:
     return state.to_dict()
 
 
-def save_game_state(user_id: int, state: "GameState") -> bool:
-    try:
-        os.makedirs(SAVE_DIR, exist_ok=True)
-    except Exception:
-        logger.exception("Gagal membuat folder save saat menyimpan user %s", user_id)
-        return False
+# ==========================
+# FORMAT & MIGRASI SAVE
+# ==========================
 
-    path = get_save_path(user_id)
-    tmp_path = f"{path}.tmp"
-    try:
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(serialize_game_state(state), f, ensure_ascii=False, indent=2)
-        os.replace(tmp_path, path)
-        return True
-    except Exception as exc:
-        logger.exception("Gagal menyimpan progress user %s: %s", user_id, exc)
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            logger.exception("Gagal menghapus file temporary save untuk user %s", user_id)
-        return False
+SAVE_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
 
 
-def load_game_state(user_id: int) -> Optional["GameState"]:
-    path = get_save_path(user_id)
-    if not os.path.exists(path):
-        return None
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        return None
-    except Exception as exc:
-        logger.exception("Gagal memuat progress user %s: %s", user_id, exc)
-        return None
-    try:
-        return GameState.from_dict(user_id=user_id, data=data)
-    except Exception as exc:
-        logger.exception("Gagal deserialisasi save user %s: %s", user_id, exc)
-        return None
+def register_save_migration(from_version: int):
+    """Daftarkan fungsi yang menaikkan data save dari from_version ke from_version + 1."""
 
+    def decorator(func: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        SAVE_MIGRATIONS[from_version] = func
+        return func
 
-def maybe_autosave(state: "GameState", reason: str = "checkpoint") -> bool:
-    """Simpan otomatis state pemain bila fitur aktif."""
+    return decorator
 
-    if not AUTOSAVE_ENABLED:
-        logger.debug(
-            "Autosave dimatikan. Checkpoint user %s (%s) dilewati.",
-            state.user_id,
-            reason,
+
+def migrate_save_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    version = int(data.get("schema_version", 1))
+    if version > SAVE_SCHEMA_VERSION:
+        logger.warning(
+            "Save versi %s lebih baru dari versi kode (%s), dimuat apa adanya.",
+            version,
+            SAVE_SCHEMA_VERSION,
         )
-        return False
+        return data
+    while version < SAVE_SCHEMA_VERSION:
+        migration = SAVE_MIGRATIONS.get(version)
+        if migration is None:
+            raise ValueError(f"Tidak ada migrasi save dari versi {version}")
+        data = migration(data)
+        version += 1
+        data["schema_version"] = version
+    return data
+
+
+@register_save_migration(1)
+def _migrate_save_v1_to_v2(data: Dict[str, Any]) -> Dict[str, Any]:
+    # v1 = save JSON lama tanpa nomor versi; strukturnya sama dengan v2.
+    return dict(data)
+
+
+@register_save_migration(2)
+def _migrate_save_v2_to_v3(data: Dict[str, Any]) -> Dict[str, Any]:
+    # v2 menyimpan dict flags campuran; v3 hanya daftar nama flag cerita yang aktif.
+    data = dict(data)
+    flags = data.get("flags") or {}
+    if isinstance(flags, dict):
+        data["last_hunt_area"] = flags.get("LAST_HUNT_AREA")
+        data["awaiting_player_name"] = bool(flags.get("AWAITING_PLAYER_NAME", False))
+        data["flags"] = sorted(
+            name
+            for name, value in flags.items()
+            if value is True and name not in LEGACY_SCRATCH_FLAG_KEYS
+        )
+    return data
 
-    success = save_game_state(state.user_id, state)
-    if success:
-        logger.info("Autosave berhasil untuk user %s (%s)", state.user_id, reason)
+
+def encode_compact_save(data: Dict[str, Any]) -> bytes:
+    body = dict(data)
+    body["party"] = {
+        cid: [member.get(name) for name in CHARACTER_PACK_FIELDS]
+        for cid, member in (data.get("party") or {}).items()
+    }
+    version = int(data.get("schema_version", SAVE_SCHEMA_VERSION))
+    if msgpack is not None:
+        codec = COMPACT_CODEC_MSGPACK
+        payload = msgpack.packb(body, use_bin_type=True)
     else:
-        logger.warning("Autosave gagal untuk user %s (%s)", state.user_id, reason)
-    return success
+        codec = COMPACT_CODEC_JSON_ZLIB
+        raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        payload = zlib.compress(raw)
+    return COMPACT_SAVE_HEADER.pack(COMPACT_SAVE_MAGIC, codec, version) + payload
+
+
+def decode_save_blob(blob: bytes) -> Dict[str, Any]:
+    """Baca save compact maupun JSON lama (dibedakan dari magic header)."""
+
+    if not blob.startswith(COMPACT_SAVE_MAGIC):
+        return json.loads(blob.decode("utf-8"))
+    _, codec, version = COMPACT_SAVE_HEADER.unpack_from(blob)
+    payload = blob[COMPACT_SAVE_HEADER.size :]
+    if codec == COMPACT_CODEC_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Save compact ini butuh paket msgpack")
+        body = msgpack.unpackb(payload, raw=False)
+    elif codec == COMPACT_CODEC_JSON_ZLIB:
+        body = json.loads(zlib.decompress(payload).decode("utf-8"))
+    else:
+        raise ValueError(f"Codec save compact tidak dikenal: {codec}")
+    body["party"] = {
+        cid: dict(zip(CHARACTER_PACK_FIELDS, row)) for cid, row in (body.get("party") or {}).items()
+    }
+    body.setdefault("schema_version", version)
+    return body
 
 
-def queue_pending_autosave(state: "GameState", reason: str, notify: bool = False) -> None:
-    state.flags[PENDING_AUTOSAVE_FLAG] = {"reason": reason, "notify": notify}
+def encode_save_blob(data: Dict[str, Any], save_format: str, pretty: bool = True) -> bytes:
+    if save_format == "compact":
+        return encode_compact_save(data)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
-def flush_pending_autosave(state: "GameState") -> Optional[str]:
-    payload = state.flags.pop(PENDING_AUTOSAVE_FLAG, None)
-    if not payload:
-        return None
-    reason = payload.get("reason", "checkpoint")
-    notify = bool(payload.get("notify"))
+class SaveBackend(ABC):
+    """Antarmuka backend save. Data yang lewat sudah berupa dict hasil serialize."""
+
+    name = "base"
+
+    def save(self, user_id: int, data: Dict[str, Any]) -> bool:
+        return self.save_many([(user_id, data)]) == 1
+
+    @abstractmethod
+    def save_many(self, entries: List[Tuple[int, Dict[str, Any]]]) -> int:
+        """Tulis banyak save; hasil = jumlah entri yang berhasil ditulis."""
+
+    @abstractmethod
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Data save satu user, None bila tidak ada atau gagal dibaca."""
+
+    @abstractmethod
+    def load_many(self, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, Any]]:
+        """Data save beberapa user; tanpa argumen berarti semua save."""
+
+    @abstractmethod
+    def list_user_ids(self) -> List[int]:
+        """Semua user_id yang punya save, terurut."""
+
+    @abstractmethod
+    def exists(self, user_id: int) -> bool:
+        """True bila user punya save."""
+
+    def close(self) -> None:
+        return None
+
+
+class JsonFileSaveBackend(SaveBackend):
+    """Backend lama: satu file per user di SAVE_DIR (.json atau .sav untuk format compact)."""
+
+    name = "json"
+
+    def __init__(self, save_dir: str = SAVE_DIR, save_format: Optional[str] = None):
+        self.save_dir = save_dir
+        self.save_format = save_format or SAVE_FORMAT
+
+    def path_for(self, user_id: int, save_format: Optional[str] = None) -> str:
+        extension = SAVE_FILE_EXTENSIONS.get(save_format or self.save_format, ".json")
+        return os.path.join(self.save_dir, f"{user_id}{extension}")
+
+    def _existing_path(self, user_id: int) -> Optional[str]:
+        # Format aktif didahulukan; format lain tetap terbaca selama masa migrasi.
+        formats = [self.save_format] + [fmt for fmt in SAVE_FILE_EXTENSIONS if fmt != self.save_format]
+        for save_format in formats:
+            path = self.path_for(user_id, save_format)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def save(self, user_id: int, data: Dict[str, Any]) -> bool:
+        try:
+            os.makedirs(self.save_dir, exist_ok=True)
+        except Exception:
+            logger.exception("Gagal membuat folder save saat menyimpan user %s", user_id)
+            return False
+
+        path = self.path_for(user_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            blob = encode_save_blob(data, self.save_format)
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as exc:
+            logger.exception("Gagal menyimpan progress user %s: %s", user_id, exc)
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except Exception:
+                logger.exception("Gagal menghapus file temporary save untuk user %s", user_id)
+            return False
+
+    def save_many(self, entries: List[Tuple[int, Dict[str, Any]]]) -> int:
+        return sum(1 for user_id, data in entries if self.save(user_id, data))
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        path = self._existing_path(user_id)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return decode_save_blob(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.exception("Gagal memuat progress user %s: %s", user_id, exc)
+            return None
+
+    def list_user_ids(self) -> List[int]:
+        if not os.path.isdir(self.save_dir):
+            return []
+        extensions = set(SAVE_FILE_EXTENSIONS.values())
+        user_ids = set()
+        for filename in os.listdir(self.save_dir):
+            stem, ext = os.path.splitext(filename)
+            if ext in extensions and stem.lstrip("-").isdigit():
+                user_ids.add(int(stem))
+        return sorted(user_ids)
+
+    def load_many(self, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, Any]]:
+        targets = self.list_user_ids() if user_ids is None else list(user_ids)
+        result: Dict[int, Dict[str, Any]] = {}
+        for user_id in targets:
+            data = self.load(user_id)
+            if data is not None:
+                result[user_id] = data
+        return result
+
+    def exists(self, user_id: int) -> bool:
+        return self._existing_path(user_id) is not None
+
+
+class SqliteSaveBackend(SaveBackend):
+    """Backend SQLite (WAL): satu baris per user, tulis massal dalam satu transaksi."""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = SAVE_DB_PATH, save_format: Optional[str] = None):
+        self.db_path = db_path
+        self.save_format = save_format or SAVE_FORMAT
+        self._conn: Optional[sqlite3.Connection] = None
+        # Koneksi dipakai bersama oleh event loop dan thread worker save.
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                self.db_path, timeout=SAVE_DB_BUSY_TIMEOUT, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS game_saves ("
+                "user_id INTEGER PRIMARY KEY, "
+                "data TEXT NOT NULL, "
+                "updated_at TEXT NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _encode(self, data: Dict[str, Any]):
+        if self.save_format == "compact":
+            return encode_compact_save(data)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    def save_many(self, entries: List[Tuple[int, Dict[str, Any]]]) -> int:
+        if not entries:
+            return 0
+        now = datetime.now().isoformat(timespec="seconds")
+        try:
+            rows = [(user_id, self._encode(data), now) for user_id, data in entries]
+        except Exception as exc:
+            logger.exception("Gagal serialisasi batch save (%s entri): %s", len(entries), exc)
+            return 0
+        with self._lock:
+            try:
+                conn = self._connection()
+            except Exception:
+                logger.exception("Gagal membuka database save %s", self.db_path)
+                return 0
+            try:
+                # IMMEDIATE: ambil lock tulis di awal supaya proses lain menunggu, bukan gagal di tengah.
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO game_saves (user_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET "
+                    "data = excluded.data, updated_at = excluded.updated_at",
+                    rows,
+                )
+                conn.execute("COMMIT")
+                return len(rows)
+            except Exception as exc:
+                logger.exception("Gagal menyimpan batch save (%s entri): %s", len(rows), exc)
+                try:
+                    conn.execute("ROLLBACK")
+                except Exception:
+                    logger.exception("Gagal rollback transaksi save")
+                return 0
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.load_many([user_id]).get(user_id)
+
+    def load_many(self, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, Any]]:
+        result: Dict[int, Dict[str, Any]] = {}
+        with self._lock:
+            try:
+                conn = self._connection()
+                if user_ids is None:
+                    rows = conn.execute("SELECT user_id, data FROM game_saves").fetchall()
+                else:
+                    targets = list(user_ids)
+                    rows = []
+                    for start in range(0, len(targets), SAVE_DB_BULK_CHUNK):
+                        chunk = targets[start : start + SAVE_DB_BULK_CHUNK]
+                        placeholders = ",".join("?" for _ in chunk)
+                        rows.extend(
+                            conn.execute(
+                                f"SELECT user_id, data FROM game_saves WHERE user_id IN ({placeholders})",
+                                chunk,
+                            ).fetchall()
+                        )
+            except Exception as exc:
+                logger.exception("Gagal membaca database save %s: %s", self.db_path, exc)
+                return result
+        for user_id, raw in rows:
+            try:
+                if isinstance(raw, bytes):
+                    result[int(user_id)] = decode_save_blob(raw)
+                else:
+                    result[int(user_id)] = json.loads(raw)
+            except Exception as exc:
+                logger.exception("Gagal memuat progress user %s: %s", user_id, exc)
+        return result
+
+    def list_user_ids(self) -> List[int]:
+        with self._lock:
+            try:
+                rows = self._connection().execute(
+                    "SELECT user_id FROM game_saves ORDER BY user_id"
+                ).fetchall()
+            except Exception:
+                logger.exception("Gagal membaca daftar save dari database %s", self.db_path)
+                return []
+        return [int(row[0]) for row in rows]
+
+    def exists(self, user_id: int) -> bool:
+        with self._lock:
+            try:
+                row = self._connection().execute(
+                    "SELECT 1 FROM game_saves WHERE user_id = ?", (user_id,)
+                ).fetchone()
+            except Exception:
+                logger.exception("Gagal cek save user %s di database", user_id)
+                return False
+        return row is not None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+SAVE_BACKENDS = {
+    JsonFileSaveBackend.name: JsonFileSaveBackend,
+    SqliteSaveBackend.name: SqliteSaveBackend,
+}
+_save_backend: Optional[SaveBackend] = None
+
+
+def get_save_backend() -> SaveBackend:
+    global _save_backend
+    if _save_backend is None:
+        backend_cls = SAVE_BACKENDS.get(SAVE_BACKEND)
+        if backend_cls is None:
+            logger.warning("SAVE_BACKEND '%s' tidak dikenal, memakai json.", SAVE_BACKEND)
+            backend_cls = JsonFileSaveBackend
+        _save_backend = backend_cls()
+    return _save_backend
+
+
+def set_save_backend(backend: SaveBackend) -> None:
+    global _save_backend
+    if _save_backend is not None and _save_backend is not backend:
+        _save_backend.close()
+    _save_backend = backend
+
+
+def save_game_state(user_id: int, state: "GameState") -> bool:
+    try:
+        data = serialize_game_state(state)
+    except Exception as exc:
+        logger.exception("Gagal serialisasi progress user %s: %s", user_id, exc)
+        return False
+    with METRICS.timer("save_seconds", kind="single"):
+        success = get_save_backend().save(user_id, data)
+    if success:
+        state.mark_saved()
+    return success
+
+
+def save_game_states(states: Iterable["GameState"]) -> int:
+    """Simpan banyak state sekaligus (satu transaksi untuk backend sqlite)."""
+
+    entries = []
+    for state in states:
+        try:
+            entries.append((state.user_id, serialize_game_state(state)))
+        except Exception as exc:
+            logger.exception("Gagal serialisasi progress user %s: %s", state.user_id, exc)
+    return get_save_backend().save_many(entries)
+
+
+def _deserialize_save(user_id: int, data: Dict[str, Any]) -> Optional["GameState"]:
+    try:
+        return GameState.from_dict(user_id=user_id, data=data)
+    except Exception as exc:
+        logger.exception("Gagal deserialisasi save user %s: %s", user_id, exc)
+        return None
+
+
+def load_game_state(user_id: int) -> Optional["GameState"]:
+    pending = AUTOSAVE_QUEUE.peek(user_id)
+    if pending is not None:
+        # Snapshot di antrian autosave lebih baru daripada isi backend.
+        return _deserialize_save(user_id, copy.deepcopy(pending))
+    data = get_save_backend().load(user_id)
+    if data is None:
+        return None
+    return _deserialize_save(user_id, data)
+
+
+def load_game_states(user_ids: Optional[Iterable[int]] = None) -> Dict[int, "GameState"]:
+    """Muat banyak save sekaligus; tanpa argumen berarti semua save yang ada."""
+
+    states: Dict[int, GameState] = {}
+    for user_id, data in get_save_backend().load_many(user_ids).items():
+        state = _deserialize_save(user_id, data)
+        if state is not None:
+            states[user_id] = state
+    return states
+
+
+def convert_saves(
+    source: SaveBackend, target: SaveBackend, remove_source: bool = False
+) -> Tuple[int, int]:
+    """Salin semua save dari source ke target (sekalian migrasi skema). Hasil: (berhasil, gagal)."""
+
+    converted = failed = 0
+    user_ids = source.list_user_ids()
+    for start in range(0, len(user_ids), SAVE_DB_BULK_CHUNK):
+        chunk = user_ids[start : start + SAVE_DB_BULK_CHUNK]
+        loaded = source.load_many(chunk)
+        entries = []
+        for user_id in chunk:
+            data = loaded.get(user_id)
+            if data is None:
+                failed += 1
+                continue
+            try:
+                entries.append((user_id, migrate_save_data(data)))
+            except Exception as exc:
+                logger.exception("Gagal migrasi save user %s: %s", user_id, exc)
+                failed += 1
+        written = target.save_many(entries)
+        converted += written
+        failed += len(entries) - written
+        if remove_source and written == len(entries) and isinstance(source, JsonFileSaveBackend):
+            for user_id, _ in entries:
+                old_path = source.path_for(user_id)
+                if isinstance(target, JsonFileSaveBackend) and target.path_for(user_id) == old_path:
+                    continue
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+                except Exception:
+                    logger.exception("Gagal menghapus save lama %s", old_path)
+    return converted, failed
+
+
+AUTOSAVE_QUEUE_MAX_SIZE = 2000  # batas user berbeda yang menunggu ditulis
+AUTOSAVE_FLUSH_INTERVAL = 0.5  # detik jeda pengumpulan sebelum satu batch ditulis
+AUTOSAVE_MAX_RETRIES = 3
+AUTOSAVE_RETRY_BACKOFF = 2.0  # detik jeda sebelum percobaan ulang pertama, berlipat tiap gagal
+
+
+@dataclass
+class PendingAutosave:
+    """Snapshot yang menunggu ditulis, beserta generasi bagian state saat snapshot diambil."""
+
+    snapshot: Dict[str, Any]
+    reason: str
+    enqueued_at: float
+    state: "GameState"
+    generations: Dict[str, int]
+    attempts: int = 0
+
+
+class AutosaveQueue:
+    """Antrian write-behind: satu snapshot terbaru per user, ditulis massal di thread pool.
+
+    State baru ditandai tersimpan setelah backend berhasil menulis; sampai saat itu
+    bagian yang berubah tetap dianggap belum tersimpan.
+    """
+
+    def __init__(
+        self,
+        max_size: int = AUTOSAVE_QUEUE_MAX_SIZE,
+        flush_interval: float = AUTOSAVE_FLUSH_INTERVAL,
+    ):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, PendingAutosave] = {}
+        self._waiting_results: Dict[int, Optional[bool]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats: Dict[str, float] = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "skipped_clean": 0,
+            "written": 0,
+            "failed": 0,
+            "dropped": 0,
+            "overflow_sync": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "total_latency_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> bool:
+        """Jalankan worker di event loop aktif. False bila tidak ada loop."""
+
+        if self.is_running:
+            return True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        self._wakeup = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = loop.create_task(self._run())
+        if self._pending:
+            self._wakeup.set()
+        return True
+
+    def enqueue(self, state: "GameState", reason: str = "checkpoint") -> bool:
+        user_id = state.user_id
+        if not state.has_unsaved_changes():
+            self.stats["skipped_clean"] += 1
+            return True
+        if not self.start():
+            # Tanpa event loop (mis. skrip CLI) tulis langsung saja.
+            return save_game_state(user_id, state)
+        previous = self._pending.get(user_id)
+        generations = state.save_generations()
+        if previous is not None and previous.generations == generations:
+            # Snapshot yang menunggu sudah memuat perubahan terakhir.
+            self.stats["skipped_clean"] += 1
+            return True
+        if previous is None and len(self._pending) >= self.max_size:
+            self.stats["overflow_sync"] += 1
+            logger.warning(
+                "Antrian autosave penuh (%s), user %s disimpan langsung.",
+                len(self._pending),
+                user_id,
+            )
+            return save_game_state(user_id, state)
+        try:
+            snapshot = serialize_game_state(state)
+        except Exception as exc:
+            logger.exception("Gagal serialisasi progress user %s: %s", user_id, exc)
+            return False
+        if previous is not None:
+            self.stats["coalesced"] += 1
+            enqueued_at = previous.enqueued_at
+        else:
+            enqueued_at = time.perf_counter()
+        self._pending[user_id] = PendingAutosave(snapshot, reason, enqueued_at, state, generations)
+        self.stats["enqueued"] += 1
+        self._wakeup.set()
+        return True
+
+    def peek(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._pending.get(user_id)
+        return entry.snapshot if entry else None
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            delay = max(self.flush_interval, self._retry_delay())
+            if not self._stopping and delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self._drain_once()
+            except Exception:
+                logger.exception("Worker autosave gagal menulis batch")
+            if self._stopping:
+                return
+
+    async def _drain_once(self) -> None:
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            entries = [(user_id, item.snapshot) for user_id, item in batch.items()]
+            started = time.perf_counter()
+            oldest = min(item.enqueued_at for item in batch.values())
+            backend = get_save_backend()
+            try:
+                written = await asyncio.to_thread(backend.save_many, entries)
+            except Exception:
+                logger.exception("Gagal menulis batch autosave (%s entri)", len(entries))
+                written = 0
+            finished = time.perf_counter()
+            latency_ms = (finished - started) * 1000
+            METRICS.observe("save_seconds", finished - started, kind="autosave_batch")
+            self.stats["batches"] += 1
+            self.stats["last_batch_size"] = len(entries)
+            self.stats["last_latency_ms"] = latency_ms
+            self.stats["total_latency_ms"] += latency_ms
+            self.stats["max_latency_ms"] = max(self.stats["max_latency_ms"], latency_ms)
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], (finished - oldest) * 1000)
+            success = written == len(entries)
+            if success:
+                self.stats["written"] += len(entries)
+                for item in batch.values():
+                    # Bagian yang berubah selama penulisan tetap belum tersimpan.
+                    item.state.mark_saved(item.generations)
+            else:
+                self.stats["failed"] += len(entries) - written
+                self._requeue_failed(batch)
+            for user_id in batch:
+                if user_id in self._waiting_results:
+                    self._waiting_results[user_id] = success
+
+    def _retry_delay(self) -> float:
+        attempts = max((item.attempts for item in self._pending.values()), default=0)
+        if attempts <= 0:
+            return 0.0
+        return AUTOSAVE_RETRY_BACKOFF * (2 ** (attempts - 1))
+
+    def _requeue_failed(self, batch: Dict[int, PendingAutosave]) -> None:
+        requeued = False
+        for user_id, item in batch.items():
+            if user_id in self._pending:
+                continue  # sudah ada snapshot lebih baru
+            if item.attempts + 1 >= AUTOSAVE_MAX_RETRIES:
+                self.stats["dropped"] += 1
+                logger.error(
+                    "Autosave user %s (%s) dibuang setelah %s percobaan", user_id, item.reason, item.attempts + 1
+                )
+                # Pastikan save berikutnya (autosave atau /save) menulis ulang seluruh state.
+                item.state.mark_dirty()
+                continue
+            item.attempts += 1
+            self._pending[user_id] = item
+            requeued = True
+        if requeued and self._wakeup is not None:
+            # Worker mencoba lagi sendiri setelah jeda backoff, tanpa menunggu enqueue lain.
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Tulis semua snapshot yang menunggu sekarang juga."""
+
+        if self._write_lock is None:
+            return
+        for _ in range(AUTOSAVE_MAX_RETRIES):
+            if not self._pending:
+                return
+            await self._drain_once()
+
+    async def flush_user(self, user_id: int) -> bool:
+        """Tunggu sampai snapshot user tertulis; True bila berhasil."""
+
+        if self._write_lock is None:
+            return True
+        self._waiting_results[user_id] = None
+        try:
+            while self._waiting_results[user_id] is None:
+                if user_id not in self._pending and not self._write_lock.locked():
+                    return True
+                await self._drain_once()
+            return bool(self._waiting_results[user_id])
+        finally:
+            self._waiting_results.pop(user_id, None)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await self._task
+        except Exception:
+            logger.exception("Worker autosave berhenti dengan error")
+        await self.flush()
+        if self._pending:
+            logger.error("%s autosave gagal ditulis saat shutdown", len(self._pending))
+        self._task = None
+
+    def metrics(self) -> Dict[str, float]:
+        snapshot = dict(self.stats)
+        snapshot["depth"] = self.depth
+        batches = snapshot["batches"]
+        snapshot["avg_latency_ms"] = snapshot["total_latency_ms"] / batches if batches else 0.0
+        return snapshot
+
+
+AUTOSAVE_QUEUE = AutosaveQueue()
+
+
+def has_saved_game(user_id: int) -> bool:
+    return AUTOSAVE_QUEUE.peek(user_id) is not None or get_save_backend().exists(user_id)
+
+
+async def save_game_state_now(state: "GameState", reason: str = "manual") -> bool:
+    """Simpan segera lewat antrian autosave supaya urutan tulis per user tetap terjaga."""
+
+    if not AUTOSAVE_QUEUE.enqueue(state, reason):
+        return False
+    if AUTOSAVE_QUEUE.peek(state.user_id) is None:
+        return True  # sudah ditulis langsung (tanpa loop / antrian penuh)
+    return await AUTOSAVE_QUEUE.flush_user(state.user_id)
+
+
+def maybe_autosave(state: "GameState", reason: str = "checkpoint") -> bool:
+    """Simpan otomatis state pemain bila fitur aktif."""
+
+    if not AUTOSAVE_ENABLED:
+        logger.debug(
+            "Autosave dimatikan. Checkpoint user %s (%s) dilewati.",
+            state.user_id,
+            reason,
+        )
+        return False
+
+    success = AUTOSAVE_QUEUE.enqueue(state, reason)
+    if success:
+        logger.info("Autosave dijadwalkan untuk user %s (%s)", state.user_id, reason)
+    else:
+        logger.warning("Autosave gagal untuk user %s (%s)", state.user_id, reason)
+    return success
+
+
+def queue_pending_autosave(state: "GameState", reason: str, notify: bool = False) -> None:
+    state.scratch.pending_autosave = {"reason": reason, "notify": notify}
+
+
+def flush_pending_autosave(state: "GameState") -> Optional[str]:
+    payload = state.scratch.pending_autosave
+    state.scratch.pending_autosave = None
+    if not payload:
+        return None
+    reason = payload.get("reason", "checkpoint")
+    notify = bool(payload.get("notify"))
     saved = maybe_autosave(state, reason)
     if saved and notify:
         return AUTOSAVE_NOTICE_TEXT
@@ -1880,21 +3572,316 @@ def append_optional_text(base: Optional[str], addition: Optional[str]) -> str:
     return base
 
 
-def get_game_state(user_id: int) -> "GameState":
-    state = USER_STATES.get(user_id)
-    if not state:
-        state = GameState(user_id=user_id)
+SESSION_CACHE_MAX_SIZE = 5000  # jumlah state user maksimum di memory
+SESSION_IDLE_TTL = 30 * 60  # detik tanpa aktivitas sebelum state dikeluarkan
+SESSION_SWEEP_INTERVAL = 60  # detik antar pemeriksaan idle
+SESSION_EVICTED_ID_LIMIT = 50000  # user terkeluarkan yang diingat untuk dimuat ulang otomatis
+LOCK_SLOW_HOLD_THRESHOLD = 0.25  # detik; hold lebih lama dari ini dicatat sebagai lambat
+LOCK_SITE_LIMIT = 256  # jumlah call site lock yang dilacak
+LOCK_RECENT_SLOW_LIMIT = 50
+
+
+HELD_USER_LOCK: "contextvars.ContextVar[Optional[TimedLock]]" = contextvars.ContextVar("held_user_lock", default=None)
+_ASYNCIO_LOCKS_FILE = asyncio.locks.__file__
+
+
+def _lock_call_site() -> str:
+    """Fungsi pemanggil pertama di luar modul asyncio.locks (mis. handler yang memakai `async with`)."""
+
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename == _ASYNCIO_LOCKS_FILE:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+class TimedLock(asyncio.Lock):
+    """asyncio.Lock per user yang mencatat waktu tunggu, lama dipegang dan call site pemegang.
+
+    Panggilan Bot API selama lock dipegang (lewat HELD_USER_LOCK) ikut dihitung
+    supaya handler yang menahan lock melewati network I/O bisa ditemukan.
+    Hanya task pemegang yang dihitung: task yang di-spawn saat lock dipegang ikut
+    menyalin contextvar, tapi panggilan API-nya bukan milik lock ini.
+    """
+
+    def __init__(self, user_id: Optional[int] = None):
+        super().__init__()
+        self.user_id = user_id
+        self.holder_site: Optional[str] = None
+        self.holder_task: Optional[asyncio.Task] = None
+        self.held_since = 0.0
+        self.network_calls = 0
+        self.network_seconds = 0.0
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.total_hold = 0.0
+
+    async def acquire(self) -> bool:
+        site = _lock_call_site()
+        started = time.perf_counter()
+        result = await super().acquire()
+        acquired_at = time.perf_counter()
+        wait = acquired_at - started
+        self.holder_site = site
+        self.holder_task = asyncio.current_task()
+        self.held_since = acquired_at
+        self.network_calls = 0
+        self.network_seconds = 0.0
+        self.acquisitions += 1
+        self.total_wait += wait
+        HELD_USER_LOCK.set(self)
+        METRICS.observe("lock_wait_seconds", wait, lock="user")
+        LOCK_DIAGNOSTICS.record_wait(site, wait)
+        return result
+
+    def release(self) -> None:
+        hold = time.perf_counter() - self.held_since
+        site = self.holder_site or "unknown"
+        network_calls = self.network_calls
+        network_seconds = self.network_seconds
+        self.holder_site = None
+        self.holder_task = None
+        self.total_hold += hold
+        super().release()
+        if HELD_USER_LOCK.get() is self:
+            HELD_USER_LOCK.set(None)
+        METRICS.observe("lock_hold_seconds", hold, lock="user")
+        LOCK_DIAGNOSTICS.record_hold(self.user_id, site, hold, network_calls, network_seconds)
+
+    def holding_for(self) -> float:
+        return time.perf_counter() - self.held_since if self.locked() else 0.0
+
+
+def note_network_call_under_lock(method: str, seconds: float) -> None:
+    """Catat panggilan Bot API pada lock user yang sedang dipegang task ini (jika ada)."""
+
+    lock = HELD_USER_LOCK.get()
+    if lock is None or not lock.locked() or lock.holder_task is not asyncio.current_task():
+        return
+    lock.network_calls += 1
+    lock.network_seconds += seconds
+    METRICS.inc("lock_network_calls_total", method=method)
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest yang mengukur setiap panggilan Bot API untuk diagnosa lock."""
+
+    async def do_request(self, url: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, *args, **kwargs)
+        finally:
+            note_network_call_under_lock(url.rsplit("/", 1)[-1], time.perf_counter() - started)
+
+
+@dataclass
+class LockSiteStats:
+    site: str
+    acquisitions: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    releases: int = 0
+    total_hold: float = 0.0
+    max_hold: float = 0.0
+    slow_holds: int = 0
+    network_holds: int = 0
+    network_calls: int = 0
+    network_seconds: float = 0.0
+
+
+class LockDiagnostics:
+    """Agregasi per call site plus daftar hold lambat terakhir."""
+
+    def __init__(
+        self,
+        slow_threshold: float = LOCK_SLOW_HOLD_THRESHOLD,
+        site_limit: int = LOCK_SITE_LIMIT,
+        recent_limit: int = LOCK_RECENT_SLOW_LIMIT,
+    ):
+        self.slow_threshold = slow_threshold
+        self.site_limit = site_limit
+        self.sites: Dict[str, LockSiteStats] = {}
+        self.recent_slow: "deque[Dict[str, Any]]" = deque(maxlen=recent_limit)
+
+    def _site(self, site: str) -> LockSiteStats:
+        stats = self.sites.get(site)
+        if stats is None:
+            if len(self.sites) >= self.site_limit:
+                site = "(lainnya)"
+                stats = self.sites.get(site)
+            if stats is None:
+                stats = LockSiteStats(site)
+                self.sites[site] = stats
+        return stats
+
+    def record_wait(self, site: str, wait: float) -> None:
+        stats = self._site(site)
+        stats.acquisitions += 1
+        stats.total_wait += wait
+        if wait > stats.max_wait:
+            stats.max_wait = wait
+
+    def record_hold(
+        self, user_id: Optional[int], site: str, hold: float, network_calls: int, network_seconds: float
+    ) -> None:
+        stats = self._site(site)
+        stats.releases += 1
+        stats.total_hold += hold
+        if hold > stats.max_hold:
+            stats.max_hold = hold
+        if network_calls:
+            stats.network_holds += 1
+            stats.network_calls += network_calls
+            stats.network_seconds += network_seconds
+        if hold < self.slow_threshold:
+            return
+        stats.slow_holds += 1
+        METRICS.inc("lock_slow_holds_total", site=site)
+        self.recent_slow.append(
+            {
+                "at": time.time(),
+                "user_id": user_id,
+                "site": site,
+                "hold_ms": hold * 1000,
+                "network_calls": network_calls,
+                "network_ms": network_seconds * 1000,
+            }
+        )
+        logger.warning(
+            "Lock user %s dipegang %.0f ms di %s (%s panggilan Telegram, %.0f ms)",
+            user_id,
+            hold * 1000,
+            site,
+            network_calls,
+            network_seconds * 1000,
+        )
+
+    def slowest_sites(self, limit: int = 8) -> List[LockSiteStats]:
+        return sorted(self.sites.values(), key=lambda stats: stats.total_hold, reverse=True)[:limit]
+
+    def reset(self) -> None:
+        self.sites.clear()
+        self.recent_slow.clear()
+
+
+LOCK_DIAGNOSTICS = LockDiagnostics()
+
+
+class SessionCache:
+    """Cache LRU + TTL idle untuk state dan lock user.
+
+    State yang dikeluarkan disimpan lewat antrian autosave lalu dimuat ulang
+    otomatis saat user kembali. User yang lock-nya sedang dipegang, sedang
+    battle/auto hunting, atau autosave-nya belum tertulis tidak pernah dikeluarkan.
+    Daftar user terkeluarkan dibatasi SESSION_EVICTED_ID_LIMIT; user yang sudah
+    terlupa tetap bisa memuat progress lewat /load.
+    """
+
+    def __init__(self, max_size: int = SESSION_CACHE_MAX_SIZE, idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.states: Dict[int, "GameState"] = {}
+        self.locks: Dict[int, asyncio.Lock] = {}
+        self._last_access: "OrderedDict[int, float]" = OrderedDict()
+        self._evicted_ids: "OrderedDict[int, None]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self.stats = {"hits": 0, "misses": 0, "rehydrated": 0, "evicted": 0}
+
+    def touch(self, user_id: int) -> None:
+        self._last_access[user_id] = time.monotonic()
+        self._last_access.move_to_end(user_id)
+
+    def is_pinned(self, user_id: int) -> bool:
+        lock = self.locks.get(user_id)
+        if lock is not None and lock.locked():
+            return True
+        if AUTOSAVE_QUEUE.peek(user_id) is not None:
+            return True
+        state = self.states.get(user_id)
+        # battle_state dan BattleScratch tidak pernah disimpan, jadi battle manual harus tetap di memory.
+        return state is not None and (state.in_battle or state.auto_hunt or bool(state.auto_hunt_stats))
+
+    def get_state(self, user_id: int) -> "GameState":
+        self.touch(user_id)
+        state = self.states.get(user_id)
+        if state is not None:
+            self.stats["hits"] += 1
+            return state
+        self.stats["misses"] += 1
+        if user_id in self._evicted_ids:
+            state = load_game_state(user_id)
+            if state is not None:
+                self.stats["rehydrated"] += 1
+            self._evicted_ids.pop(user_id, None)
+        if state is None:
+            state = GameState(user_id=user_id)
         state.ensure_aruna()
-        USER_STATES[user_id] = state
-    return state
+        self.put_state(user_id, state)
+        return state
+
+    def put_state(self, user_id: int, state: "GameState") -> None:
+        self.touch(user_id)
+        self.states[user_id] = state
+        self._evicted_ids.pop(user_id, None)
+        self.maintain()
+
+    def get_lock(self, user_id: int) -> asyncio.Lock:
+        self.touch(user_id)
+        lock = self.locks.get(user_id)
+        if not lock:
+            lock = TimedLock(user_id)
+            self.locks[user_id] = lock
+        return lock
+
+    def evict(self, user_id: int) -> None:
+        state = self.states.pop(user_id, None)
+        self.locks.pop(user_id, None)
+        self._last_access.pop(user_id, None)
+        if state is None:
+            return
+        self.stats["evicted"] += 1
+        if state.player_name:
+            # Pemain yang belum pernah memulai petualangan tidak perlu ditulis.
+            AUTOSAVE_QUEUE.enqueue(state, "session_evict")
+            self._evicted_ids[user_id] = None
+            while len(self._evicted_ids) > SESSION_EVICTED_ID_LIMIT:
+                self._evicted_ids.popitem(last=False)
+
+    def maintain(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep >= SESSION_SWEEP_INTERVAL:
+            self._last_sweep = now
+            self._evict_where(lambda last_access: now - last_access >= self.idle_ttl)
+        if len(self.states) > self.max_size:
+            self._evict_where(lambda _: len(self.states) > self.max_size)
+
+    def _evict_where(self, should_evict) -> None:
+        # _last_access terurut dari yang paling lama tidak dipakai.
+        for user_id, last_access in list(self._last_access.items()):
+            if not should_evict(last_access):
+                break
+            if self.is_pinned(user_id):
+                continue
+            self.evict(user_id)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+
+SESSION_CACHE = SessionCache()
+
+# Storage in-memory (dibatasi oleh SESSION_CACHE)
+USER_STATES: Dict[int, "GameState"] = SESSION_CACHE.states
+USER_LOCKS: Dict[int, asyncio.Lock] = SESSION_CACHE.locks
+
+
+def get_game_state(user_id: int) -> "GameState":
+    return SESSION_CACHE.get_state(user_id)
 
 
 def get_user_lock(user_id: int) -> asyncio.Lock:
-    lock = USER_LOCKS.get(user_id)
-    if not lock:
-        lock = asyncio.Lock()
-        USER_LOCKS[user_id] = lock
-    return lock
+    return SESSION_CACHE.get_lock(user_id)
 
 
 EQUIP_BONUS_MAP = {
@@ -1906,27 +3893,108 @@ EQUIP_BONUS_MAP = {
     "spd_bonus": "spd",
     "luck_bonus": "luck",
 }
+EQUIP_BONUS_ATTRS = tuple(EQUIP_BONUS_MAP.values())
+ZERO_BONUS_VECTOR = (0,) * len(EQUIP_BONUS_ATTRS)
+
+
+@dataclass(frozen=True)
+class CompiledItem:
+    """Ringkasan effects equipment: vektor bonus (urutan EQUIP_BONUS_ATTRS), passive, elemen."""
+
+    bonuses: Tuple[int, ...]
+    passives: Dict[str, Any]
+    element: str
+
+
+def merge_passive_effects(dest: Dict[str, Any], passives: Dict[str, Any]) -> Dict[str, Any]:
+    for key, value in passives.items():
+        if isinstance(value, dict):
+            # element_boost, bonus_vs_element, dst: dijumlah per elemen
+            sub = dest.setdefault(key, {})
+            for elem, bonus in value.items():
+                sub[elem] = sub.get(elem, 0.0) + bonus
+        else:
+            dest[key] = dest.get(key, 0) + value
+    return dest
+
+
+def compile_item(item: Dict[str, Any]) -> CompiledItem:
+    effects = item.get("effects", {})
+    return CompiledItem(
+        bonuses=tuple(effects.get(effect_key, 0) for effect_key in EQUIP_BONUS_MAP),
+        passives=merge_passive_effects({}, effects.get("passives", {})),
+        element=effects.get("element", "NETRAL"),
+    )
+
+
+def compile_items(items: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, CompiledItem]:
+    items = ITEMS if items is None else items
+    return {item_id: compile_item(item) for item_id, item in items.items()}
+
+
+COMPILED_ITEMS: Dict[str, CompiledItem] = compile_items()
+# Passive gabungan per pasangan (weapon_id, armor_id); isinya hanya untuk dibaca.
+PASSIVE_PAIR_CACHE: Dict[Tuple[Optional[str], Optional[str]], Dict[str, Any]] = {}
+
+
+def rebuild_compiled_items(items: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """Kompilasi ulang ITEMS (mis. setelah reload konten) dan buang cache turunannya."""
+
+    global COMPILED_ITEMS, PASSIVE_PAIR_CACHE
+    COMPILED_ITEMS = compile_items(items)
+    # Dict baru, bukan clear(): cache lama bisa masih dipakai snapshot battle yang sedang berjalan.
+    PASSIVE_PAIR_CACHE = {}
+    invalidate_effective_stat_caches()
+
+
+def pinned_battle_content(character: CharacterState) -> Optional["ContentSnapshot"]:
+    """Snapshot konten battle aktif milik pemilik karakter; None di luar battle (pakai konten terbaru)."""
+
+    owner = character._owner
+    if owner is None or not owner.in_battle:
+        return None
+    return owner.battle_state.content
+
+
+def character_compiled_items(character: CharacterState) -> Dict[str, CompiledItem]:
+    content = pinned_battle_content(character)
+    return content.compiled_items if content is not None else COMPILED_ITEMS
+
+
+def get_equipment_bonus_vector(
+    character: CharacterState, compiled_items: Optional[Dict[str, CompiledItem]] = None
+) -> Tuple[int, ...]:
+    if compiled_items is None:
+        compiled_items = character_compiled_items(character)
+    weapon = compiled_items.get(character.weapon_id) if character.weapon_id else None
+    armor = compiled_items.get(character.armor_id) if character.armor_id else None
+    if weapon and armor:
+        return tuple(w + a for w, a in zip(weapon.bonuses, armor.bonuses))
+    if weapon:
+        return weapon.bonuses
+    if armor:
+        return armor.bonuses
+    return ZERO_BONUS_VECTOR
 
 
 def get_equipment_stat_bonuses(character: CharacterState) -> Dict[str, int]:
-    bonuses: Dict[str, int] = {attr: 0 for attr in EQUIP_BONUS_MAP.values()}
-    for slot in [character.weapon_id, character.armor_id]:
-        if not slot:
-            continue
-        item = ITEMS.get(slot)
-        if not item:
-            continue
-        effects = item.get("effects", {})
-        for effect_key, attr in EQUIP_BONUS_MAP.items():
-            bonus = effects.get(effect_key, 0)
-            if bonus:
-                bonuses[attr] = bonuses.get(attr, 0) + bonus
-    return bonuses
+    return dict(zip(EQUIP_BONUS_ATTRS, get_equipment_bonus_vector(character)))
+
+
+# Naikkan lewat invalidate_effective_stat_caches() bila data ITEMS berubah.
+EQUIPMENT_STATS_GENERATION = 0
+
+
+def invalidate_effective_stat_caches() -> None:
+    global EQUIPMENT_STATS_GENERATION
+    EQUIPMENT_STATS_GENERATION += 1
 
 
 def get_effective_stat(character: CharacterState, attr: str) -> int:
-    bonuses = get_equipment_stat_bonuses(character)
-    return getattr(character, attr, 0) + bonuses.get(attr, 0)
+    value = character.effective_stats().get(attr)
+    if value is None:
+        return getattr(character, attr, 0)
+    return value
 
 
 def get_effective_max_hp(character: CharacterState) -> int:
@@ -1938,11 +4006,7 @@ def get_effective_max_mp(character: CharacterState) -> int:
 
 
 def get_effective_combat_stats(character: CharacterState) -> Dict[str, int]:
-    bonuses = get_equipment_stat_bonuses(character)
-    stats: Dict[str, int] = {}
-    for attr in ["atk", "defense", "mag", "spd", "luck", "max_hp", "max_mp"]:
-        stats[attr] = getattr(character, attr, 0) + bonuses.get(attr, 0)
-    return stats
+    return dict(character.effective_stats())
 
 
 def clamp_resource_to_effective_cap(character: CharacterState):
@@ -1973,9 +4037,12 @@ def adjust_inventory(state: GameState, item_id: str, delta: int) -> int:
     return new_value
 
 
-def generate_loot_for_area(area_id: str) -> List[Tuple[str, int]]:
+def generate_loot_for_area(
+    area_id: str, drop_tables: Optional[Dict[str, List[Dict[str, Any]]]] = None
+) -> List[Tuple[str, int]]:
+    drop_tables = DROP_TABLES if drop_tables is None else drop_tables
     loot: List[Tuple[str, int]] = []
-    for entry in DROP_TABLES.get(area_id, []):
+    for entry in drop_tables.get(area_id, []):
         chance = entry.get("chance", 0)
         if random.random() > chance:
             continue
@@ -1985,14 +4052,15 @@ def generate_loot_for_area(area_id: str) -> List[Tuple[str, int]]:
 
 
 def grant_battle_drops(state: GameState) -> Tuple[List[str], List[Tuple[str, int]]]:
-    area = state.flags.get("CURRENT_BATTLE_AREA")
+    area = state.scratch.current_battle_area
     if not area:
         return [], []
+    content = battle_content(state)
     drops: List[str] = []
     details: List[Tuple[str, int]] = []
-    for item_id, qty in generate_loot_for_area(area):
+    for item_id, qty in generate_loot_for_area(area, content.drop_tables):
         adjust_inventory(state, item_id, qty)
-        item = ITEMS.get(item_id)
+        item = content.items.get(item_id)
         name = item["name"] if item else item_id
         drops.append(f"{name} x{qty}")
         details.append((item_id, qty))
@@ -2056,29 +4124,28 @@ def get_equipped_owners(state: GameState, item_id: str) -> List[str]:
 
 
 def get_character_passive_effects(character: CharacterState) -> Dict[str, Any]:
-    result: Dict[str, Any] = {}
-    for slot in [character.weapon_id, character.armor_id]:
-        if not slot:
-            continue
-        item = ITEMS.get(slot)
-        if not item:
-            continue
-        passives = item.get("effects", {}).get("passives", {})
-        for key, value in passives.items():
-            if key == "element_boost" and isinstance(value, dict):
-                dest = result.setdefault("element_boost", {})
-                for elem, bonus in value.items():
-                    dest[elem] = dest.get(elem, 0.0) + bonus
-            else:
-                result[key] = result.get(key, 0) + value
+    content = pinned_battle_content(character)
+    if content is not None:
+        compiled_items, cache = content.compiled_items, content.passive_pairs
+    else:
+        compiled_items, cache = COMPILED_ITEMS, PASSIVE_PAIR_CACHE
+    key = (character.weapon_id, character.armor_id)
+    result = cache.get(key)
+    if result is None:
+        result = {}
+        for slot in key:
+            compiled = compiled_items.get(slot) if slot else None
+            if compiled:
+                merge_passive_effects(result, compiled.passives)
+        cache[key] = result
     return result
 
 
 def get_character_weapon_element(character: CharacterState) -> str:
-    weapon = ITEMS.get(character.weapon_id) if character.weapon_id else None
-    if not weapon:
+    compiled = character_compiled_items(character).get(character.weapon_id) if character.weapon_id else None
+    if not compiled:
         return "NETRAL"
-    return weapon.get("effects", {}).get("element", "NETRAL")
+    return compiled.element
 
 
 def list_equippable_items(state: GameState, char_id: str, slot_type: str) -> List[Tuple[str, Dict[str, Any], int]]:
@@ -2112,6 +4179,7 @@ def grant_skill_to_character(character: CharacterState, skill_id: str, logs: Opt
     if skill_id in character.skills:
         return
     character.skills.append(skill_id)
+    character.mark_dirty()
     if logs is not None:
         logs.append(f"{character.name} mempelajari skill baru: {SKILLS[skill_id]['name']}!")
 
@@ -2183,11 +4251,11 @@ def handle_after_battle_xp_and_level_up(state: GameState, total_xp: int, total_g
 
 def manual_targeting_enabled(state: GameState) -> bool:
     """Placeholder to toggle manual target selection in the future."""
-    return bool(state.flags.get("MANUAL_TARGETING"))
+    return state.scratch.manual_targeting
 
 
 def clear_manual_target_request(state: GameState):
-    state.flags.pop("PENDING_TARGET", None)
+    state.scratch.pending_target = None
 
 
 def make_char_buff_key(char_id: str) -> str:
@@ -2234,7 +4302,7 @@ def apply_temporary_modifier(
     if target is None:
         return
     adjust_stat_value(target, stat, amount)
-    buffs = state.flags.setdefault("ACTIVE_BUFFS", {})
+    buffs = state.scratch.active_buffs
     buffs.setdefault(target_key, []).append(
         {
             "stat": stat,
@@ -2246,7 +4314,7 @@ def apply_temporary_modifier(
 
 def cleanse_character(state: GameState, char_id: str) -> int:
     key = make_char_buff_key(char_id)
-    buffs = state.flags.get("ACTIVE_BUFFS", {}).get(key, [])
+    buffs = state.scratch.active_buffs.get(key, [])
     if not buffs:
         return 0
     target = state.party.get(char_id)
@@ -2258,7 +4326,7 @@ def cleanse_character(state: GameState, char_id: str) -> int:
             removed += 1
         else:
             kept.append(buff)
-    active = state.flags.get("ACTIVE_BUFFS", {})
+    active = state.scratch.active_buffs
     if kept:
         active[key] = kept
     else:
@@ -2267,7 +4335,8 @@ def cleanse_character(state: GameState, char_id: str) -> int:
 
 
 def clear_active_buffs(state: GameState):
-    active = state.flags.pop("ACTIVE_BUFFS", None)
+    active = state.scratch.active_buffs
+    state.scratch.active_buffs = {}
     if not active:
         return
     for key, buffs in active.items():
@@ -2280,20 +4349,19 @@ def clear_active_buffs(state: GameState):
 
 def reset_battle_flags(state: GameState):
     clear_active_buffs(state)
-    for key in [
-        "LIGHT_BUFF_TURNS",
-        "ARUNA_LIMIT_USED",
-        "CURRENT_BATTLE_AREA",
-    ]:
-        state.flags.pop(key, None)
-    state.flags.pop("DEFENDING", None)
-    state.flags.pop("MANA_SHIELD", None)
+    scratch = state.scratch
+    scratch.light_buff_turns = 0
+    scratch.aruna_limit_used = False
+    scratch.current_battle_area = None
+    scratch.defending = {}
+    scratch.mana_shield = {}
     state.battle_state = BattleTurnState()
 
 
 def tick_buffs(state: GameState) -> List[str]:
     logs: List[str] = []
-    active = state.flags.get("ACTIVE_BUFFS")
+    scratch = state.scratch
+    active = scratch.active_buffs
     if active:
         to_remove = []
         for key, buffs in active.items():
@@ -2315,9 +4383,7 @@ def tick_buffs(state: GameState) -> List[str]:
                 to_remove.append(key)
         for key in to_remove:
             active.pop(key, None)
-        if not active:
-            state.flags.pop("ACTIVE_BUFFS", None)
-    shields = state.flags.get("MANA_SHIELD")
+    shields = scratch.mana_shield
     if shields:
         expired: List[str] = []
         for cid in list(shields.keys()):
@@ -2329,12 +4395,10 @@ def tick_buffs(state: GameState) -> List[str]:
             target = state.party.get(cid)
             if target:
                 logs.append(f"Mana Shield di sekitar {target.name} menghilang.")
-        if not shields:
-            state.flags.pop("MANA_SHIELD", None)
-    if state.flags.get("LIGHT_BUFF_TURNS"):
-        state.flags["LIGHT_BUFF_TURNS"] -= 1
-        if state.flags["LIGHT_BUFF_TURNS"] <= 0:
-            state.flags.pop("LIGHT_BUFF_TURNS", None)
+    if scratch.light_buff_turns:
+        scratch.light_buff_turns -= 1
+        if scratch.light_buff_turns <= 0:
+            scratch.light_buff_turns = 0
             logs.append("Aura sigil keabadian mereda.")
     return logs
 
@@ -2514,7 +4578,7 @@ def initialize_battle_turn_state(state: GameState):
         ", ".join(f"{token}:{spd}" for token, spd, *_ in entries) or "(kosong)",
     )
     state.battle_state = BattleTurnState(
-        turn_order=order, current_turn_index=-1, enemies=state.battle_enemies
+        turn_order=order, current_turn_index=-1, enemies=state.battle_enemies, content=CONTENT.current
     )
     advance_to_next_actor(state)
 
@@ -2535,10 +4599,7 @@ def advance_to_next_actor(state: GameState) -> Optional[str]:
             if character and character.hp > 0:
                 state.battle_state.active_token = token
                 state.battle_state.awaiting_player_input = True
-                defending = state.flags.get("DEFENDING", {})
-                defending.pop(cid, None)
-                if not defending:
-                    state.flags.pop("DEFENDING", None)
+                state.scratch.defending.pop(cid, None)
                 return token
         elif token.startswith("ENEMY:"):
             try:
@@ -2572,7 +4633,7 @@ async def resolve_battle_outcome(
         total_gold = sum(enemy.get("gold", 0) for enemy in state.battle_enemies)
         state.in_battle = False
         state.battle_enemies = []
-        state.flags["LAST_BATTLE_RESULT"] = "WIN"
+        state.scratch.last_battle_result = "WIN"
         reward_logs = handle_after_battle_xp_and_level_up(state, total_xp, total_gold)
         drop_logs, _ = grant_battle_drops(state)
         drop_section = ["Drop:"]
@@ -2618,16 +4679,10 @@ async def resolve_battle_outcome(
         "Kamu tumbang dalam pertarungan ini...",
     ]
     reset_auto_hunt_state(state)
-    for cid in state.party_order:
-        member = state.party.get(cid)
-        if not member:
-            continue
-        member.hp = max(1, get_effective_max_hp(member) // 3)
-    state.in_battle = False
-    state.battle_enemies = []
+    recover_party_after_defeat(state)
     log.append("Seluruh party tumbang! Kamu terlempar keluar dari pertarungan.")
     log = summary_lines + [""] + log
-    state.flags["LAST_BATTLE_RESULT"] = "LOSE"
+    state.scratch.last_battle_result = "LOSE"
     logger.info(
         "User %s menyelesaikan battle vs %s dengan hasil LOSE",
         state.user_id,
@@ -2637,6 +4692,18 @@ async def resolve_battle_outcome(
     return True
 
 
+def recover_party_after_defeat(state: GameState) -> None:
+    """Pulihkan party ke sepertiga HP dan keluarkan dari battle setelah kalah."""
+
+    for cid in state.party_order:
+        member = state.party.get(cid)
+        if not member:
+            continue
+        member.hp = max(1, get_effective_max_hp(member) // 3)
+    state.in_battle = False
+    state.battle_enemies = []
+
+
 def enemy_take_turn(state: GameState, enemy_index: int) -> List[str]:
     log: List[str] = []
     enemies = state.battle_state.enemies or state.battle_enemies
@@ -2653,12 +4720,10 @@ def enemy_take_turn(state: GameState, enemy_index: int) -> List[str]:
         return log
     target_def = get_effective_stat(target, "defense")
     dmg = calc_enemy_basic_damage(enemy["atk"], target_def)
-    defending = state.flags.get("DEFENDING", {})
+    defending = state.scratch.defending
     if defending.get(target_id):
         dmg = max(1, dmg // 2)
         defending.pop(target_id, None)
-        if not defending:
-            state.flags.pop("DEFENDING", None)
     dmg = apply_mana_shield_absorption(state, target_id, dmg, log)
     if dmg <= 0:
         return log
@@ -2700,7 +4765,7 @@ async def conclude_player_turn(
 def describe_skill_short(
     character: CharacterState, skill_id: str, state: GameState
 ) -> str:
-    skill = SKILLS.get(skill_id, {})
+    skill = battle_content(state).skills.get(skill_id, {})
     base = f"{skill.get('name', skill_id)} (MP {skill.get('mp_cost', 0)})"
     skill_type = skill.get("type")
     parts: List[str] = []
@@ -2804,10 +4869,11 @@ async def send_battle_item_menu(
         token = state.battle_state.active_token
         if token and token.startswith("CHAR:"):
             char_id = token.split(":", 1)[1]
+    items = battle_content(state).items
     consumables = [
         (item_id, qty)
         for item_id, qty in state.inventory.items()
-        if qty > 0 and ITEMS.get(item_id, {}).get("type") == "consumable"
+        if qty > 0 and items.get(item_id, {}).get("type") == "consumable"
     ]
     if not consumables:
         await send_battle_state(
@@ -2821,7 +4887,7 @@ async def send_battle_item_menu(
     buttons = []
     lines = ["Pilih item yang akan dipakai:"]
     for item_id, qty in consumables:
-        item = ITEMS[item_id]
+        item = items[item_id]
         lines.append(f"- {item['name']} x{qty}")
         buttons.append(
             [
@@ -2849,7 +4915,7 @@ async def send_battle_item_menu(
 def apply_item_effects_in_battle(
     state: GameState, user_char_id: str, item_id: str
 ) -> Tuple[bool, List[str]]:
-    item = ITEMS.get(item_id)
+    item = battle_content(state).items.get(item_id)
     if not item:
         return False, ["Item tidak dikenal."]
     effects = item.get("effects", {})
@@ -2899,7 +4965,7 @@ async def process_use_item(
     if not character:
         await send_battle_state(update, context, state)
         return
-    item = ITEMS.get(item_id)
+    item = battle_content(state).items.get(item_id)
     if not item or item.get("type") != "consumable":
         await send_battle_state(
             update, context, state, intro=False, extra_text="Item itu tidak bisa dipakai sekarang."
@@ -2969,7 +5035,7 @@ async def start_fixed_battle(
     state.return_scene_after_battle = None
     state.loss_scene_after_battle = None
     reset_battle_flags(state)
-    state.flags["CURRENT_BATTLE_AREA"] = enemy.get("area")
+    state.scratch.current_battle_area = enemy.get("area")
     initialize_battle_turn_state(state)
     await send_battle_state(update, context, state, intro=True)
 
@@ -2992,7 +5058,7 @@ async def start_story_battle(
     state.return_scene_after_battle = return_scene
     state.loss_scene_after_battle = loss_scene
     reset_battle_flags(state)
-    state.flags["CURRENT_BATTLE_AREA"] = enemy.get("area")
+    state.scratch.current_battle_area = enemy.get("area")
     initialize_battle_turn_state(state)
     await send_battle_state(update, context, state, intro=True)
 
@@ -3024,24 +5090,105 @@ PLAYER_DAMAGE_VARIANCE = (0.9, 1.1)
 ENEMY_DAMAGE_VARIANCE = (0.88, 1.12)
 ENEMY_ATTACK_SCALE = 0.92  # Skala ATK musuh relatif ke pemain setara level.
 ENEMY_DEF_RATIO = 0.45
+DAMAGE_BATCH_NUMPY_MIN = 64  # batch sekecil ini lebih cepat dihitung tanpa NumPy
+
+@dataclass
+class EncounterPool:
+    entries: List[Tuple[str, Dict[str, Any]]]
+    cum_weights: List[float]
+
+    @classmethod
+    def build(cls, entries: List[Tuple[str, Dict[str, Any]]]) -> "EncounterPool":
+        cum_weights: List[float] = []
+        total = 0.0
+        for _, monster in entries:
+            total += monster.get("encounter_weight", 1.0)
+            cum_weights.append(total)
+        return cls(entries, cum_weights)
+
+    def sample(self, rng: Any = random) -> Tuple[str, Dict[str, Any]]:
+        # Sama persis dengan random.choices(..., weights=..., k=1): satu kali rng.random().
+        total = self.cum_weights[-1]
+        index = bisect.bisect(self.cum_weights, rng.random() * total, 0, len(self.entries) - 1)
+        return self.entries[index]
 
-def pick_random_monster_for_area(area: str, party_level: Optional[int] = None) -> Dict[str, Any]:
-    pool = [(key, m) for key, m in MONSTERS.items() if m["area"] == area]
+
+@dataclass
+class AreaEncounterTable:
+    """Pool monster satu area yang sudah dipisah common/rare beserta bobot kumulatifnya."""
+
+    area: str
+    base_pool: EncounterPool
+    rare_pool: Optional[EncounterPool]
+    min_rare_level: int
+    rare_chance: float
+
+    def pick_entry(self, party_level: Optional[int] = None, rng: Any = random) -> Tuple[str, Dict[str, Any]]:
+        pool = self.base_pool
+        if self.rare_pool is not None and (
+            party_level is None or party_level + RARE_LEVEL_BUFFER >= self.min_rare_level
+        ):
+            if rng.random() < self.rare_chance:
+                pool = self.rare_pool
+        return pool.sample(rng)
+
+    def pick(self, party_level: Optional[int] = None, rng: Any = random) -> Dict[str, Any]:
+        base_key, base = self.pick_entry(party_level, rng)
+        return instantiate_monster(base_key, base, self.area)
+
+    def sample_many(
+        self, count: int, party_level: Optional[int] = None, rng: Any = random
+    ) -> List[Dict[str, Any]]:
+        """Ambil beberapa encounter sekaligus (urutan RNG sama dengan memanggil pick berulang)."""
+
+        return [self.pick(party_level, rng) for _ in range(count)]
+
+
+def build_area_encounter_table(area: str, monsters: Optional[Dict[str, Dict[str, Any]]] = None) -> AreaEncounterTable:
+    monsters = MONSTERS if monsters is None else monsters
+    pool = [(key, m) for key, m in monsters.items() if m["area"] == area]
     if not pool:
-        pool = [("SHADOW_SLIME", MONSTERS["SHADOW_SLIME"])]  # fallback
+        pool = [("SHADOW_SLIME", monsters["SHADOW_SLIME"])]  # fallback
     rare_pool = [(key, m) for key, m in pool if m.get("rarity") == "RARE"]
     common_pool = [(key, m) for key, m in pool if m.get("rarity") != "RARE"]
-    selected_pool = common_pool or pool
-    rare_ready = False
-    if rare_pool:
-        min_rare_level = min(m.get("level", 1) for _, m in rare_pool)
-        rare_ready = party_level is None or party_level + RARE_LEVEL_BUFFER >= min_rare_level
-    if rare_pool and rare_ready:
-        rare_chance = RARE_ENCOUNTER_CHANCE.get(area, 0.03)
-        if random.random() < rare_chance:
-            selected_pool = rare_pool
-    weights = [m.get("encounter_weight", 1.0) for _, m in selected_pool]
-    base_key, base = random.choices(selected_pool, weights=weights, k=1)[0]
+    return AreaEncounterTable(
+        area=area,
+        base_pool=EncounterPool.build(common_pool or pool),
+        rare_pool=EncounterPool.build(rare_pool) if rare_pool else None,
+        min_rare_level=min((m.get("level", 1) for _, m in rare_pool), default=0),
+        rare_chance=RARE_ENCOUNTER_CHANCE.get(area, 0.03),
+    )
+
+
+def build_encounter_tables(
+    monsters: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Dict[str, AreaEncounterTable]:
+    monsters = MONSTERS if monsters is None else monsters
+    areas = {m["area"] for m in monsters.values()}
+    return {area: build_area_encounter_table(area, monsters) for area in areas}
+
+
+ENCOUNTER_TABLES: Dict[str, AreaEncounterTable] = build_encounter_tables()
+
+
+def rebuild_encounter_tables(monsters: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """Bangun ulang tabel encounter, misalnya setelah data monster dimuat ulang."""
+
+    global ENCOUNTER_TABLES
+    ENCOUNTER_TABLES = build_encounter_tables(monsters)
+
+
+def get_encounter_table(area: str, content: Optional["ContentSnapshot"] = None) -> AreaEncounterTable:
+    tables = ENCOUNTER_TABLES if content is None else content.encounter_tables
+    table = tables.get(area)
+    if table is None:
+        # Area tanpa monster memakai pool fallback; cache supaya tidak dibangun ulang.
+        table = build_area_encounter_table(area, None if content is None else content.monsters)
+        tables[area] = table
+    return table
+
+
+def instantiate_monster(base_key: str, base: Dict[str, Any], area: str) -> Dict[str, Any]:
     # copy agar tidak mengubah base
     return {
         "name": base["name"],
@@ -3066,6 +5213,12 @@ def pick_random_monster_for_area(area: str, party_level: Optional[int] = None) -
     }
 
 
+def pick_random_monster_for_area(
+    area: str, party_level: Optional[int] = None, content: Optional["ContentSnapshot"] = None
+) -> Dict[str, Any]:
+    return get_encounter_table(area, content).pick(party_level)
+
+
 def average_party_speed(state: GameState) -> float:
     speeds: List[int] = []
     for cid in state.party_order:
@@ -3233,6 +5386,144 @@ def calc_magic_damage(
     return max(1, base), hit_weakness, hit_resist
 
 
+@dataclass
+class DamageBatchResult:
+    """Hasil calc_damage_batch; indeks ke-i sesuai entri ke-i pada input."""
+
+    damages: List[int]
+    weakness: List[bool]
+    resist: List[bool]
+
+    @property
+    def total(self) -> int:
+        return sum(self.damages)
+
+    @property
+    def any_weakness(self) -> bool:
+        return any(self.weakness)
+
+    @property
+    def any_resist(self) -> bool:
+        return any(self.resist)
+
+
+def _broadcast(value: Any, count: int) -> List[Any]:
+    if isinstance(value, (list, tuple)):
+        if len(value) != count:
+            raise ValueError(f"Panjang batch tidak cocok: {len(value)} != {count}")
+        return list(value)
+    return [value] * count
+
+
+def calc_damage_batch(
+    attackers: Sequence[CharacterState],
+    targets: Sequence[Dict[str, Any]],
+    powers: Any = 1.0,
+    damage_type: Any = "PHYS",
+    element: Any = "NETRAL",
+    amplify: Any = 1.0,
+    rng: Any = random,
+) -> DamageBatchResult:
+    """Hitung banyak hit sekaligus (multi-hit, AoE, simulasi).
+
+    Hasilnya identik dengan memanggil calc_physical_damage/calc_magic_damage
+    berurutan dengan seed yang sama: satu rng.uniform per hit, urutan sama.
+    Passive, stat efektif dan multiplier elemen dihitung sekali per pasangan
+    attacker/target/elemen, bukan per hit. ``amplify`` dipakai untuk pengali
+    sesudah damage (mis. LIGHT_BUFF_TURNS) persis seperti int(dmg * amp).
+    """
+
+    count = len(attackers)
+    if len(targets) != count:
+        raise ValueError(f"Panjang batch tidak cocok: {len(targets)} != {count}")
+    if not count:
+        return DamageBatchResult([], [], [])
+    powers = _broadcast(powers, count)
+    damage_types = _broadcast(damage_type, count)
+    elements = _broadcast(element, count)
+    amplifiers = _broadcast(amplify, count)
+
+    profiles: Dict[Tuple[int, int, str, str], Tuple[float, float, float, bool, bool]] = {}
+    raw_bases: List[float] = []
+    multipliers: List[float] = []
+    passive_bonuses: List[float] = []
+    weakness: List[bool] = []
+    resist: List[bool] = []
+    for attacker, target, kind, used_element in zip(attackers, targets, damage_types, elements):
+        key = (id(attacker), id(target), kind, used_element)
+        profile = profiles.get(key)
+        if profile is None:
+            if kind == "MAG":
+                base = get_effective_stat(attacker, "mag") - target["defense"] * MAGICAL_DEF_RATIO
+            else:
+                base = get_effective_stat(attacker, "atk") - target["defense"] * PHYSICAL_DEF_RATIO
+            passives = get_character_passive_effects(attacker)
+            element_multiplier, h_weak, h_res = compute_elemental_multiplier(
+                used_element,
+                target.get("weakness"),
+                target.get("resist"),
+                passives,
+                target_element=target.get("element"),
+            )
+            passive_bonus = compute_passive_damage_bonus(passives, target.get("element"), used_element)
+            profile = (max(base, 1), element_multiplier, passive_bonus, h_weak, h_res)
+            profiles[key] = profile
+        raw_bases.append(profile[0])
+        multipliers.append(profile[1])
+        passive_bonuses.append(profile[2])
+        weakness.append(profile[3])
+        resist.append(profile[4])
+
+    low, high = PLAYER_DAMAGE_VARIANCE
+    variances = [rng.uniform(low, high) for _ in range(count)]
+
+    if np is not None and count >= DAMAGE_BATCH_NUMPY_MIN:
+        # float64 NumPy memakai aritmetika IEEE yang sama dengan float Python,
+        # dan trunc == int() untuk nilai positif, jadi hasilnya bit-identik.
+        dmg = np.trunc(np.asarray(raw_bases) * np.asarray(powers, dtype=float))
+        dmg = np.trunc(dmg * np.asarray(variances))
+        dmg = np.trunc(dmg * np.asarray(multipliers) * np.asarray(passive_bonuses))
+        dmg = np.maximum(dmg, 1)
+        amp = np.asarray(amplifiers, dtype=float)
+        dmg = np.where(amp != 1.0, np.trunc(dmg * amp), dmg)
+        damages = [int(value) for value in dmg.tolist()]
+    else:
+        damages = []
+        for base, power, variance, multiplier, bonus, amp in zip(
+            raw_bases, powers, variances, multipliers, passive_bonuses, amplifiers
+        ):
+            value = int(base * power)
+            value = int(value * variance)
+            value = max(1, int(value * multiplier * bonus))
+            if amp != 1.0:
+                value = int(value * amp)
+            damages.append(value)
+    return DamageBatchResult(damages, weakness, resist)
+
+
+def calc_skill_hits(
+    state: GameState,
+    character: CharacterState,
+    skill: Dict[str, Any],
+    enemy: Dict[str, Any],
+    rng: Any = random,
+) -> DamageBatchResult:
+    """Semua hit skill PHYS/MAG ke satu musuh dalam satu batch."""
+
+    hits = max(1, int(skill.get("hits", 1)))
+    element = skill.get("element", "NETRAL")
+    amplify = 1.2 if element == "CAHAYA" and state.scratch.light_buff_turns else 1.0
+    return calc_damage_batch(
+        [character] * hits,
+        [enemy] * hits,
+        skill.get("power", 1.0),
+        "MAG" if skill.get("type") == "MAG" else "PHYS",
+        element,
+        amplify,
+        rng,
+    )
+
+
 def calc_enemy_basic_damage(enemy_atk: int, target_def: int) -> int:
     """Damage fisik standar musuh → pemain berdasarkan konstanta balancing."""
     base = (enemy_atk * ENEMY_ATTACK_SCALE) - (target_def * ENEMY_DEF_RATIO)
@@ -3299,7 +5590,7 @@ def apply_mana_shield_absorption(
 ) -> int:
     if damage <= 0:
         return 0
-    shields = state.flags.get("MANA_SHIELD")
+    shields = state.scratch.mana_shield
     if not shields or target_id not in shields:
         return damage
     target = state.party.get(target_id)
@@ -3338,7 +5629,7 @@ async def start_random_battle_in_area(
     area_info = HUNTING_AREAS.get(area_id, {"area_key": area_id, "name": area_id})
     battle_area = area_info.get("area_key", area_id)
     avg_level = average_party_level(state)
-    enemy = pick_random_monster_for_area(battle_area, avg_level)
+    enemy = pick_random_monster_for_area(battle_area, avg_level, CONTENT.current)
     logger.info(
         "User %s memulai random battle di %s (%s) melawan %s",
         state.user_id,
@@ -3352,9 +5643,9 @@ async def start_random_battle_in_area(
     state.return_scene_after_battle = None
     state.loss_scene_after_battle = None
     reset_battle_flags(state)
-    state.flags["CURRENT_BATTLE_AREA"] = battle_area
-    state.flags["LAST_BATTLE_SOURCE"] = {"type": source, "area": area_id}
-    state.flags["LAST_HUNT_AREA"] = area_id
+    state.scratch.current_battle_area = battle_area
+    state.scratch.last_battle_source = {"type": source, "area": area_id}
+    state.last_hunt_area = area_id
     initialize_battle_turn_state(state)
     intro_lines = []
     rank = enemy.get("rank")
@@ -3510,7 +5801,7 @@ async def execute_skill_action(
     target_ally_id: Optional[str] = None,
 ) -> bool:
     character = state.party.get(user)
-    skill = SKILLS.get(skill_id)
+    skill = battle_content(state).skills.get(skill_id)
     if not character or not skill:
         await send_battle_state(update, context, state)
         return False
@@ -3545,40 +5836,17 @@ async def execute_skill_action(
         hits = max(1, int(skill.get("hits", 1)))
         total_dmg = 0
         per_hit_logs: List[str] = []
-        hit_weakness = False
-        hit_resist = False
         header = f"{character.name} melancarkan {skill['name']}!"
         if element != "NETRAL":
             header += f" ({element})"
         log.append(header)
-        for hit in range(hits):
-            if skill_type == "PHYS":
-                dmg, h_weak, h_res = calc_physical_damage(
-                    character,
-                    enemy["defense"],
-                    skill.get("power", 1.0),
-                    element,
-                    enemy.get("weakness"),
-                    enemy.get("resist"),
-                    enemy.get("element"),
-                )
-            else:
-                dmg, h_weak, h_res = calc_magic_damage(
-                    character,
-                    enemy["defense"],
-                    skill.get("power", 1.0),
-                    element,
-                    enemy.get("weakness"),
-                    enemy.get("resist"),
-                    enemy.get("element"),
-                )
-            if element == "CAHAYA" and state.flags.get("LIGHT_BUFF_TURNS"):
-                dmg = int(dmg * 1.2)
+        batch = calc_skill_hits(state, character, skill, enemy)
+        for hit, dmg in enumerate(batch.damages):
             enemy["hp"] -= dmg
             total_dmg += dmg
-            hit_weakness = hit_weakness or h_weak
-            hit_resist = hit_resist or h_res
             per_hit_logs.append(f"Hantaman {hit + 1}: {dmg} damage.")
+        hit_weakness = batch.any_weakness
+        hit_resist = batch.any_resist
         if hits > 1:
             log.extend(per_hit_logs)
             log.append(f"Total damage kombo ke {enemy['name']}: {total_dmg}.")
@@ -3638,8 +5906,8 @@ async def execute_skill_action(
             f"{character.name} menyalurkan {skill['name']} pada {target.name}! Pertahanan meningkat selama {duration} giliran."
         )
     elif skill_type == "LIMIT_HEAL":
-        state.flags["ARUNA_LIMIT_USED"] = True
-        state.flags["LIGHT_BUFF_TURNS"] = 3
+        state.scratch.aruna_limit_used = True
+        state.scratch.light_buff_turns = 3
         total = []
         for cid in state.party_order:
             member = state.party.get(cid)
@@ -3710,8 +5978,7 @@ async def execute_skill_action(
         )
     elif skill_type == "BUFF_SPECIAL":
         duration = skill.get("duration", 3)
-        shields = state.flags.setdefault("MANA_SHIELD", {})
-        shields[user] = duration
+        state.scratch.mana_shield[user] = duration
         log.append(
             f"{character.name} menciptakan {skill['name']}! Damage akan menguras MP lebih dulu selama {duration} giliran."
         )
@@ -3801,8 +6068,7 @@ async def process_battle_action(
                 target_element=target.get("element"),
             )
             damage = apply_mana_shield_absorption(state, active_char_id, damage, log)
-            defending = state.flags.get("DEFENDING", {})
-            if defending.get(active_char_id):
+            if state.scratch.defending.get(active_char_id):
                 damage = max(1, damage // 2)
                 log.append(f"{character.name} menyerang sambil bertahan, damage berkurang.")
             target["hp"] -= damage
@@ -3823,8 +6089,7 @@ async def process_battle_action(
             return
 
     elif action_key == "BATTLE_DEFEND":
-        defend_flags = state.flags.setdefault("DEFENDING", {})
-        defend_flags[active_char_id] = True
+        state.scratch.defending[active_char_id] = True
         log.append(
             f"{character.name} mengambil posisi bertahan untuk mengurangi damage sementara."
         )
@@ -3844,7 +6109,7 @@ async def process_battle_action(
             log.append("Kamu berhasil kabur dari battle!")
             state.in_battle = False
             state.battle_enemies = []
-            state.flags["LAST_BATTLE_RESULT"] = "ESCAPE"
+            state.scratch.last_battle_result = "ESCAPE"
             await end_battle_and_return(update, context, state, log_text="\n".join(log))
             return
         log.append("Gagal kabur! Musuh bersiap menyerang!")
@@ -3872,12 +6137,12 @@ async def process_use_skill(
     if not character:
         await send_battle_state(update, context, state)
         return
-    skill = SKILLS.get(skill_id)
+    skill = battle_content(state).skills.get(skill_id)
     if not skill:
         await send_battle_state(update, context, state)
         return
 
-    if skill_id == "ARUNA_CORE_AWAKENING" and state.flags.get("ARUNA_LIMIT_USED"):
+    if skill_id == "ARUNA_CORE_AWAKENING" and state.scratch.aruna_limit_used:
         await send_battle_state(
             update,
             context,
@@ -4034,8 +6299,10 @@ async def end_battle_and_return(
     Setelah battle selesai, balik ke menu yang sesuai dengan lokasi (hutan/kota).
     Untuk sekarang: jika battle random, balik ke 'DUNGEON_MENU', kalau battle story, balik ke scene.
     """
-    last_result = state.flags.pop("LAST_BATTLE_RESULT", None)
-    battle_source = state.flags.pop("LAST_BATTLE_SOURCE", None)
+    last_result = state.scratch.last_battle_result
+    battle_source = state.scratch.last_battle_source
+    state.scratch.last_battle_result = None
+    state.scratch.last_battle_source = None
     source_area = battle_source.get("area") if isinstance(battle_source, dict) else None
     reset_battle_flags(state)
     autosave_note = flush_pending_autosave(state)
@@ -4098,6 +6365,291 @@ async def end_battle_and_return(
         await update.message.reply_text(text=text, reply_markup=keyboard)
 
 
+# ==========================
+# REGISTRY KONTEN (HOT RELOAD)
+# ==========================
+
+
+class ContentValidationError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__(f"{len(errors)} masalah di data konten")
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class ContentSnapshot:
+    """Satu versi lengkap konten game. Tidak pernah diubah setelah dipasang; reload = snapshot baru."""
+
+    version: int
+    scenes: SceneStore
+    items: Dict[str, Dict[str, Any]]
+    monsters: Dict[str, Dict[str, Any]]
+    skills: Dict[str, Dict[str, Any]]
+    drop_tables: Dict[str, List[Dict[str, Any]]]
+    hunting_areas: Dict[str, Dict[str, Any]]
+    guild_quests: Dict[str, Dict[str, Any]]
+    compiled_items: Dict[str, CompiledItem]
+    encounter_tables: Dict[str, AreaEncounterTable]
+    sources: Tuple[Tuple[str, Optional[int], Optional[int]], ...]
+    loaded_at: float = field(default_factory=time.time)
+    # Cache turunan (passive per pasangan weapon/armor, area encounter fallback) ikut snapshot-nya.
+    passive_pairs: Dict[Tuple[Optional[str], Optional[str]], Dict[str, Any]] = field(
+        default_factory=dict, compare=False
+    )
+
+
+# Tabel bawaan (literal di file ini) dipakai bila tidak ada override di CONTENT_TABLE_DIR.
+BUILTIN_CONTENT_TABLES: Dict[str, Any] = {name: globals()[name] for name in CONTENT_TABLE_NAMES}
+
+
+def content_table_path(name: str) -> str:
+    return os.path.join(CONTENT_TABLE_DIR, f"{name.lower()}.json")
+
+
+def content_source_paths() -> List[str]:
+    return list(SCENE_FILES) + [content_table_path(name) for name in CONTENT_TABLE_NAMES]
+
+
+def content_sources_signature() -> Tuple[Tuple[str, Optional[int], Optional[int]], ...]:
+    signature = []
+    for path in content_source_paths():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append((path, None, None))
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def load_content_tables() -> Dict[str, Any]:
+    tables: Dict[str, Any] = {}
+    errors: List[str] = []
+    for name in CONTENT_TABLE_NAMES:
+        path = content_table_path(name)
+        if not os.path.exists(path):
+            tables[name] = BUILTIN_CONTENT_TABLES[name]
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as exc:
+            errors.append(f"{path}: {exc}")
+            continue
+        if not isinstance(data, dict):
+            errors.append(f"{path}: harus berupa object JSON")
+            continue
+        tables[name] = data
+    if errors:
+        raise ContentValidationError(errors)
+    for monster in tables["MONSTERS"].values():
+        if isinstance(monster, dict):
+            monster.setdefault("rank", _infer_monster_rank(monster))
+    return tables
+
+
+MONSTER_REQUIRED_KEYS = ("name", "area", "hp", "mp", "atk", "defense", "mag", "spd", "luck", "xp", "gold")
+
+
+def validate_content(tables: Dict[str, Any], scenes: SceneStore) -> List[str]:
+    """Cek referensi antar tabel; snapshot dengan error tidak pernah dipasang."""
+
+    errors: List[str] = []
+    items, monsters, skills = tables["ITEMS"], tables["MONSTERS"], tables["SKILLS"]
+    for item_id, item in items.items():
+        if not isinstance(item, dict) or "name" not in item or "type" not in item:
+            errors.append(f"ITEMS.{item_id}: butuh 'name' dan 'type'")
+    for monster_id, monster in monsters.items():
+        missing = [key for key in MONSTER_REQUIRED_KEYS if not isinstance(monster, dict) or key not in monster]
+        if missing:
+            errors.append(f"MONSTERS.{monster_id}: field hilang {', '.join(missing)}")
+    for skill_id, skill in skills.items():
+        if not isinstance(skill, dict) or "type" not in skill:
+            errors.append(f"SKILLS.{skill_id}: butuh 'type'")
+    for char_id, unlocks in CHAR_SKILL_UNLOCKS.items():
+        for _, skill_id in unlocks:
+            if skill_id not in skills:
+                errors.append(f"CHAR_SKILL_UNLOCKS.{char_id}: skill {skill_id} tidak ada")
+    for area_id, entries in tables["DROP_TABLES"].items():
+        for entry in entries if isinstance(entries, list) else []:
+            if entry.get("item_id") not in items:
+                errors.append(f"DROP_TABLES.{area_id}: item {entry.get('item_id')} tidak ada")
+            if not 0 <= entry.get("chance", 0) <= 1:
+                errors.append(f"DROP_TABLES.{area_id}: chance {entry.get('chance')} di luar 0..1")
+    for area_id, area in tables["HUNTING_AREAS"].items():
+        if "area_key" not in area:
+            errors.append(f"HUNTING_AREAS.{area_id}: butuh 'area_key'")
+        for monster_id in area.get("monsters", []):
+            if monster_id not in monsters:
+                errors.append(f"HUNTING_AREAS.{area_id}: monster {monster_id} tidak ada")
+    for quest_id, quest in tables["GUILD_QUESTS"].items():
+        if quest.get("type") == "HUNT" and quest.get("target") not in monsters:
+            errors.append(f"GUILD_QUESTS.{quest_id}: target {quest.get('target')} tidak ada")
+        for item_id in quest.get("reward_items", {}):
+            if item_id not in items:
+                errors.append(f"GUILD_QUESTS.{quest_id}: reward {item_id} tidak ada")
+    if "SHADOW_SLIME" not in monsters:
+        errors.append("MONSTERS: SHADOW_SLIME wajib ada (fallback encounter)")
+    if not len(scenes):
+        errors.append("SCENES: tidak ada scene yang termuat")
+    elif GameState.scene_id not in scenes:
+        errors.append(f"SCENES: scene awal {GameState.scene_id} tidak ada")
+    else:
+        errors.extend(analyze_scene_graph(scenes).errors)
+    return errors
+
+
+def build_content_snapshot(version: int) -> ContentSnapshot:
+    """Baca, validasi, dan kompilasi semua konten. Aman dijalankan di thread lain: tidak menyentuh global."""
+
+    signature = content_sources_signature()
+    tables = load_content_tables()
+    scenes = build_scene_store(SCENE_FILES, SCENE_CACHE_PATH)
+    errors = validate_content(tables, scenes)
+    if errors:
+        raise ContentValidationError(errors)
+    return ContentSnapshot(
+        version=version,
+        scenes=scenes,
+        items=tables["ITEMS"],
+        monsters=tables["MONSTERS"],
+        skills=tables["SKILLS"],
+        drop_tables=tables["DROP_TABLES"],
+        hunting_areas=tables["HUNTING_AREAS"],
+        guild_quests=tables["GUILD_QUESTS"],
+        compiled_items=compile_items(tables["ITEMS"]),
+        encounter_tables=build_encounter_tables(tables["MONSTERS"]),
+        sources=signature,
+    )
+
+
+class ContentRegistry:
+    """Pemegang snapshot konten aktif. Pertukaran terjadi sinkron di event loop, jadi atomik per handler."""
+
+    def __init__(self):
+        self.current: Optional[ContentSnapshot] = None
+        self.last_error: Optional[ContentValidationError] = None
+        self.reloads = 0
+        self.failures = 0
+        self._reload_lock: Optional[asyncio.Lock] = None
+
+    def install(self, snapshot: ContentSnapshot) -> None:
+        global SCENES, ITEMS, MONSTERS, SKILLS, DROP_TABLES, HUNTING_AREAS, GUILD_QUESTS
+        global COMPILED_ITEMS, ENCOUNTER_TABLES, PASSIVE_PAIR_CACHE
+        SCENES = snapshot.scenes
+        ITEMS = snapshot.items
+        MONSTERS = snapshot.monsters
+        SKILLS = snapshot.skills
+        DROP_TABLES = snapshot.drop_tables
+        HUNTING_AREAS = snapshot.hunting_areas
+        GUILD_QUESTS = snapshot.guild_quests
+        # Global = snapshot terbaru; battle yang sedang berjalan membaca snapshot-nya sendiri.
+        COMPILED_ITEMS = snapshot.compiled_items
+        ENCOUNTER_TABLES = snapshot.encounter_tables
+        PASSIVE_PAIR_CACHE = snapshot.passive_pairs
+        invalidate_effective_stat_caches()
+        self.current = snapshot
+
+    async def reload(self, reason: str = "manual") -> ContentSnapshot:
+        """Bangun snapshot baru di thread lalu pasang. Snapshot lama tetap dipakai bila validasi gagal."""
+
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            version = (self.current.version if self.current else 0) + 1
+            try:
+                snapshot = await asyncio.to_thread(build_content_snapshot, version)
+            except ContentValidationError as exc:
+                self.failures += 1
+                self.last_error = exc
+                logger.error("Reload konten (%s) ditolak: %s", reason, "; ".join(exc.errors[:10]))
+                raise
+            self.install(snapshot)
+            self.reloads += 1
+            self.last_error = None
+            logger.info(
+                "Konten v%s dipasang (%s): %s scene, %s item, %s monster",
+                version,
+                reason,
+                len(snapshot.scenes),
+                len(snapshot.items),
+                len(snapshot.monsters),
+            )
+            return snapshot
+
+    def pinned_battles(self) -> Counter:
+        """Jumlah battle aktif per versi konten yang dipakainya."""
+
+        counts: Counter = Counter()
+        for state in SESSION_CACHE.states.values():
+            content = state.battle_state.content if state.battle_state else None
+            if state.in_battle and content is not None:
+                counts[content.version] += 1
+        return counts
+
+
+CONTENT = ContentRegistry()
+CONTENT.install(
+    ContentSnapshot(
+        version=1,
+        scenes=SCENES,
+        items=ITEMS,
+        monsters=MONSTERS,
+        skills=SKILLS,
+        drop_tables=DROP_TABLES,
+        hunting_areas=HUNTING_AREAS,
+        guild_quests=GUILD_QUESTS,
+        compiled_items=COMPILED_ITEMS,
+        encounter_tables=dict(ENCOUNTER_TABLES),
+        sources=content_sources_signature(),
+    )
+)
+
+
+def battle_content(state: GameState) -> ContentSnapshot:
+    """Snapshot yang dipakai battle aktif state ini; di luar battle selalu snapshot terbaru.
+
+    Stat efektif, passive dan elemen senjata karakter ikut snapshot ini lewat
+    pinned_battle_content() selama state.in_battle.
+    """
+
+    content = state.battle_state.content if state.battle_state else None
+    return content or CONTENT.current
+
+
+async def watch_content_files(interval: float) -> None:
+    """Polling mtime file konten; reload otomatis bila ada yang berubah (tanpa dependensi watcher)."""
+
+    last_signature = CONTENT.current.sources
+    while True:
+        await asyncio.sleep(interval)
+        signature = content_sources_signature()
+        if signature == last_signature:
+            continue
+        last_signature = signature
+        try:
+            await CONTENT.reload("file berubah")
+        except ContentValidationError:
+            pass  # sudah dicatat; tunggu file diperbaiki
+        except Exception:
+            logger.exception("Reload konten otomatis gagal")
+
+
+def export_content_tables(overwrite: bool = False) -> List[str]:
+    """Tulis tabel bawaan ke CONTENT_TABLE_DIR sebagai titik awal edit konten tanpa restart."""
+
+    os.makedirs(CONTENT_TABLE_DIR, exist_ok=True)
+    written = []
+    for name in CONTENT_TABLE_NAMES:
+        path = content_table_path(name)
+        if os.path.exists(path) and not overwrite:
+            continue
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(BUILTIN_CONTENT_TABLES[name], f, ensure_ascii=False, indent=2)
+        written.append(path)
+    return written
+
+
 # ==========================
 # STORY / SCENE HANDLER
 # ==========================
@@ -4106,6 +6658,7 @@ STORY_BATTLE_ROUTES = {
     "BATTLE_TUTORIAL_1": {
         "type": "random",
         "set_scene": "CH0_S3",
+        "return_scene": "CH0_S4_POST_BATTLE",  # dipindah oleh handler pasca-battle (prolog)
     },
     "BATTLE_SIAK_GATE": {
         "type": "story",
@@ -4168,27 +6721,43 @@ STORY_BATTLE_ROUTES = {
 def apply_flags_from_data(state: GameState, flags: Optional[Dict[str, List[str]]]) -> None:
     if not flags:
         return
-    for flag in flags.get("set", []):
-        state.flags[flag] = True
-    for flag in flags.get("unset", []):
-        state.flags[flag] = False
+    set_mask = STORY_FLAGS.mask(flags.get("set", []))
+    unset_mask = STORY_FLAGS.mask(flags.get("unset", []))
+    state.flags.update_bits(set_mask, unset_mask)
 
 
 def highest_party_level(state: GameState) -> int:
     return max((c.level for c in state.party.values()), default=1)
 
 
-def requirements_met(requirements: Optional[Dict[str, Any]], state: GameState) -> bool:
+def requirements_met(
+    requirements: Any, state: GameState, flag_mask: Optional[int] = None
+) -> bool:
+    """requirements: RequirementPredicate (jalur cepat) atau dict syarat mentah/ternormalisasi."""
+
     if not requirements:
         return True
-    req_flags = requirements.get("flags") or []
-    for flag in req_flags:
-        if not state.flags.get(flag):
-            return False
-    min_level = requirements.get("min_level")
-    if isinstance(min_level, int) and highest_party_level(state) < min_level:
-        return False
-    return True
+    if not isinstance(requirements, RequirementPredicate):
+        requirements = compile_requirements(_normalize_requirements(requirements))
+    return requirements.test(state, flag_mask)
+
+
+# Scene tujuan tiap story command (kosong = keluar ke peta/menu kota).
+# Jaga tetap sinkron dengan execute_story_command; dipakai analisis graf scene.
+STORY_COMMAND_TARGETS: Dict[str, Tuple[str, ...]] = {
+    "GO_TO_WORLD_MAP": (),
+    "WORLD_MAP": (),
+    "SIAK_CITY_MENU": (),
+    "SIAK_CITY_MENU_AFTER_UMAR": (),
+    "SET_MAIN_RENGAT": (),
+    "SET_MAIN_PEKANBARU": (),
+    "SET_MAIN_KAMPAR": (),
+    "SQ_HARSAN_SHRINE": ("SQ_HARSAN_BLADE_SHRINE",),
+    "ADD_REZA_PARTY": ("CH2_REZA_JOINS",),
+    "COMPLETE_UMAR_QUEST": ("SQ_UMAR_REWARD",),
+    "COMPLETE_REZA_QUEST": ("SQ_REZA_REWARD",),
+    "TRUE_ENDING_TRIGGER": ("TRUE_ENDING", "GOOD_ENDING"),
+}
 
 
 def find_choice_by_callback(scene_data: Optional[Dict[str, Any]], callback_data: str) -> Optional[Dict[str, Any]]:
@@ -4207,6 +6776,43 @@ def find_choice_by_callback(scene_data: Optional[Dict[str, Any]], callback_data:
     return None
 
 
+class SceneChoiceIndex:
+    """callback_data -> choice per scene; tabel satu scene dibangun saat scene itu pertama kali dipakai."""
+
+    def __init__(self, scenes: Any):
+        self.scenes = scenes
+        self._by_scene: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def lookup(self, scene_id: str, callback_data: str) -> Optional[Dict[str, Any]]:
+        table = self._by_scene.get(scene_id)
+        if table is None:
+            table = {}
+            scene = self.scenes.get(scene_id) or {}
+            for choice in scene.get("choices", []):
+                # Urutan kunci sama dengan find_choice_by_callback: pilihan pertama yang cocok menang.
+                for key in (
+                    choice.get("callback_data"),
+                    choice.get("next_scene"),
+                    choice.get("next"),
+                    choice.get("command"),
+                    choice.get("battle"),
+                ):
+                    if key is not None:
+                        table.setdefault(key, choice)
+            self._by_scene[scene_id] = table
+        return table.get(callback_data)
+
+
+_SCENE_CHOICE_INDEX: Optional[SceneChoiceIndex] = None
+
+
+def get_scene_choice(scene_id: str, callback_data: str) -> Optional[Dict[str, Any]]:
+    global _SCENE_CHOICE_INDEX
+    if _SCENE_CHOICE_INDEX is None or _SCENE_CHOICE_INDEX.scenes is not SCENES:
+        _SCENE_CHOICE_INDEX = SceneChoiceIndex(SCENES)  # SCENES diganti oleh reload konten
+    return _SCENE_CHOICE_INDEX.lookup(scene_id, callback_data)
+
+
 def build_default_choice() -> Dict[str, Any]:
     return {
         "label": "Lanjut",
@@ -4339,6 +6945,12 @@ async def execute_story_command(
             extra_text=quest_text,
         )
         return True
+    if command == "TRUE_ENDING_TRIGGER":
+        has_true = state.flags.get("UMAR_QUEST_DONE") and state.flags.get("REZA_QUEST_DONE")
+        state.scene_id = "TRUE_ENDING" if has_true else "GOOD_ENDING"
+        state.main_progress = "Epilog"
+        await send_scene(update, context, state)
+        return True
     return False
 
 
@@ -4365,7 +6977,8 @@ async def handle_story_battle_trigger(
             await start_random_battle(update, context, state)
         return True
     enemy = route.get("enemy")
-    return_scene = next_scene or route.get("return_scene")
+    # next_scene pilihan sering berisi battle key itu sendiri; hanya scene nyata yang menimpa return_scene.
+    return_scene = next_scene if next_scene in SCENES else route.get("return_scene")
     if not enemy or not return_scene:
         return False
     await start_story_battle(
@@ -4430,18 +7043,118 @@ def handle_scene_side_effects(state: GameState) -> str:
     return "\n\n".join(extras)
 
 
+STORY_TOKEN_PATTERN = re.compile(r"\{(PLAYER_NAME|HERO_NAME)\}")
+SCENE_RENDER_CACHE_SIZE = 512  # hasil render (teks + keyboard) yang disimpan
+EMPTY_SCENE_TEXT = "Maaf, terjadi kesalahan pada cerita. Teks scene kosong."
+
+
+def story_hero_name(state: GameState) -> str:
+    return state.player_name or state.party.get("ARUNA").name if state.party.get("ARUNA") else "Ksatria"
+
+
 def apply_story_tokens(text_lines: List[str], state: GameState) -> List[str]:
-    hero_name = state.player_name or state.party.get("ARUNA").name if state.party.get("ARUNA") else "Ksatria"
-    replacements = {
-        "{PLAYER_NAME}": hero_name,
-        "{HERO_NAME}": hero_name,
-    }
-    result: List[str] = []
-    for line in text_lines:
-        for src, dest in replacements.items():
-            line = line.replace(src, dest)
-        result.append(line)
-    return result
+    hero_name = story_hero_name(state)
+    return [STORY_TOKEN_PATTERN.sub(hero_name, line) for line in text_lines]
+
+
+@dataclass(frozen=True)
+class SceneTemplate:
+    """Teks scene yang sudah digabung dan dipecah di slot token: literal di indeks genap, nama slot di ganjil."""
+
+    parts: Tuple[str, ...]
+
+    @classmethod
+    def compile(cls, text_data: Any) -> "SceneTemplate":
+        text_lines = text_data.split("\n") if isinstance(text_data, str) else list(text_data or [])
+        text = "\n".join(text_lines) if text_lines else EMPTY_SCENE_TEXT
+        return cls(tuple(STORY_TOKEN_PATTERN.split(text)))
+
+    @property
+    def is_static(self) -> bool:
+        return len(self.parts) == 1
+
+    def render(self, hero_name: str) -> str:
+        if self.is_static:
+            return self.parts[0]
+        # Semua token cerita saat ini berisi nama hero.
+        return "".join(part if idx % 2 == 0 else hero_name for idx, part in enumerate(self.parts))
+
+
+class SceneRenderCache:
+    """Template per scene + LRU hasil render per (scene_id, hero_name, pilihan yang terlihat)."""
+
+    def __init__(self, scenes: Any, max_size: int = SCENE_RENDER_CACHE_SIZE):
+        self.scenes = scenes
+        self.max_size = max_size
+        self.templates: Dict[str, SceneTemplate] = {}
+        self.rendered: "OrderedDict[Tuple[str, Optional[str], Tuple[int, ...]], Tuple[str, InlineKeyboardMarkup]]" = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def template(self, scene_id: str, scene: Dict[str, Any]) -> SceneTemplate:
+        template = self.templates.get(scene_id)
+        if template is None:
+            template = SceneTemplate.compile(scene.get("text"))
+            self.templates[scene_id] = template
+        return template
+
+    def render(
+        self, scene_id: str, scene: Dict[str, Any], hero_name: str, visible: Tuple[int, ...]
+    ) -> Tuple[str, InlineKeyboardMarkup]:
+        template = self.template(scene_id, scene)
+        # Scene tanpa token dipakai bersama oleh semua pemain.
+        key = (scene_id, None if template.is_static else hero_name, visible)
+        cached = self.rendered.get(key)
+        if cached is not None:
+            self.rendered.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        if visible:
+            choices = scene.get("choices", [])
+            buttons = [(choices[idx].get("label") or "Lanjut", choices[idx]["callback_data"]) for idx in visible]
+        else:
+            default_choice = build_default_choice()
+            buttons = [(default_choice["label"], default_choice["callback_data"])]
+        cached = (template.render(hero_name), make_keyboard(buttons))
+        self.rendered[key] = cached
+        if len(self.rendered) > self.max_size:
+            self.rendered.popitem(last=False)
+        return cached
+
+    def stats(self) -> Dict[str, int]:
+        return {"templates": len(self.templates), "rendered": len(self.rendered), "hits": self.hits, "misses": self.misses}
+
+
+_SCENE_RENDER_CACHE: Optional[SceneRenderCache] = None
+
+
+def get_scene_render_cache() -> SceneRenderCache:
+    global _SCENE_RENDER_CACHE
+    if _SCENE_RENDER_CACHE is None or _SCENE_RENDER_CACHE.scenes is not SCENES:
+        _SCENE_RENDER_CACHE = SceneRenderCache(SCENES)  # SCENES diganti oleh reload konten
+    return _SCENE_RENDER_CACHE
+
+
+def visible_choice_indexes(scene: Dict[str, Any], state: GameState) -> Tuple[int, ...]:
+    visible = []
+    flag_mask: Optional[int] = None
+    for idx, choice in enumerate(scene.get("choices", []) or []):
+        if not choice.get("callback_data"):
+            continue
+        predicate = choice.get("predicate")
+        if predicate is None:
+            predicate = compile_requirements(choice.get("requirements"))
+        if predicate is ALWAYS_MET:
+            visible.append(idx)
+            continue
+        if predicate.needs_flags and flag_mask is None:
+            flag_mask = state_flag_mask(state)  # satu kali per render untuk semua pilihan
+        if predicate.test(state, flag_mask):
+            visible.append(idx)
+    return tuple(visible)
 
 
 async def send_scene(
@@ -4458,7 +7171,7 @@ async def send_scene(
 
     apply_flags_from_data(state, data.get("flags"))
 
-    if not requirements_met(data.get("requirements"), state):
+    if not requirements_met(data.get("predicate") or data.get("requirements"), state):
         text = "Maaf, terjadi kesalahan pada cerita. Syarat scene belum terpenuhi."
         keyboard = make_keyboard([("Kembali ke map", "GO_TO_WORLD_MAP")])
         query = update.callback_query
@@ -4469,31 +7182,13 @@ async def send_scene(
         await send_world_map(update, context, state)
         return
 
-    text_lines = data.get("text", []) or []
-    if isinstance(text_lines, str):
-        text_lines = text_lines.split("\n")
-    if not text_lines:
-        text_lines = ["Maaf, terjadi kesalahan pada cerita. Teks scene kosong."]
-    text_lines = apply_story_tokens(text_lines, state)
-    text = "\n".join(text_lines)
+    text, keyboard = get_scene_render_cache().render(
+        state.scene_id, data, story_hero_name(state), visible_choice_indexes(data, state)
+    )
     if reward_text:
         extra_text = reward_text + ("\n\n" + extra_text if extra_text else "")
     if extra_text:
         text = extra_text + "\n\n" + text
-
-    choices_raw = data.get("choices", []) or []
-    visible_choices: List[Tuple[str, str]] = []
-    for choice in choices_raw:
-        if not requirements_met(choice.get("requirements"), state):
-            continue
-        callback_data = choice.get("callback_data")
-        label = choice.get("label") or "Lanjut"
-        if callback_data:
-            visible_choices.append((label, callback_data))
-    if not visible_choices:
-        default_choice = build_default_choice()
-        visible_choices.append((default_choice["label"], default_choice["callback_data"]))
-    keyboard = make_keyboard(visible_choices)
     query = update.callback_query
     if query:
         await safe_edit_text(query, text=text, reply_markup=keyboard)
@@ -4518,11 +7213,10 @@ async def handle_scene_choice(
     state: GameState,
     choice_data: str,
 ):
-    scene_data = get_scene(state.scene_id)
-    selected_choice = find_choice_by_callback(scene_data, choice_data)
+    selected_choice = get_scene_choice(state.scene_id, choice_data)
 
     if selected_choice:
-        if not requirements_met(selected_choice.get("requirements"), state):
+        if not requirements_met(selected_choice.get("predicate") or selected_choice.get("requirements"), state):
             await send_scene(
                 update,
                 context,
@@ -4554,6 +7248,10 @@ async def handle_scene_choice(
             await render_scene(update, context, state, target_scene)
             return
 
+        # Pilihan scene yang menunjuk menu biasa (mis. BACK_CITY_MENU) diteruskan ke router callback.
+        if await CALLBACK_ROUTER.dispatch_data(update, context, state, target_scene):
+            return
+
         await send_scene_not_found(
             update, context, state, missing_scene_id=target_scene or choice_data
         )
@@ -4566,19 +7264,213 @@ async def handle_scene_choice(
     if await execute_story_command(choice_data, update, context, state):
         return
 
-    if choice_data == "TRUE_ENDING_TRIGGER":
-        has_true = state.flags.get("UMAR_QUEST_DONE") and state.flags.get("REZA_QUEST_DONE")
-        state.scene_id = "TRUE_ENDING" if has_true else "GOOD_ENDING"
-        state.main_progress = "Epilog"
-        await send_scene(update, context, state)
-        return
-
     if choice_data in SCENES:
         await render_scene(update, context, state, choice_data)
         return
 
     await send_scene_not_found(update, context, state, missing_scene_id=choice_data)
 
+# ==========================
+# ANALISIS GRAF SCENE
+# ==========================
+
+# Scene yang dibuka langsung oleh handler kode (event kota, NPC quest), di luar pilihan scene.
+SCENE_ENTRY_POINTS = (
+    "CH1_UMAR_CLINIC",
+    "CH1_GATE_ALERT",
+    "CH3_PEKANBARU_ENTRY",
+    "CH4_CASTLE_APPROACH",
+    "SQ_UMAR_INTRO",
+    "SQ_REZA_INTRO",
+    "SQ_HARSAN_BLADE_INTRO",
+)
+
+
+@dataclass
+class SceneEdge:
+    """Satu pilihan scene setelah di-resolve dengan urutan yang sama seperti handle_scene_choice."""
+
+    source: str
+    label: str
+    callback_data: str
+    kind: str  # scene | battle | command | route | missing
+    via: Optional[str]
+    targets: Tuple[str, ...]
+    requirements: Dict[str, Any]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "callback_data": self.callback_data,
+            "kind": self.kind,
+            "via": self.via,
+            "targets": list(self.targets),
+            "requirements": self.requirements,
+        }
+
+
+@dataclass
+class SceneGraphReport:
+    entry_points: List[str]
+    edges: Dict[str, List[SceneEdge]]
+    reachable: Set[str]
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    # flag -> {"set", "unset", "required_by", "blocked_by": [lokasi "SCENE" atau "SCENE#pilihan"]}
+    flag_index: Dict[str, Dict[str, List[str]]] = field(default_factory=dict)
+
+    @property
+    def unreachable(self) -> List[str]:
+        return sorted(set(self.edges) - self.reachable)
+
+    def to_index(self) -> Dict[str, Any]:
+        return {
+            "entry_points": self.entry_points,
+            "adjacency": {
+                scene_id: [edge.to_dict() for edge in edges] for scene_id, edges in self.edges.items()
+            },
+            "reachable": sorted(self.reachable),
+            "unreachable": self.unreachable,
+            "flags": self.flag_index,
+            "errors": self.errors,
+            "warnings": self.warnings,
+        }
+
+
+def resolve_scene_choice(scene_id: str, choice: Dict[str, Any], scenes: Any) -> SceneEdge:
+    data = str(choice.get("callback_data") or "")
+    next_scene = choice.get("next_scene")
+    common = dict(
+        source=scene_id,
+        label=choice.get("label") or "Lanjut",
+        callback_data=data,
+        requirements=choice.get("requirements") or {},
+    )
+    route = CALLBACK_ROUTER.resolve(data)
+    if route and route.before_scene:
+        return SceneEdge(kind="route", via=route.name, targets=(), **common)
+    battle_key = choice.get("battle") or (data if data.startswith("BATTLE_") else None)
+    battle = STORY_BATTLE_ROUTES.get(battle_key) if battle_key else None
+    if battle:
+        return_scene = next_scene if next_scene in scenes else battle.get("return_scene")
+        if battle.get("type") == "random" or (battle.get("enemy") and return_scene):
+            targets = (battle.get("set_scene"), return_scene, battle.get("loss_scene"))
+            return SceneEdge(
+                kind="battle", via=battle_key, targets=tuple(t for t in targets if t), **common
+            )
+    command = choice.get("command") or next_scene or data
+    if command in STORY_COMMAND_TARGETS:
+        return SceneEdge(kind="command", via=command, targets=STORY_COMMAND_TARGETS[command], **common)
+    target = next_scene or data
+    if target in scenes:
+        return SceneEdge(kind="scene", via=None, targets=(target,), **common)
+    route = CALLBACK_ROUTER.resolve(target)
+    if route:
+        return SceneEdge(kind="route", via=route.name, targets=(), **common)
+    return SceneEdge(kind="missing", via=target, targets=(), **common)
+
+
+def _index_requirement_flags(
+    flag_index: Dict[str, Dict[str, List[str]]], where: str, requirements: Dict[str, Any]
+) -> None:
+    for key, role in (("flags", "required_by"), ("any_flags", "required_by"), ("not_flags", "blocked_by")):
+        for flag in requirements.get(key, []):
+            flag_index.setdefault(flag, {"set": [], "unset": [], "required_by": [], "blocked_by": []})[role].append(
+                where
+            )
+    for alt in requirements.get("any_of", []):
+        _index_requirement_flags(flag_index, where, alt)
+
+
+def _index_flags(flag_index: Dict[str, Dict[str, List[str]]], where: str, data: Dict[str, Any]) -> None:
+    flags = data.get("flags") or {}
+    for role in ("set", "unset"):
+        for flag in flags.get(role, []):
+            flag_index.setdefault(flag, {"set": [], "unset": [], "required_by": [], "blocked_by": []})[role].append(
+                where
+            )
+    _index_requirement_flags(flag_index, where, data.get("requirements") or {})
+
+
+def _requirement_items(requirements: Dict[str, Any]) -> Set[str]:
+    items = set(requirements.get("items", {}))
+    for alt in requirements.get("any_of", []):
+        items |= _requirement_items(alt)
+    return items
+
+
+def analyze_scene_graph(scenes: Any = None) -> SceneGraphReport:
+    """Resolve semua pilihan scene dan battle story, cari referensi putus dan scene yang tak terjangkau."""
+
+    scenes = SCENES if scenes is None else scenes
+    entry_points = [GameState.scene_id, *(info[2] for info in CITY_FIRST_VISITS.values()), *SCENE_ENTRY_POINTS]
+    report = SceneGraphReport(entry_points=entry_points, edges={}, reachable=set())
+    for scene_id in entry_points:
+        if scene_id not in scenes:
+            report.errors.append(f"Entry point {scene_id} tidak ada di SCENES")
+    for scene_id, scene in scenes.items():
+        _index_flags(report.flag_index, scene_id, scene)
+        edges = []
+        for idx, choice in enumerate(scene.get("choices", [])):
+            edge = resolve_scene_choice(scene_id, choice, scenes)
+            edges.append(edge)
+            _index_flags(report.flag_index, f"{scene_id}#{idx}", choice)
+            for item_id in sorted(_requirement_items(choice.get("requirements") or {}) - set(ITEMS)):
+                report.errors.append(f"{scene_id}: pilihan '{edge.label}' mensyaratkan item {item_id} yang tidak ada")
+            if edge.kind == "missing":
+                report.errors.append(f"{scene_id}: pilihan '{edge.label}' menuju {edge.via} yang tidak dikenal")
+            for target in edge.targets:
+                if target not in scenes:
+                    report.errors.append(f"{scene_id}: {edge.kind} {edge.via} menuju scene {target} yang tidak ada")
+        if not edges:
+            report.warnings.append(f"{scene_id}: tanpa pilihan (memakai tombol default ke peta)")
+        report.edges[scene_id] = edges
+    for battle_key, battle in STORY_BATTLE_ROUTES.items():
+        for role in ("set_scene", "return_scene", "loss_scene"):
+            target = battle.get(role)
+            if target and target not in scenes:
+                report.errors.append(f"STORY_BATTLE_ROUTES.{battle_key}.{role}: scene {target} tidak ada")
+    for command, targets in STORY_COMMAND_TARGETS.items():
+        for target in targets:
+            if target not in scenes:
+                report.errors.append(f"STORY_COMMAND_TARGETS.{command}: scene {target} tidak ada")
+
+    pending = [scene_id for scene_id in entry_points if scene_id in scenes]
+    while pending:
+        scene_id = pending.pop()
+        if scene_id in report.reachable:
+            continue
+        report.reachable.add(scene_id)
+        for edge in report.edges.get(scene_id, []):
+            pending.extend(target for target in edge.targets if target in scenes)
+    for scene_id in report.unreachable:
+        report.warnings.append(f"{scene_id}: tidak terjangkau dari entry point manapun")
+    for flag, usage in sorted(report.flag_index.items()):
+        if usage["required_by"] and not usage["set"]:
+            report.warnings.append(
+                f"Flag {flag} disyaratkan {', '.join(usage['required_by'])} tapi tidak di-set data scene "
+                "(pastikan di-set kode)"
+            )
+    return report
+
+
+def print_scene_graph_report(report: SceneGraphReport) -> None:
+    edge_count = sum(len(edges) for edges in report.edges.values())
+    print(
+        f"Scene: {len(report.edges)}, pilihan: {edge_count}, entry point: {len(report.entry_points)}, "
+        f"terjangkau: {len(report.reachable)}"
+    )
+    kinds = Counter(edge.kind for edges in report.edges.values() for edge in edges)
+    print("Jenis pilihan: " + ", ".join(f"{kind} {count}" for kind, count in sorted(kinds.items())))
+    for title, rows in (("ERROR", report.errors), ("PERINGATAN", report.warnings)):
+        if rows:
+            print(f"{title} ({len(rows)}):")
+            for row in rows:
+                print(f"- {row}")
+    if not report.errors:
+        print("Tidak ada referensi scene yang putus.")
+
+
 # ==========================
 # WORLD MAP & CITY MENU
 # ==========================
@@ -4946,7 +7838,7 @@ async def send_hunting_area_menu(
         await update.callback_query.answer("Levelmu belum cukup.", show_alert=True)
         await send_hunting_menu(update, context, state)
         return
-    state.flags["LAST_HUNT_AREA"] = area_id
+    state.last_hunt_area = area_id
     lines = [
         f"=== {area['name']} ===",
         f"Rekomendasi level: {area['level_range']} (min Lv {area['min_level']})",
@@ -4971,7 +7863,17 @@ async def send_hunting_area_menu(
     if auto_active:
         buttons.append([InlineKeyboardButton("⛔ Hentikan Auto Hunting", callback_data="AUTO_HUNT_OFF")])
     else:
-        buttons.append([InlineKeyboardButton("⚔️ Auto Hunting", callback_data=f"AUTO_HUNT_ON|{area_id}")])
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    f"⏩ Auto Hunting x{FAST_HUNT_BATTLES}", callback_data=f"AUTO_HUNT_FAST|{area_id}"
+                )
+            ]
+        )
+        if live_auto_hunt_allowed(state):
+            buttons.append(
+                [InlineKeyboardButton("⚔️ Auto Hunting (live)", callback_data=f"AUTO_HUNT_ON|{area_id}")]
+            )
     buttons.append([InlineKeyboardButton("⬅ Daftar Area", callback_data="MENU_HUNTING")])
     buttons.append([InlineKeyboardButton("🏘️ Kembali ke kota", callback_data="BACK_CITY_MENU")])
     markup = InlineKeyboardMarkup(buttons)
@@ -4990,6 +7892,39 @@ async def send_hunting_area_menu(
         await update.effective_chat.send_message(text, reply_markup=markup)
 
 
+def check_auto_hunt_start(state: GameState, area_id: Optional[str]) -> Optional[str]:
+    """Pesan error bila auto hunting belum boleh dimulai di area ini."""
+
+    if state.auto_hunt:
+        return "Auto hunting sudah aktif."
+    if not area_id:
+        return "Area tidak valid."
+    area = HUNTING_AREAS.get(area_id)
+    if not area:
+        return "Area hunting tidak dikenal."
+    if highest_party_level(state) < area.get("min_level", 1):
+        return "Levelmu belum cukup untuk area ini."
+    if not living_party_members(state):
+        return "Seluruh party sedang tidak mampu bertarung."
+    return None
+
+
+def build_auto_hunt_stats(state: GameState, area_id: str) -> Dict[str, Any]:
+    return {
+        "session_area": area_id,
+        "start_level": {cid: state.party[cid].level for cid in state.party_order if cid in state.party},
+        "start_xp": {cid: state.xp_pool.get(cid, 0) for cid in state.party_order},
+        "last_level_up_xp": {cid: state.xp_pool.get(cid, 0) for cid in state.party_order},
+        "gained_xp": {cid: 0 for cid in state.party_order},
+        "gained_gold": 0,
+        "kills": 0,
+        "items_gained": {},
+        "stop_reason": "",
+        "summary_sent": False,
+        "loop_active": False,
+    }
+
+
 async def handle_auto_hunt_toggle(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -4999,44 +7934,16 @@ async def handle_auto_hunt_toggle(
 ):
     query = update.callback_query
     if enable:
-        if state.auto_hunt:
-            if query:
-                await query.answer("Auto hunting sudah aktif.", show_alert=True)
-            return
-        if not area_id:
-            if query:
-                await query.answer("Area tidak valid.", show_alert=True)
-            return
-        area = HUNTING_AREAS.get(area_id)
-        if not area:
-            if query:
-                await query.answer("Area hunting tidak dikenal.", show_alert=True)
-            return
-        hero_level = highest_party_level(state)
-        if hero_level < area.get("min_level", 1):
-            if query:
-                await query.answer("Levelmu belum cukup untuk area ini.", show_alert=True)
-            return
-        if not living_party_members(state):
+        error = check_auto_hunt_start(state, area_id)
+        if error:
             if query:
-                await query.answer("Seluruh party sedang tidak mampu bertarung.", show_alert=True)
+                await query.answer(error, show_alert=True)
             return
+        area = HUNTING_AREAS[area_id]
         state.auto_hunt = True
         state.auto_hunt_area = area_id
-        state.flags["LAST_HUNT_AREA"] = area_id
-        stats = {
-            "session_area": area_id,
-            "start_level": {cid: state.party[cid].level for cid in state.party_order if cid in state.party},
-            "start_xp": {cid: state.xp_pool.get(cid, 0) for cid in state.party_order},
-            "last_level_up_xp": {cid: state.xp_pool.get(cid, 0) for cid in state.party_order},
-            "gained_xp": {cid: 0 for cid in state.party_order},
-            "gained_gold": 0,
-            "kills": 0,
-            "items_gained": {},
-            "stop_reason": "",
-            "summary_sent": False,
-            "loop_active": False,
-        }
+        state.last_hunt_area = area_id
+        stats = build_auto_hunt_stats(state, area_id)
         if update.effective_chat:
             stats["auto_chat_id"] = update.effective_chat.id
         if query and query.message:
@@ -5086,14 +7993,15 @@ def get_low_hp_allies(state: GameState, threshold: float) -> List[CharacterState
 
 
 def select_auto_heal_skill(
-    character: CharacterState, prefer_group: bool = False
+    character: CharacterState, prefer_group: bool = False, skills: Optional[Dict[str, Dict[str, Any]]] = None
 ) -> Optional[Tuple[str, Dict[str, Any]]]:
+    skills = SKILLS if skills is None else skills
     best_single: Optional[Tuple[str, Dict[str, Any]]] = None
     best_single_power = -1.0
     best_group: Optional[Tuple[str, Dict[str, Any]]] = None
     best_group_power = -1.0
     for skill_id in character.skills:
-        skill = SKILLS.get(skill_id)
+        skill = skills.get(skill_id)
         if not skill:
             continue
         skill_type = skill.get("type")
@@ -5117,12 +8025,13 @@ def select_auto_heal_skill(
 
 
 def select_auto_damage_skill(
-    character: CharacterState, enemy: Optional[Dict[str, Any]]
+    character: CharacterState, enemy: Optional[Dict[str, Any]], skills: Optional[Dict[str, Dict[str, Any]]] = None
 ) -> Optional[Tuple[str, Dict[str, Any]]]:
+    skills = SKILLS if skills is None else skills
     best_choice: Optional[Tuple[str, Dict[str, Any]]] = None
     best_score = 0.0
     for skill_id in character.skills:
-        skill = SKILLS.get(skill_id)
+        skill = skills.get(skill_id)
         if not skill or skill.get("type") not in {"PHYS", "MAG"}:
             continue
         mp_cost = skill.get("mp_cost", 0)
@@ -5155,7 +8064,9 @@ def perform_auto_player_action(
     multi_low = get_low_hp_allies(state, 0.55)
     heal_choice = None
     if low_allies:
-        heal_choice = select_auto_heal_skill(character, prefer_group=len(multi_low) >= 2)
+        heal_choice = select_auto_heal_skill(
+            character, prefer_group=len(multi_low) >= 2, skills=battle_content(state).skills
+        )
     if heal_choice:
         skill_id, skill = heal_choice
         mp_cost = skill.get("mp_cost", 0)
@@ -5188,48 +8099,23 @@ def perform_auto_player_action(
             )
             return logs, False
 
-    damage_choice = select_auto_damage_skill(character, enemy)
+    damage_choice = select_auto_damage_skill(character, enemy, skills=battle_content(state).skills)
     if damage_choice:
         skill_id, skill = damage_choice
         mp_cost = skill.get("mp_cost", 0)
         if character.mp >= mp_cost:
             character.mp -= mp_cost
-            hits = max(1, int(skill.get("hits", 1)))
-            skill_type = skill.get("type")
-            element = skill.get("element", "NETRAL")
+            batch = calc_skill_hits(state, character, skill, enemy)
+            hits = len(batch.damages)
             total_damage = 0
             hit_logs: List[str] = []
-            hit_weak = False
-            hit_resist = False
-            for hit in range(hits):
-                if skill_type == "MAG":
-                    dmg, h_weak, h_resist = calc_magic_damage(
-                        character,
-                        enemy["defense"],
-                        skill.get("power", 1.0),
-                        element,
-                        enemy.get("weakness"),
-                        enemy.get("resist"),
-                        enemy.get("element"),
-                    )
-                else:
-                    dmg, h_weak, h_resist = calc_physical_damage(
-                        character,
-                        enemy["defense"],
-                        skill.get("power", 1.0),
-                        element,
-                        enemy.get("weakness"),
-                        enemy.get("resist"),
-                        enemy.get("element"),
-                    )
-                if element == "CAHAYA" and state.flags.get("LIGHT_BUFF_TURNS"):
-                    dmg = int(dmg * 1.2)
+            for hit, dmg in enumerate(batch.damages):
                 enemy["hp"] -= dmg
                 total_damage += dmg
-                hit_weak = hit_weak or h_weak
-                hit_resist = hit_resist or h_resist
                 if hits > 1:
                     hit_logs.append(f"Hit {hit + 1}: {dmg} damage")
+            hit_weak = batch.any_weakness
+            hit_resist = batch.any_resist
             logs.append(f"{character.name} menggunakan {skill['name']}!")
             if hit_logs:
                 logs.extend(hit_logs)
@@ -5271,12 +8157,10 @@ def perform_auto_enemy_attack(
     if not target:
         return logs, True
     dmg = calc_enemy_basic_damage(enemy.get("atk", 1), get_effective_stat(target, "defense"))
-    defending = state.flags.get("DEFENDING", {})
+    defending = state.scratch.defending
     if defending.get(target_id):
         dmg = max(1, dmg // 2)
         defending.pop(target_id, None)
-        if not defending:
-            state.flags.pop("DEFENDING", None)
     dmg = apply_mana_shield_absorption(state, target_id, dmg, logs)
     if dmg <= 0:
         return logs, False
@@ -5291,29 +8175,222 @@ def perform_auto_enemy_attack(
     return logs, party_dead
 
 
-async def send_auto_hunt_state(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
-    state: GameState,
-    log_lines: List[str],
-):
-    stats = state.auto_hunt_stats or {}
-    area_id = stats.get("session_area")
-    area_name = HUNTING_AREAS.get(area_id, {}).get("name", area_id or "-")
-    kills = stats.get("kills", 0)
-    total_gold = stats.get("gained_gold", 0)
-    gained_xp = stats.get("gained_xp", {})
-    xp_parts: List[str] = []
-    for cid in state.party_order:
-        member = state.party.get(cid)
-        if not member:
-            continue
-        xp_parts.append(f"{member.name} +{gained_xp.get(cid, 0)}")
-    xp_line = "XP Didapat: " + (", ".join(xp_parts) if xp_parts else "0")
-    lines = [
-        f"=== AUTO HUNTING: {area_name} ===",
-        f"Kills: {kills} | Total Gold: {total_gold}",
-        xp_line,
+EDIT_PER_CHAT_INTERVAL = 1.0  # detik minimum antar edit di chat yang sama
+EDIT_GLOBAL_RATE = 25.0  # edit per detik untuk seluruh bot
+EDIT_LAST_SENT_LIMIT = 5000  # pesan yang diingat isi terakhirnya (panel yang tidak ditutup rapi)
+
+
+class MessageEditScheduler:
+    """Penjadwal edit pesan per (chat_id, message_id).
+
+    Hanya teks terbaru yang dikirim, edit dengan teks dan keyboard sama
+    dilewati, dan pengiriman mengikuti budget per chat serta global. RetryAfter
+    dari Telegram menahan seluruh antrian selama waktu yang diminta. Isi terakhir
+    per pesan dilupakan lewat cancel()/forget() saat panel selesai, dan dibatasi
+    EDIT_LAST_SENT_LIMIT untuk panel yang berakhir dengan cara lain.
+    """
+
+    def __init__(
+        self,
+        per_chat_interval: float = EDIT_PER_CHAT_INTERVAL,
+        global_rate: float = EDIT_GLOBAL_RATE,
+    ):
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self._pending: "OrderedDict[Tuple[int, int], Tuple[Any, str, Optional[InlineKeyboardMarkup]]]" = OrderedDict()
+        # (chat_id, message_id) -> (teks, keyboard) yang terakhir tampil, urut dari yang paling lama
+        self._last_sent: "OrderedDict[Tuple[int, int], Tuple[str, Optional[InlineKeyboardMarkup]]]" = OrderedDict()
+        self._chat_ready_at: Dict[int, float] = {}
+        self._global_ready_at = 0.0
+        self._backoff_until = 0.0
+        self._inflight: Optional[Tuple[int, int]] = None
+        self._inflight_done: Optional[asyncio.Event] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "skipped_unchanged": 0,
+            "sent": 0,
+            "failed": 0,
+            "retry_after": 0,
+        }
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def _ensure_started(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._inflight_done = asyncio.Event()
+        self._inflight_done.set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(
+        self,
+        bot,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> None:
+        key = (chat_id, message_id)
+        self.stats["submitted"] += 1
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+        if self._last_sent.get(key) == (text, reply_markup):
+            # Isi terbaru sama dengan yang sudah tampil; edit yang menunggu tidak perlu lagi.
+            self._pending.pop(key, None)
+            self.stats["skipped_unchanged"] += 1
+            return
+        self._pending[key] = (bot, text, reply_markup)
+        self._ensure_started()
+        self._wakeup.set()
+
+    async def cancel(self, chat_id: int, message_id: int) -> None:
+        """Buang edit yang menunggu untuk pesan ini dan tunggu edit yang sedang jalan."""
+
+        key = (chat_id, message_id)
+        self._pending.pop(key, None)
+        while self._inflight == key and self._inflight_done is not None:
+            await self._inflight_done.wait()
+        self._last_sent.pop(key, None)
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        """Versi sinkron cancel() tanpa menunggu edit yang sedang jalan (mis. saat state direset)."""
+
+        key = (chat_id, message_id)
+        self._pending.pop(key, None)
+        self._last_sent.pop(key, None)
+
+    def _remember_sent(self, key: Tuple[int, int], text: str, reply_markup) -> None:
+        self._last_sent[key] = (text, reply_markup)
+        self._last_sent.move_to_end(key)
+        while len(self._last_sent) > EDIT_LAST_SENT_LIMIT:
+            self._last_sent.popitem(last=False)
+
+    def _next_ready_key(self, now: float) -> Tuple[Optional[Tuple[int, int]], float]:
+        earliest = None
+        for key in self._pending:
+            ready_at = self._chat_ready_at.get(key[0], 0.0)
+            if ready_at <= now:
+                return key, now
+            if earliest is None or ready_at < earliest:
+                earliest = ready_at
+        return None, earliest if earliest is not None else now
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = loop.time()
+            blocked_until = max(self._backoff_until, self._global_ready_at)
+            if blocked_until > now:
+                await asyncio.sleep(blocked_until - now)
+                continue
+            key, ready_at = self._next_ready_key(now)
+            if key is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=ready_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            bot, text, reply_markup = self._pending.pop(key)
+            self._chat_ready_at[key[0]] = now + self.per_chat_interval
+            self._global_ready_at = now + self.global_interval
+            self._inflight = key
+            self._inflight_done.clear()
+            try:
+                await self._send(bot, key, text, reply_markup)
+            finally:
+                self._inflight = None
+                self._inflight_done.set()
+            if len(self._chat_ready_at) > 4 * (len(self._pending) + 256):
+                self._chat_ready_at = {
+                    chat_id: ready for chat_id, ready in self._chat_ready_at.items() if ready > now
+                }
+
+    async def _send(self, bot, key: Tuple[int, int], text: str, reply_markup) -> None:
+        chat_id, message_id = key
+        try:
+            with METRICS.timer("telegram_api_seconds", method="edit_message_text", source="scheduler"):
+                await bot.edit_message_text(
+                    chat_id=chat_id, message_id=message_id, text=text, reply_markup=reply_markup
+                )
+            self._remember_sent(key, text, reply_markup)
+            self.stats["sent"] += 1
+        except RetryAfter as exc:
+            self.stats["retry_after"] += 1
+            delay = exc.retry_after
+            delay = delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+            self._backoff_until = asyncio.get_running_loop().time() + delay
+            logger.warning("Telegram meminta jeda %.1f detik untuk edit pesan", delay)
+            if key not in self._pending:
+                self._pending[key] = (bot, text, reply_markup)
+                self._pending.move_to_end(key, last=False)
+        except BadRequest as exc:
+            if "message is not modified" in str(exc).lower():
+                self._remember_sent(key, text, reply_markup)
+                return
+            self.stats["failed"] += 1
+            logger.warning("Gagal mengedit pesan %s di chat %s: %s", message_id, chat_id, exc)
+        except Exception as exc:
+            self.stats["failed"] += 1
+            logger.warning("Gagal mengedit pesan %s di chat %s: %s", message_id, chat_id, exc)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._pending.clear()
+        self._last_sent.clear()
+
+    def metrics(self) -> Dict[str, int]:
+        snapshot = dict(self.stats)
+        snapshot["depth"] = self.depth
+        return snapshot
+
+
+EDIT_SCHEDULER = MessageEditScheduler()
+
+
+async def send_auto_hunt_state(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    state: GameState,
+    log_lines: List[str],
+    *,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    max_log_lines: int = 5,
+):
+    stats = state.auto_hunt_stats or {}
+    area_id = stats.get("session_area")
+    area_name = HUNTING_AREAS.get(area_id, {}).get("name", area_id or "-")
+    kills = stats.get("kills", 0)
+    total_gold = stats.get("gained_gold", 0)
+    gained_xp = stats.get("gained_xp", {})
+    xp_parts: List[str] = []
+    for cid in state.party_order:
+        member = state.party.get(cid)
+        if not member:
+            continue
+        xp_parts.append(f"{member.name} +{gained_xp.get(cid, 0)}")
+    xp_line = "XP Didapat: " + (", ".join(xp_parts) if xp_parts else "0")
+    lines = [
+        f"=== AUTO HUNTING: {area_name} ===",
+        f"Kills: {kills} | Total Gold: {total_gold}",
+        xp_line,
         "",
         "Status Party:",
     ]
@@ -5338,30 +8415,31 @@ async def send_auto_hunt_state(
     if log_lines:
         lines.append("")
         lines.append("---- Aksi Terakhir ----")
-        lines.extend(log_lines[-5:])
+        lines.extend(log_lines[-max_log_lines:])
     text = "\n".join(lines)
-    keyboard = InlineKeyboardMarkup(
+    keyboard = reply_markup or InlineKeyboardMarkup(
         [[InlineKeyboardButton("⛔ Hentikan Auto Hunting", callback_data="AUTO_HUNT_OFF")]]
     )
+    pending_panel = stats.get("pending_panel")
+    if pending_panel is not None and not sends_deferred(context.bot):
+        # Panel pertama dikirim outbox button(); tunggu Message-nya supaya tidak ada panel kedua.
+        stats.pop("pending_panel", None)
+        record_auto_hunt_panel(state, await pending_panel)
     chat_id = stats.get("auto_chat_id") or (update.effective_chat.id if update.effective_chat else None)
     message_id = stats.get("auto_message_id")
     try:
         if chat_id and message_id:
-            await context.bot.edit_message_text(
-                chat_id=chat_id, message_id=message_id, text=text, reply_markup=keyboard
-            )
+            EDIT_SCHEDULER.submit(context.bot, chat_id, message_id, text, keyboard)
         elif update.callback_query and update.callback_query.message:
             await safe_edit_text(update.callback_query, text=text, reply_markup=keyboard)
             state.auto_hunt_stats["auto_chat_id"] = update.callback_query.message.chat_id
             state.auto_hunt_stats["auto_message_id"] = update.callback_query.message.message_id
         elif chat_id:
-            message = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard)
-            state.auto_hunt_stats["auto_chat_id"] = message.chat_id
-            state.auto_hunt_stats["auto_message_id"] = message.message_id
+            await send_auto_hunt_panel(
+                state, context.bot, "send_message", chat_id=chat_id, text=text, reply_markup=keyboard
+            )
         elif update.effective_message:
-            message = await update.effective_message.reply_text(text=text, reply_markup=keyboard)
-            state.auto_hunt_stats["auto_chat_id"] = message.chat_id
-            state.auto_hunt_stats["auto_message_id"] = message.message_id
+            await send_auto_hunt_panel(state, update.effective_message, "reply_text", text=text, reply_markup=keyboard)
     except BadRequest as exc:
         if "message is not modified" in str(exc).lower():
             return
@@ -5370,6 +8448,29 @@ async def send_auto_hunt_state(
         )
 
 
+def sends_deferred(target: Any) -> bool:
+    return isinstance(target, DeferringProxy) and target.defers_sends()
+
+
+def record_auto_hunt_panel(state: GameState, message: Any) -> None:
+    if message is not None:
+        state.auto_hunt_stats["auto_chat_id"] = message.chat_id
+        state.auto_hunt_stats["auto_message_id"] = message.message_id
+
+
+async def send_auto_hunt_panel(state: GameState, target: Any, method_name: str, **kwargs) -> None:
+    """Kirim panel auto hunting baru dan catat id pesannya.
+
+    Di fase tunda button() kirim baru terjadi setelah lock dilepas, jadi Future hasil
+    outbox disimpan di stats dan ditunggu oleh pembaruan panel berikutnya.
+    """
+
+    if sends_deferred(target):
+        state.auto_hunt_stats["pending_panel"] = target.defer_call(method_name, **kwargs)
+        return
+    record_auto_hunt_panel(state, await getattr(target, method_name)(**kwargs))
+
+
 async def stop_auto_hunt(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -5385,7 +8486,7 @@ async def stop_auto_hunt(
             return
         stats["summary_sent"] = True
         data = {
-            "session_area": stats.get("session_area") or state.flags.get("LAST_HUNT_AREA"),
+            "session_area": stats.get("session_area") or state.last_hunt_area,
             "gained_xp": dict(stats.get("gained_xp", {})),
             "gained_gold": stats.get("gained_gold", 0),
             "kills": stats.get("kills", 0),
@@ -5402,9 +8503,14 @@ async def stop_auto_hunt(
         state.auto_hunt_area = None
         state.in_battle = False
         state.battle_enemies = []
+        if state.scratch.last_battle_result == "LOSE":
+            recover_party_after_defeat(state)
+            state.scratch.last_battle_result = None
         reset_auto_hunt_state(state)
+        maybe_autosave(state, "auto_hunt_stop")
     chat_id = data["chat_id"]
     if data["message_id"] and chat_id:
+        await EDIT_SCHEDULER.cancel(chat_id, data["message_id"])
         try:
             await context.bot.edit_message_reply_markup(
                 chat_id=chat_id, message_id=data["message_id"], reply_markup=None
@@ -5492,12 +8598,14 @@ async def run_auto_hunt_loop(
                     stop_reason = "Area auto hunting tidak valid."
                     break
                 battle_area = area_info.get("area_key", area_id)
-                enemy = pick_random_monster_for_area(battle_area, average_party_level(state))
+                content = CONTENT.current
+                enemy = pick_random_monster_for_area(battle_area, average_party_level(state), content)
                 state.in_battle = True
                 state.battle_enemies = [enemy]
                 reset_battle_flags(state)
-                state.flags["CURRENT_BATTLE_AREA"] = battle_area
-                state.flags["LAST_BATTLE_SOURCE"] = {"type": "AUTO_HUNT", "area": area_id}
+                state.battle_state.content = content
+                state.scratch.current_battle_area = battle_area
+                state.scratch.last_battle_source = {"type": "AUTO_HUNT", "area": area_id}
                 intro_lines = [
                     f"{enemy['name']} Lv {enemy.get('level', '?')} muncul di {area_info.get('name', 'area liar')}!"
                 ]
@@ -5505,7 +8613,7 @@ async def run_auto_hunt_loop(
                     intro_lines.append("Aura kuat menyelimuti udara. Monster langka!")
                 log_lines = intro_lines[-5:]
             await send_auto_hunt_state(update, context, state, log_lines)
-            await asyncio.sleep(0.6)
+            await asyncio.sleep(AUTO_HUNT_STEP_DELAY)
             battle_over = False
             enemy_defeated = False
             while not battle_over:
@@ -5535,13 +8643,13 @@ async def run_auto_hunt_loop(
                             state.auto_hunt = False
                             state.in_battle = False
                             stop_reason = "Seluruh party tumbang saat auto hunting."
-                            state.flags["LAST_BATTLE_RESULT"] = "LOSE"
+                            state.scratch.last_battle_result = "LOSE"
                             battle_over = True
                     if action_logs:
                         log_lines.extend(action_logs)
                         log_lines = log_lines[-5:]
                         await send_auto_hunt_state(update, context, state, log_lines)
-                        await asyncio.sleep(0.6)
+                        await asyncio.sleep(AUTO_HUNT_STEP_DELAY)
                     if battle_over:
                         break
                 if battle_over:
@@ -5560,13 +8668,13 @@ async def run_auto_hunt_loop(
                             state.auto_hunt = False
                             state.in_battle = False
                             stop_reason = "Seluruh party tumbang saat auto hunting."
-                            state.flags["LAST_BATTLE_RESULT"] = "LOSE"
+                            state.scratch.last_battle_result = "LOSE"
                             battle_over = True
                 if enemy_logs:
                     log_lines.extend(enemy_logs)
                     log_lines = log_lines[-5:]
                     await send_auto_hunt_state(update, context, state, log_lines)
-                    await asyncio.sleep(0.6)
+                    await asyncio.sleep(AUTO_HUNT_STEP_DELAY)
                 if battle_over:
                     break
                 if enemy.get("hp", 0) <= 0:
@@ -5580,48 +8688,11 @@ async def run_auto_hunt_loop(
                     if not stats:
                         break
                     enemy_data = state.battle_enemies[0] if state.battle_enemies else enemy
-                    total_xp = enemy_data.get("xp", 0)
-                    total_gold = enemy_data.get("gold", 0)
-                    stats["kills"] = stats.get("kills", 0) + 1
-                    stats["gained_gold"] = stats.get("gained_gold", 0) + total_gold
-                    before_levels = {
-                        cid: state.party[cid].level for cid in state.party_order if state.party.get(cid)
-                    }
-                    for cid in state.party_order:
-                        stats["gained_xp"].setdefault(cid, 0)
-                        stats["gained_xp"][cid] += total_xp
-                        state.xp_pool[cid] = state.xp_pool.get(cid, 0) + total_xp
-                    state.gold += total_gold
-                    check_level_up(state)
-                    leveled = []
-                    for cid in state.party_order:
-                        character = state.party.get(cid)
-                        if not character:
-                            continue
-                        prev = before_levels.get(cid, character.level)
-                        if character.level > prev:
-                            stats["last_level_up_xp"][cid] = state.xp_pool.get(cid, 0)
-                            leveled.append(f"{character.name} naik ke Level {character.level}!")
-                    drop_logs, drop_details = grant_battle_drops(state)
-                    for item_id, qty in drop_details:
-                        stats["items_gained"][item_id] = stats["items_gained"].get(item_id, 0) + qty
-                    quest_logs = update_hunt_quest_progress(state, [enemy_data.get("id")])
-                    state.flags["LAST_BATTLE_RESULT"] = "WIN"
-                    state.in_battle = False
-                    state.battle_enemies = []
-                summary_lines = [
-                    f"{enemy_data['name']} dikalahkan!",
-                    f"EXP +{total_xp} / Gold +{total_gold}",
-                ]
-                if drop_logs:
-                    summary_lines.append("Drop: " + ", ".join(drop_logs))
-                if quest_logs:
-                    summary_lines.extend(quest_logs)
-                summary_lines.extend(leveled)
+                    summary_lines, _, _ = apply_auto_hunt_victory(state, stats, enemy_data)
                 log_lines.extend(summary_lines)
                 log_lines = log_lines[-5:]
                 await send_auto_hunt_state(update, context, state, log_lines)
-                await asyncio.sleep(0.6)
+                await asyncio.sleep(AUTO_HUNT_STEP_DELAY)
                 continue
             break
     except Exception:
@@ -5637,6 +8708,205 @@ async def run_auto_hunt_loop(
     await stop_auto_hunt(update, context, state, reason=stop_reason or "Auto hunting selesai.")
 
 
+FAST_HUNT_BATTLES = 10  # batas battle per sesi fast hunt (jalur auto hunting pemain)
+FAST_HUNT_COOLDOWN = 30.0  # detik jeda minimum antar sesi fast hunt per pemain; admin tidak dibatasi
+LIVE_AUTO_HUNT_ADMIN_ONLY = True  # loop beranimasi (edit + lock per aksi) hanya untuk debug admin
+AUTO_HUNT_MAX_ROUNDS = 50  # pengaman supaya battle tanpa jeda tidak berputar selamanya
+AUTO_HUNT_STEP_DELAY = 0.6  # detik jeda antar langkah auto hunting yang ditampilkan
+
+
+@dataclass
+class AutoBattleResult:
+    outcome: str  # "WIN", "LOSE", atau "DRAW"
+    enemy: Dict[str, Any]
+    rounds: int
+    logs: List[str] = field(default_factory=list)
+
+
+def apply_auto_hunt_victory(
+    state: GameState, stats: Dict[str, Any], enemy_data: Dict[str, Any]
+) -> Tuple[List[str], List[str], List[HuntQuestProgress]]:
+    """Bagikan EXP, gold, drop, dan progress quest setelah menang auto hunting.
+
+    Hasil: (baris ringkasan, baris level up, progress quest hunt).
+    """
+
+    total_xp = enemy_data.get("xp", 0)
+    total_gold = enemy_data.get("gold", 0)
+    stats["kills"] = stats.get("kills", 0) + 1
+    stats["gained_gold"] = stats.get("gained_gold", 0) + total_gold
+    before_levels = {
+        cid: state.party[cid].level for cid in state.party_order if state.party.get(cid)
+    }
+    for cid in state.party_order:
+        stats["gained_xp"].setdefault(cid, 0)
+        stats["gained_xp"][cid] += total_xp
+        state.xp_pool[cid] = state.xp_pool.get(cid, 0) + total_xp
+    state.gold += total_gold
+    check_level_up(state)
+    leveled = []
+    for cid in state.party_order:
+        character = state.party.get(cid)
+        if not character:
+            continue
+        prev = before_levels.get(cid, character.level)
+        if character.level > prev:
+            stats["last_level_up_xp"][cid] = state.xp_pool.get(cid, 0)
+            leveled.append(f"{character.name} naik ke Level {character.level}!")
+    drop_logs, drop_details = grant_battle_drops(state)
+    for item_id, qty in drop_details:
+        stats["items_gained"][item_id] = stats["items_gained"].get(item_id, 0) + qty
+    quest_updates = advance_hunt_quests(state, [enemy_data.get("id")])
+    state.scratch.last_battle_result = "WIN"
+    state.in_battle = False
+    state.battle_enemies = []
+    summary_lines = [
+        f"{enemy_data['name']} dikalahkan!",
+        f"EXP +{total_xp} / Gold +{total_gold}",
+    ]
+    if drop_logs:
+        summary_lines.append("Drop: " + ", ".join(drop_logs))
+    summary_lines.extend(format_hunt_quest_progress(quest_updates))
+    summary_lines.extend(leveled)
+    return summary_lines, leveled, quest_updates
+
+
+def simulate_auto_hunt_battle(state: GameState, area_id: str) -> AutoBattleResult:
+    """Satu battle auto hunting penuh tanpa I/O dan tanpa jeda, memakai aksi auto yang sama."""
+
+    area_info = HUNTING_AREAS.get(area_id, {})
+    battle_area = area_info.get("area_key", area_id)
+    content = CONTENT.current
+    enemy = pick_random_monster_for_area(battle_area, average_party_level(state), content)
+    state.in_battle = True
+    state.battle_enemies = [enemy]
+    reset_battle_flags(state)
+    state.battle_state.content = content
+    state.scratch.current_battle_area = battle_area
+    state.scratch.last_battle_source = {"type": "AUTO_HUNT", "area": area_id}
+    logs: List[str] = []
+    for round_no in range(1, AUTO_HUNT_MAX_ROUNDS + 1):
+        for cid in state.party_order:
+            character = state.party.get(cid)
+            if character and character.hp > 0:
+                action_logs, defeated = perform_auto_player_action(state, character, enemy)
+                logs.extend(action_logs)
+                if defeated:
+                    return AutoBattleResult("WIN", enemy, round_no, logs)
+            if not living_party_members(state):
+                return AutoBattleResult("LOSE", enemy, round_no, logs)
+        enemy_logs, party_defeated = perform_auto_enemy_attack(state, enemy)
+        logs.extend(enemy_logs)
+        if party_defeated:
+            return AutoBattleResult("LOSE", enemy, round_no, logs)
+        if enemy.get("hp", 0) <= 0:
+            return AutoBattleResult("WIN", enemy, round_no, logs)
+    return AutoBattleResult("DRAW", enemy, AUTO_HUNT_MAX_ROUNDS, logs)
+
+
+def fast_forward_auto_hunt(state: GameState, area_id: str, battles: int) -> List[str]:
+    """Jalankan beberapa battle auto hunting sekaligus dan kembalikan baris ringkasannya."""
+
+    stats = state.auto_hunt_stats
+    fought = wins = 0
+    party_lost = False
+    leveled: List[str] = []
+    quest_progress: Dict[str, HuntQuestProgress] = {}
+    for _ in range(battles):
+        if not living_party_members(state):
+            party_lost = True
+            break
+        result = simulate_auto_hunt_battle(state, area_id)
+        fought += 1
+        if result.outcome == "WIN":
+            wins += 1
+            _, battle_leveled, battle_quests = apply_auto_hunt_victory(state, stats, result.enemy)
+            leveled.extend(battle_leveled)
+            for entry in battle_quests:
+                # Gabungkan per quest: progress terakhir, total tambahan, selesai bila pernah selesai.
+                merged = quest_progress.get(entry.quest_id)
+                if merged is not None:
+                    entry.gained += merged.gained
+                    entry.completed = entry.completed or merged.completed
+                quest_progress[entry.quest_id] = entry
+            continue
+        state.in_battle = False
+        state.battle_enemies = []
+        if result.outcome == "LOSE":
+            state.scratch.last_battle_result = "LOSE"
+            party_lost = True
+            break
+    lines = [f"⏩ Fast hunt: {fought} pertarungan, {wins} menang."]
+    if party_lost:
+        lines.append("Seluruh party tumbang, fast hunt dihentikan.")
+    items = stats.get("items_gained", {})
+    if items:
+        item_parts = [f"{ITEMS.get(item_id, {}).get('name', item_id)} x{qty}" for item_id, qty in items.items()]
+        lines.append("Item: " + ", ".join(item_parts))
+    lines.extend(leveled)
+    lines.extend(format_hunt_quest_progress(list(quest_progress.values())))
+    return lines
+
+
+def live_auto_hunt_allowed(state: GameState) -> bool:
+    return not LIVE_AUTO_HUNT_ADMIN_ONLY or state.user_id in ADMIN_USER_IDS
+
+
+def fast_hunt_cooldown_remaining(state: GameState) -> float:
+    if state.user_id in ADMIN_USER_IDS:
+        return 0.0
+    return max(0.0, state.scratch.fast_hunt_ready_at - time.monotonic())
+
+
+async def handle_auto_hunt_fast_forward(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    state: GameState,
+    area_id: str,
+):
+    query = update.callback_query
+    error = check_auto_hunt_start(state, area_id)
+    if error:
+        if query:
+            await query.answer(error, show_alert=True)
+        return
+    remaining = fast_hunt_cooldown_remaining(state)
+    if remaining > 0:
+        if query:
+            await query.answer(
+                f"Party masih beristirahat. Auto hunting bisa lagi dalam {math.ceil(remaining)} detik.",
+                show_alert=True,
+            )
+        return
+    state.last_hunt_area = area_id
+    state.auto_hunt_stats = build_auto_hunt_stats(state, area_id)
+    summary_lines = fast_forward_auto_hunt(state, area_id, FAST_HUNT_BATTLES)
+    state.scratch.fast_hunt_ready_at = time.monotonic() + FAST_HUNT_COOLDOWN
+    if state.scratch.last_battle_result == "LOSE":
+        recover_party_after_defeat(state)
+        state.scratch.last_battle_result = None
+    maybe_autosave(state, "fast_hunt")
+    keyboard = InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    f"⏩ Auto Hunting x{FAST_HUNT_BATTLES} lagi", callback_data=f"AUTO_HUNT_FAST|{area_id}"
+                )
+            ],
+            [InlineKeyboardButton("⬅ Kembali ke area", callback_data=f"HUNT_AREA|{area_id}")],
+        ]
+    )
+    await send_auto_hunt_state(
+        update,
+        context,
+        state,
+        summary_lines,
+        reply_markup=keyboard,
+        max_log_lines=len(summary_lines),
+    )
+    reset_auto_hunt_state(state)
+
+
 async def send_shop_buy_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, state: GameState):
     query = update.callback_query
     features = CITY_FEATURES.get(state.location, {})
@@ -5992,8 +9262,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     try:
         async with get_user_lock(user_id):
             state = get_game_state(user_id)
-            awaiting_name = state.flags.get("AWAITING_PLAYER_NAME")
-            if not awaiting_name:
+            if not state.awaiting_player_name:
                 return
             if len(text) < 3:
                 await update.message.reply_text("Nama minimal 3 karakter.")
@@ -6002,7 +9271,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 text = text[:18]
             state.player_name = text
             state.reset_for_new_journey()
-            state.flags.pop("AWAITING_PLAYER_NAME", None)
+            state.awaiting_player_name = False
             greeting = (
                 f"Namamu tercatat sebagai {text}.\n"
                 "500 tahun berlalu sejak kekaisaran runtuh, namun sumpahmu belum padam."
@@ -6027,9 +9296,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             state = get_game_state(user_id)
             needs_name = not state.player_name
             if needs_name:
-                state.flags["AWAITING_PLAYER_NAME"] = True
+                state.awaiting_player_name = True
             else:
-                state.flags.pop("AWAITING_PLAYER_NAME", None)
+                state.awaiting_player_name = False
                 state.ensure_aruna()
         if needs_name:
             prompt = (
@@ -6134,7 +9403,7 @@ async def save_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         async with get_user_lock(user_id):
             state = get_game_state(user_id)
-            success = save_game_state(user_id, state)
+            success = await save_game_state_now(state)
         if update.message:
             if success:
                 logger.info("User %s melakukan manual save (berhasil)", user_id)
@@ -6156,7 +9425,7 @@ async def load_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
         async with get_user_lock(user_id):
-            save_exists = os.path.exists(get_save_path(user_id))
+            save_exists = has_saved_game(user_id)
             loaded = load_game_state(user_id)
             if not loaded:
                 if update.message:
@@ -6171,7 +9440,7 @@ async def load_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 logger.warning("User %s gagal /load (file ada: %s)", user_id, save_exists)
                 return
             loaded.ensure_aruna()
-            USER_STATES[user_id] = loaded
+            SESSION_CACHE.put_state(user_id, loaded)
         if update.message:
             loc_name = LOCATIONS.get(loaded.location, {}).get("name", loaded.location)
             aruna = loaded.party.get("ARUNA")
@@ -6204,7 +9473,7 @@ async def force_save_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         async with get_user_lock(user_id):
             state = get_game_state(user_id)
-            success = save_game_state(user_id, state)
+            success = await save_game_state_now(state)
         if update.message:
             if success:
                 await update.message.reply_text("Save paksa berhasil.")
@@ -6258,6 +9527,34 @@ async def show_state_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for label, value in quest_flags:
             indicator = "✅" if value else "❌"
             lines.append(f"- {label}: {indicator}")
+        autosave_metrics = AUTOSAVE_QUEUE.metrics()
+        lines.append(
+            "Antrian autosave: {depth} menunggu, {written} tertulis, {failed} gagal, "
+            "latensi rata-rata {avg:.1f} ms (maks {max:.1f} ms)".format(
+                depth=autosave_metrics["depth"],
+                written=int(autosave_metrics["written"]),
+                failed=int(autosave_metrics["failed"]),
+                avg=autosave_metrics["avg_latency_ms"],
+                max=autosave_metrics["max_latency_ms"],
+            )
+        )
+        route_rows = CALLBACK_ROUTER.metrics()
+        if route_rows:
+            lines.append("Callback teratas:")
+            for row in route_rows[:8]:
+                lines.append(
+                    f"- {row['name']}: {row['calls']}x, rata-rata {row['avg_ms']:.1f} ms "
+                    f"(maks {row['max_ms']:.1f} ms, error {row['errors']})"
+                )
+        fallback = CALLBACK_ROUTER.fallback_stats
+        if fallback:
+            lines.append(
+                "Callback scene: {choice} pilihan, {scene} scene, {story} fallback".format(
+                    choice=fallback["scene_choice"],
+                    scene=fallback["scene"],
+                    story=fallback["story_fallback"],
+                )
+            )
         if update.message:
             await update.message.reply_text("\n".join(lines))
     except Exception:
@@ -6268,6 +9565,177 @@ async def show_state_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
 
 
+def format_metrics_summary() -> str:
+    lines = ["=== METRICS ===", f"Uptime: {time.time() - METRICS.started_at:.0f} detik, sesi: {len(SESSION_CACHE)}"]
+    sections = (
+        ("Handler", "handler_seconds"),
+        ("Route callback", "callback_route_seconds"),
+        ("Tunggu lock user", "lock_wait_seconds"),
+        ("Bot API", "telegram_api_seconds"),
+        ("Save", "save_seconds"),
+    )
+    for title, name in sections:
+        rows = METRICS.summary(name, limit=6)
+        if not rows:
+            continue
+        lines.append(f"{title}:")
+        for row in rows:
+            lines.append(
+                f"- {row['labels']}: {row['count']}x, rata-rata {row['avg_ms']:.1f} ms, "
+                f"p95 ≤{row['p95_ms']:.1f} ms, maks {row['max_ms']:.1f} ms"
+            )
+    if len(lines) == 2:
+        lines.append("Belum ada data.")
+    if METRICS_PORT:
+        lines.append(f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}{METRICS_PATH}")
+    return "\n".join(lines)
+
+
+async def metrics_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_USER_IDS:
+        if update.message:
+            await update.message.reply_text("Perintah ini khusus admin.")
+        logger.warning("User %s mencoba /metrics tanpa izin", user_id)
+        return
+    try:
+        if context.args and context.args[0] == "reset":
+            METRICS.reset()
+            text = "Metrics direset."
+        else:
+            text = format_metrics_summary()
+        if update.message:
+            await update.message.reply_text(text)
+    except Exception:
+        logger.exception("Error di handler /metrics untuk user %s", user_id)
+        if update.message:
+            await update.message.reply_text("Terjadi kesalahan saat mengambil metrics.")
+
+
+def format_lock_diagnostics(limit: int = 8) -> str:
+    lines = [
+        "=== LOCK USER ===",
+        f"Ambang hold lambat: {LOCK_DIAGNOSTICS.slow_threshold * 1000:.0f} ms",
+    ]
+    sites = LOCK_DIAGNOSTICS.slowest_sites(limit)
+    if sites:
+        lines.append("Pemegang terlama (total hold):")
+        for stats in sites:
+            avg_hold = stats.total_hold / stats.releases * 1000 if stats.releases else 0.0
+            avg_wait = stats.total_wait / stats.acquisitions * 1000 if stats.acquisitions else 0.0
+            lines.append(
+                f"- {stats.site}: {stats.releases}x, hold rata-rata {avg_hold:.1f} ms (maks {stats.max_hold * 1000:.0f} ms), "
+                f"tunggu rata-rata {avg_wait:.1f} ms, lambat {stats.slow_holds}, "
+                f"Telegram {stats.network_calls} panggilan/{stats.network_seconds * 1000:.0f} ms"
+            )
+    held = [
+        lock for lock in SESSION_CACHE.locks.values() if isinstance(lock, TimedLock) and lock.locked()
+    ]
+    if held:
+        lines.append("Sedang dipegang:")
+        for lock in sorted(held, key=lambda item: item.holding_for(), reverse=True)[:limit]:
+            lines.append(f"- user {lock.user_id} di {lock.holder_site}: {lock.holding_for() * 1000:.0f} ms")
+    waiters = sorted(
+        (lock for lock in SESSION_CACHE.locks.values() if isinstance(lock, TimedLock) and lock.total_wait),
+        key=lambda item: item.total_wait,
+        reverse=True,
+    )[:limit]
+    if waiters:
+        lines.append("Total tunggu per user:")
+        for lock in waiters:
+            lines.append(f"- user {lock.user_id}: {lock.total_wait * 1000:.0f} ms dari {lock.acquisitions} acquire")
+    recent = list(LOCK_DIAGNOSTICS.recent_slow)[-limit:]
+    if recent:
+        lines.append("Hold lambat terakhir:")
+        for event in reversed(recent):
+            stamp = datetime.fromtimestamp(event["at"]).strftime("%H:%M:%S")
+            lines.append(
+                f"- {stamp} user {event['user_id']} {event['site']}: {event['hold_ms']:.0f} ms "
+                f"({event['network_calls']} panggilan Telegram)"
+            )
+    if len(lines) == 2:
+        lines.append("Belum ada data lock.")
+    return "\n".join(lines)
+
+
+async def locks_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_USER_IDS:
+        if update.message:
+            await update.message.reply_text("Perintah ini khusus admin.")
+        logger.warning("User %s mencoba /locks tanpa izin", user_id)
+        return
+    try:
+        if context.args and context.args[0] == "reset":
+            LOCK_DIAGNOSTICS.reset()
+            text = "Diagnosa lock direset."
+        else:
+            text = format_lock_diagnostics()
+        if update.message:
+            await update.message.reply_text(text)
+    except Exception:
+        logger.exception("Error di handler /locks untuk user %s", user_id)
+        if update.message:
+            await update.message.reply_text("Terjadi kesalahan saat mengambil diagnosa lock.")
+
+
+def format_content_status() -> str:
+    snapshot = CONTENT.current
+    loaded = datetime.fromtimestamp(snapshot.loaded_at).strftime("%Y-%m-%d %H:%M:%S")
+    overrides = [name for name in CONTENT_TABLE_NAMES if os.path.exists(content_table_path(name))]
+    lines = [
+        "=== KONTEN ===",
+        f"Versi aktif: v{snapshot.version} (dipasang {loaded})",
+        f"Scene: {len(snapshot.scenes)}, item: {len(snapshot.items)}, monster: {len(snapshot.monsters)}, "
+        f"skill: {len(snapshot.skills)}",
+        f"Override tabel: {', '.join(overrides) if overrides else '(bawaan)'}",
+        f"Reload sukses: {CONTENT.reloads}, ditolak: {CONTENT.failures}",
+        f"Auto reload: {'tiap ' + format(CONTENT_WATCH_INTERVAL, 'g') + ' dtk' if CONTENT_WATCH_INTERVAL > 0 else 'mati'}",
+    ]
+    pinned = CONTENT.pinned_battles()
+    old = {version: count for version, count in pinned.items() if version != snapshot.version}
+    if old:
+        lines.append(
+            "Battle masih memakai versi lama: "
+            + ", ".join(f"v{version} ({count})" for version, count in sorted(old.items()))
+        )
+    if CONTENT.last_error is not None:
+        lines.append("Reload terakhir ditolak:")
+        lines.extend(f"- {error}" for error in CONTENT.last_error.errors[:10])
+    return "\n".join(lines)
+
+
+async def reload_content_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_USER_IDS:
+        if update.message:
+            await update.message.reply_text("Perintah ini khusus admin.")
+        logger.warning("User %s mencoba /reload tanpa izin", user_id)
+        return
+    try:
+        if context.args and context.args[0] == "status":
+            text = format_content_status()
+        else:
+            try:
+                snapshot = await CONTENT.reload(f"/reload oleh {user_id}")
+            except ContentValidationError as exc:
+                text = "Reload ditolak, konten lama tetap dipakai:\n" + "\n".join(
+                    f"- {error}" for error in exc.errors[:15]
+                )
+            else:
+                text = (
+                    f"Konten v{snapshot.version} aktif: {len(snapshot.scenes)} scene, "
+                    f"{len(snapshot.items)} item, {len(snapshot.monsters)} monster. "
+                    "Battle yang sedang berjalan tetap memakai versi lamanya."
+                )
+        if update.message:
+            await update.message.reply_text(text)
+    except Exception:
+        logger.exception("Error di handler /reload untuk user %s", user_id)
+        if update.message:
+            await update.message.reply_text("Terjadi kesalahan saat memuat ulang konten.")
+
+
 async def inventory_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
@@ -6333,491 +9801,766 @@ async def quests_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # ==========================
-# CALLBACK QUERY HANDLER
+# CALLBACK ROUTER
 # ==========================
 
-async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    user_id = query.from_user.id
-    try:
-        async with get_user_lock(user_id):
-            state = get_game_state(user_id)
-            data = query.data
-            handled = False
+CallbackHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE, "GameState", str], Any]
 
-            try:
-                # BATTLE-related
-                battle_action_keys = {
-                    "BATTLE_ATTACK",
-                    "BATTLE_DEFEND",
-                    "BATTLE_RUN",
-                    "BATTLE_ITEM",
-                    "BATTLE_SKILL_MENU",
-                    "BATTLE_MENU",
-                    "BATTLE_BACK",
+# Mode argumen route: "none" hanya cocok untuk data persis, "required" butuh
+# argumen setelah "|", "any" cocok untuk keduanya.
+ROUTE_ARG_MODES = ("none", "required", "any")
+
+
+@dataclass
+class CallbackRoute:
+    name: str
+    handler: CallbackHandler
+    args: str = "none"
+    before_scene: bool = False
+    calls: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def accepts(self, has_args: bool) -> bool:
+        if self.args == "any":
+            return True
+        return has_args == (self.args == "required")
+
+
+class CallbackRouter:
+    """Tabel dispatch callback berdasarkan token pertama sebelum "|".
+
+    Route dengan before_scene=True (battle, target, kembali ke kota) dicek
+    sebelum pilihan scene aktif, route lain sesudahnya, sama seperti urutan
+    if-chain lama di button().
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, CallbackRoute] = {}
+        self.fallback_stats: Counter = Counter()
+
+    def route(self, *tokens: str, args: str = "none", before_scene: bool = False):
+        if args not in ROUTE_ARG_MODES:
+            raise ValueError(f"Mode argumen route tidak dikenal: {args}")
+
+        def decorator(func: CallbackHandler) -> CallbackHandler:
+            for token in tokens:
+                if token in self.routes:
+                    raise ValueError(f"Route callback ganda: {token}")
+                self.routes[token] = CallbackRoute(token, func, args, before_scene)
+            return func
+
+        return decorator
+
+    def resolve(self, data: str) -> Optional[CallbackRoute]:
+        token, sep, _ = data.partition("|")
+        route = self.routes.get(token)
+        if route is None or not route.accepts(bool(sep)):
+            return None
+        return route
+
+    async def _run(
+        self,
+        route: CallbackRoute,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        state: "GameState",
+        data: str,
+    ) -> None:
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context, state, data)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            METRICS.observe("callback_route_seconds", elapsed, route=route.name)
+            elapsed_ms = elapsed * 1000
+            route.calls += 1
+            route.total_ms += elapsed_ms
+            route.max_ms = max(route.max_ms, elapsed_ms)
+
+    async def dispatch_data(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        state: "GameState",
+        data: str,
+    ) -> bool:
+        """Jalankan route untuk data tanpa fallback scene; False jika tidak ada route yang cocok."""
+
+        route = self.resolve(data)
+        if route is None:
+            return False
+        await self._run(route, update, context, state, data)
+        return True
+
+    async def dispatch(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        state: "GameState",
+        data: str,
+    ) -> None:
+        route = self.resolve(data)
+        if route and route.before_scene:
+            await self._run(route, update, context, state, data)
+            return
+        if get_scene_choice(state.scene_id, data):
+            self.fallback_stats["scene_choice"] += 1
+            with METRICS.timer("callback_route_seconds", route="scene_choice"):
+                await handle_scene_choice(update, context, state, data)
+            return
+        if route:
+            await self._run(route, update, context, state, data)
+            return
+        if data in SCENES:
+            self.fallback_stats["scene"] += 1
+            with METRICS.timer("callback_route_seconds", route="scene"):
+                await render_scene(update, context, state, data)
+            return
+        # SCENE / STORY CHOICE
+        self.fallback_stats["story_fallback"] += 1
+        with METRICS.timer("callback_route_seconds", route="story_fallback"):
+            await handle_scene_choice(update, context, state, data)
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        rows = []
+        for route in self.routes.values():
+            if not route.calls:
+                continue
+            rows.append(
+                {
+                    "name": route.name,
+                    "calls": route.calls,
+                    "errors": route.errors,
+                    "avg_ms": route.total_ms / route.calls,
+                    "max_ms": route.max_ms,
                 }
-                action_key = data.split("|", 1)[0]
-                if action_key in battle_action_keys:
-                    handled = True
-                    if not state.in_battle:
-                        await safe_edit_text(query, "Kamu tidak sedang dalam battle.")
-                        return
-                    if state.auto_hunt:
-                        await query.answer(
-                            "Kamu sedang auto hunting. Tekan '⛔ Hentikan Auto Hunting' untuk kembali ke mode manual.",
-                            show_alert=True,
-                        )
-                        return
-                    await process_battle_action(update, context, state, data)
-                    return
-
-                if data.startswith("USE_SKILL|"):
-                    handled = True
-                    # format: USE_SKILL|CHAR_ID|SKILL_ID
-                    parts = parse_callback_parts(data, 3)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, char_id, skill_id = parts[:3]
-                    if not state.in_battle:
-                        await safe_edit_text(query, "Kamu tidak sedang dalam battle.")
-                        return
-                    if state.auto_hunt:
-                        await query.answer(
-                            "Kamu sedang auto hunting. Tekan '⛔ Hentikan Auto Hunting' untuk kembali ke mode manual.",
-                            show_alert=True,
-                        )
-                        return
-                    await process_use_skill(update, context, state, char_id, skill_id)
-                    return
-
-                if data.startswith("USE_ITEM|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    item_id = parts[1]
-                    if not state.in_battle:
-                        await safe_edit_text(query, "Kamu tidak sedang dalam battle.")
-                        return
-                    if state.auto_hunt:
-                        await query.answer(
-                            "Kamu sedang auto hunting. Tekan '⛔ Hentikan Auto Hunting' untuk kembali ke mode manual.",
-                            show_alert=True,
-                        )
-                        return
-                    await process_use_item(update, context, state, item_id)
-                    return
-
-                if data.startswith("TARGET_ENEMY|") or data.startswith("TARGET_ALLY|"):
-                    handled = True
-                    if not state.in_battle:
-                        await safe_edit_text(query, "Kamu tidak sedang dalam battle.")
-                        return
-                    if state.auto_hunt:
-                        await query.answer(
-                            "Kamu sedang auto hunting. Tekan '⛔ Hentikan Auto Hunting' untuk kembali ke mode manual.",
-                            show_alert=True,
-                        )
-                        return
-                    await process_target_selection(update, context, state, data)
-                    return
-
-                if data == "RETURN_TO_CITY":
-                    handled = True
-                    reset_auto_hunt_state(state)
-                    await send_city_menu(update, context, state)
-                    return
-
-                current_scene = get_scene(state.scene_id)
-                if current_scene and find_choice_by_callback(current_scene, data):
-                    handled = True
-                    await handle_scene_choice(update, context, state, data)
-                    return
-
-                # WORLD MAP / TRAVEL
-                if data.startswith("GOTO_CITY|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, loc_id = parts[:2]
-                    loc_info = LOCATIONS.get(loc_id)
-                    if not loc_info:
-                        logger.warning(
-                            "Lokasi callback tidak dikenal dari user %s: %s", user_id, loc_id
-                        )
-                        await notify_unknown_callback(
-                            update,
-                            "Lokasi ini tidak dikenal. Kamu akan dikembalikan ke peta dunia.",
-                        )
-                        await send_world_map(update, context, state)
-                        return
-                    aruna = state.party.get("ARUNA")
-                    if not aruna:
-                        state.ensure_aruna()
-                        aruna = state.party.get("ARUNA")
-                    if not aruna:
-                        logger.error("State user %s tidak memiliki Aruna saat cek level", user_id)
-                        await notify_unknown_callback(update)
-                        return
-                    if aruna.level < loc_info["min_level"]:
-                        text = (
-                            f"Level kamu ({aruna.level}) belum cukup untuk masuk ke {loc_info['name']} "
-                            f"(butuh Lv {loc_info['min_level']})."
-                        )
-                        keyboard = make_keyboard([("Kembali ke map", "GO_TO_WORLD_MAP")])
-                        await safe_edit_text(query, text=text, reply_markup=keyboard)
-                        return
-                    previous_location = state.location
-                    state.location = loc_id
-                    logger.info(
-                        "User %s berpindah kota dari %s ke %s",
-                        user_id,
-                        previous_location,
-                        loc_id,
-                    )
-                    if loc_id == "SIAK" and not state.flags.get("VISITED_SIAK"):
-                        state.flags["VISITED_SIAK"] = True
-                        note = trigger_checkpoint_autosave(
-                            state, "visit_siak", notify=True
-                        )
-                        await render_scene(
-                            update,
-                            context,
-                            state,
-                            "CH1_SIAK_ENTRY",
-                            extra_text=note or "",
-                        )
-                    elif loc_id == "RENGAT" and not state.flags.get("VISITED_RENGAT"):
-                        state.flags["VISITED_RENGAT"] = True
-                        note = trigger_checkpoint_autosave(
-                            state, "visit_rengat", notify=True
-                        )
-                        await render_scene(
-                            update,
-                            context,
-                            state,
-                            "CH2_RENGAT_GATE",
-                            extra_text=note or "",
-                        )
-                    elif loc_id == "PEKANBARU" and not state.flags.get("VISITED_PEKANBARU"):
-                        state.flags["VISITED_PEKANBARU"] = True
-                        note = trigger_checkpoint_autosave(
-                            state, "visit_pekanbaru", notify=True
-                        )
-                        await render_scene(
-                            update,
-                            context,
-                            state,
-                            "CH3_PEKANBARU_ENTRY",
-                            extra_text=note or "",
-                        )
-                    elif loc_id == "KAMPAR" and not state.flags.get("VISITED_KAMPAR"):
-                        state.flags["VISITED_KAMPAR"] = True
-                        note = trigger_checkpoint_autosave(
-                            state, "visit_kampar", notify=True
-                        )
-                        await render_scene(
-                            update,
-                            context,
-                            state,
-                            "CH4_KAMPAR_ENTRY",
-                            extra_text=note or "",
-                        )
-                    else:
-                        await send_city_menu(update, context, state)
-                    return
-
-                if data == "MENU_GUILD":
-                    handled = True
-                    await send_guild_menu(update, context, state)
-                    return
-                if data.startswith("GUILD_ACCEPT|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    await handle_guild_accept(update, context, state, parts[1])
-                    return
-                if data.startswith("GUILD_CLAIM|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    await handle_guild_claim(update, context, state, parts[1])
-                    return
-                if data == "MENU_HUNTING":
-                    handled = True
-                    await send_hunting_menu(update, context, state)
-                    return
-                if data.startswith("HUNT_AREA|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    await send_hunting_area_menu(update, context, state, parts[1])
-                    return
-                if data.startswith("HUNT_BATTLE|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    await start_random_battle_in_area(update, context, state, parts[1])
-                    return
-                if data.startswith("AUTO_HUNT_ON|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    await handle_auto_hunt_toggle(update, context, state, parts[1], True)
-                    return
-                if data == "AUTO_HUNT_OFF":
-                    handled = True
-                    await handle_auto_hunt_toggle(update, context, state, state.auto_hunt_area, False)
-                    return
-
-                # MENU KOTA
-                if data == "MENU_STATUS":
-                    handled = True
-                    lines = ["=== STATUS PARTY ==="]
-                    for cid in state.party_order:
-                        c = state.party.get(cid)
-                        if not c:
-                            continue
-                        lines.append(format_effective_stat_summary(c))
-                    loc_info = LOCATIONS.get(state.location)
-                    loc_name = loc_info.get("name") if loc_info else state.location
-                    lines.append(f"\nGold: {state.gold}")
-                    lines.append(f"Lokasi: {loc_name}")
-                    lines.append(f"Main Quest: {state.main_progress}")
-                    text = "\n".join(lines)
-                    keyboard = make_keyboard([("Kembali ke kota", "BACK_CITY_MENU")])
-                    await safe_edit_text(query, text=text, reply_markup=keyboard)
-                    return
-
-                if data == "BACK_CITY_MENU":
-                    handled = True
-                    await send_city_menu(update, context, state)
-                    return
-
-                if data == "MENU_SHOP":
-                    handled = True
-                    await send_shop_menu(update, context, state)
-                    return
-                if data == "SHOP_BUY":
-                    handled = True
-                    await send_shop_buy_menu(update, context, state)
-                    return
-                if data == "SHOP_SELL":
-                    handled = True
-                    await send_shop_sell_menu(update, context, state)
-                    return
-                if data.startswith("BUY_ITEM|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    item_id = parts[1]
-                    await handle_buy_item(update, context, state, item_id)
-                    return
-                if data.startswith("SELL_ITEM|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    item_id = parts[1]
-                    await handle_sell_item(update, context, state, item_id)
-                    return
-
-                if data == "MENU_INN":
-                    handled = True
-                    cost = CITY_FEATURES.get(state.location, {}).get("inn_cost", 0)
-                    if cost > state.gold:
-                        text = f"Biaya penginapan {cost} Gold, tapi Gold-mu tidak cukup."
-                    else:
-                        state.gold -= cost
-                        for cid in state.party_order:
-                            c = state.party.get(cid)
-                            if not c:
-                                continue
-                            c.hp = get_effective_max_hp(c)
-                            c.mp = get_effective_max_mp(c)
-                        if cost == 0:
-                            text = "Kamu beristirahat gratis. HP & MP seluruh party pulih."
-                        else:
-                            text = (
-                                f"Kamu membayar {cost} Gold dan beristirahat di penginapan. "
-                                "HP & MP seluruh party pulih."
-                            )
-                    keyboard = make_keyboard([("Kembali ke kota", "BACK_CITY_MENU")])
-                    await safe_edit_text(query, text=text, reply_markup=keyboard)
-                    return
-
-                if data == "MENU_CLINIC":
-                    handled = True
-                    if state.location != "SIAK":
-                        await safe_edit_text(query, 
-                            "Klinik hanya ada di Siak.",
-                            reply_markup=make_keyboard([("Kembali", "BACK_CITY_MENU")]),
-                        )
-                        return
-                    if not state.flags.get("HAS_UMAR"):
-                        await render_scene(update, context, state, "CH1_UMAR_CLINIC")
-                    else:
-                        hero_name = state.player_name or (
-                            state.party.get("ARUNA").name if state.party.get("ARUNA") else "Ksatria"
-                        )
-                        text = (
-                            f"Umar: \"Jaga dirimu baik-baik, {hero_name}. Aku di sini kalau kau butuh bantuan.\"\n"
-                        )
-                        keyboard = make_keyboard([("Kembali ke kota", "BACK_CITY_MENU")])
-                        await safe_edit_text(query, text=text, reply_markup=keyboard)
-                    return
-
-                if data == "MENU_EQUIPMENT":
-                    handled = True
-                    await send_equipment_menu(update, context, state)
-                    return
-                if data.startswith("EQUIP_CHAR|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, char_id = parts[:2]
-                    await send_character_equipment_menu(update, context, state, char_id)
-                    return
-                if data.startswith("EQUIP_WEAPON|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 3)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, char_id, item_id = parts[:3]
-                    await handle_equip_item_selection(
-                        update, context, state, char_id, item_id, slot_type="weapon"
-                    )
-                    return
-                if data.startswith("EQUIP_ARMOR|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 3)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, char_id, item_id = parts[:3]
-                    await handle_equip_item_selection(
-                        update, context, state, char_id, item_id, slot_type="armor"
-                    )
-                    return
-                if data.startswith("EQUIP_ITEM|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 3)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, char_id, item_id = parts[:3]
-                    item = ITEMS.get(item_id)
-                    slot_type = item.get("type") if item else "weapon"
-                    await handle_equip_item_selection(
-                        update, context, state, char_id, item_id, slot_type=slot_type
-                    )
-                    return
-                if data.startswith("UNEQUIP|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 3)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    _, char_id, slot = parts[:3]
-                    await handle_unequip_selection(update, context, state, char_id, slot)
-                    return
-
-                if data == "MENU_INVENTORY":
-                    handled = True
-                    await send_inventory_menu(update, context, state)
-                    return
-                if data.startswith("USE_ITEM_OUTSIDE|"):
-                    handled = True
-                    parts = parse_callback_parts(data, 2)
-                    if not parts:
-                        await notify_unknown_callback(update)
-                        return
-                    item_id = parts[1]
-                    await handle_use_item_outside(update, context, state, item_id)
-                    return
-
-                if data == "EVENT_SIAK_GATE":
-                    handled = True
-                    await render_scene(update, context, state, "CH1_GATE_ALERT")
-                    return
-
-                if data == "EVENT_PEKANBARU_CAFE":
-                    handled = True
-                    state.flags["PEKANBARU_RUMOR_DONE"] = True
-                    await render_scene(update, context, state, "CH3_PEKANBARU_ENTRY")
-                    return
-
-                if data == "EVENT_KASTIL_ENTRY":
-                    handled = True
-                    await render_scene(update, context, state, "CH4_CASTLE_APPROACH")
-                    return
-
-                if data == "QUEST_UMAR":
-                    handled = True
-                    await render_scene(update, context, state, "SQ_UMAR_INTRO")
-                    return
-
-                if data == "QUEST_REZA":
-                    handled = True
-                    await render_scene(update, context, state, "SQ_REZA_INTRO")
-                    return
-                if data == "QUEST_HARSAN_BLADE":
-                    handled = True
-                    state.flags["QUEST_WEAPON_STARTED"] = True
-                    state.flags["WEAPON_QUEST_STARTED"] = True
-                    await render_scene(update, context, state, "SQ_HARSAN_BLADE_INTRO")
-                    return
-
-                if data == "GO_TO_WORLD_MAP":
-                    handled = True
-                    await send_world_map(update, context, state)
-                    return
-
-                if data in SCENES:
-                    handled = True
-                    await render_scene(update, context, state, data)
-                    return
-
-                # SCENE / STORY CHOICE
-                handled = True
-                await handle_scene_choice(update, context, state, data)
+            )
+        rows.sort(key=lambda row: row["calls"], reverse=True)
+        return rows
+
+
+CALLBACK_ROUTER = CallbackRouter()
+callback_route = CALLBACK_ROUTER.route
+
+
+async def ensure_manual_battle(update: Update, state: "GameState") -> bool:
+    """Pastikan callback battle manual boleh diproses (sedang battle, bukan auto hunt)."""
+
+    query = update.callback_query
+    if not state.in_battle:
+        await safe_edit_text(query, "Kamu tidak sedang dalam battle.")
+        return False
+    if state.auto_hunt:
+        await query.answer(
+            "Kamu sedang auto hunting. Tekan '⛔ Hentikan Auto Hunting' untuk kembali ke mode manual.",
+            show_alert=True,
+        )
+        return False
+    return True
+
+
+# BATTLE-related
+@callback_route(
+    "BATTLE_ATTACK",
+    "BATTLE_DEFEND",
+    "BATTLE_RUN",
+    "BATTLE_ITEM",
+    "BATTLE_SKILL_MENU",
+    "BATTLE_MENU",
+    "BATTLE_BACK",
+    args="any",
+    before_scene=True,
+)
+async def cb_battle_action(update, context, state, data):
+    if not await ensure_manual_battle(update, state):
+        return
+    await process_battle_action(update, context, state, data)
+
+
+@callback_route("USE_SKILL", args="required", before_scene=True)
+async def cb_use_skill(update, context, state, data):
+    # format: USE_SKILL|CHAR_ID|SKILL_ID
+    parts = parse_callback_parts(data, 3)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    _, char_id, skill_id = parts[:3]
+    if not await ensure_manual_battle(update, state):
+        return
+    await process_use_skill(update, context, state, char_id, skill_id)
+
+
+@callback_route("USE_ITEM", args="required", before_scene=True)
+async def cb_use_item(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    if not await ensure_manual_battle(update, state):
+        return
+    await process_use_item(update, context, state, parts[1])
+
+
+@callback_route("TARGET_ENEMY", "TARGET_ALLY", args="required", before_scene=True)
+async def cb_target_selection(update, context, state, data):
+    if not await ensure_manual_battle(update, state):
+        return
+    await process_target_selection(update, context, state, data)
+
+
+@callback_route("RETURN_TO_CITY", before_scene=True)
+async def cb_return_to_city(update, context, state, data):
+    reset_auto_hunt_state(state)
+    await send_city_menu(update, context, state)
+
+
+# WORLD MAP / TRAVEL
+CITY_FIRST_VISITS = {
+    "SIAK": ("VISITED_SIAK", "visit_siak", "CH1_SIAK_ENTRY"),
+    "RENGAT": ("VISITED_RENGAT", "visit_rengat", "CH2_RENGAT_GATE"),
+    "PEKANBARU": ("VISITED_PEKANBARU", "visit_pekanbaru", "CH3_PEKANBARU_ENTRY"),
+    "KAMPAR": ("VISITED_KAMPAR", "visit_kampar", "CH4_KAMPAR_ENTRY"),
+}
+
+
+@callback_route("GOTO_CITY", args="required")
+async def cb_goto_city(update, context, state, data):
+    query = update.callback_query
+    user_id = state.user_id
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    _, loc_id = parts[:2]
+    loc_info = LOCATIONS.get(loc_id)
+    if not loc_info:
+        logger.warning("Lokasi callback tidak dikenal dari user %s: %s", user_id, loc_id)
+        await notify_unknown_callback(
+            update,
+            "Lokasi ini tidak dikenal. Kamu akan dikembalikan ke peta dunia.",
+        )
+        await send_world_map(update, context, state)
+        return
+    aruna = state.party.get("ARUNA")
+    if not aruna:
+        state.ensure_aruna()
+        aruna = state.party.get("ARUNA")
+    if not aruna:
+        logger.error("State user %s tidak memiliki Aruna saat cek level", user_id)
+        await notify_unknown_callback(update)
+        return
+    if aruna.level < loc_info["min_level"]:
+        text = (
+            f"Level kamu ({aruna.level}) belum cukup untuk masuk ke {loc_info['name']} "
+            f"(butuh Lv {loc_info['min_level']})."
+        )
+        keyboard = make_keyboard([("Kembali ke map", "GO_TO_WORLD_MAP")])
+        await safe_edit_text(query, text=text, reply_markup=keyboard)
+        return
+    previous_location = state.location
+    state.location = loc_id
+    logger.info(
+        "User %s berpindah kota dari %s ke %s",
+        user_id,
+        previous_location,
+        loc_id,
+    )
+    first_visit = CITY_FIRST_VISITS.get(loc_id)
+    if first_visit and not state.flags.get(first_visit[0]):
+        flag, checkpoint, scene_id = first_visit
+        state.flags[flag] = True
+        note = trigger_checkpoint_autosave(state, checkpoint, notify=True)
+        await render_scene(update, context, state, scene_id, extra_text=note or "")
+    else:
+        await send_city_menu(update, context, state)
+
+
+@callback_route("MENU_GUILD")
+async def cb_menu_guild(update, context, state, data):
+    await send_guild_menu(update, context, state)
+
+
+@callback_route("GUILD_ACCEPT", args="required")
+async def cb_guild_accept(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await handle_guild_accept(update, context, state, parts[1])
+
+
+@callback_route("GUILD_CLAIM", args="required")
+async def cb_guild_claim(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await handle_guild_claim(update, context, state, parts[1])
+
+
+@callback_route("MENU_HUNTING")
+async def cb_menu_hunting(update, context, state, data):
+    await send_hunting_menu(update, context, state)
+
+
+@callback_route("HUNT_AREA", args="required")
+async def cb_hunt_area(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await send_hunting_area_menu(update, context, state, parts[1])
+
+
+@callback_route("HUNT_BATTLE", args="required")
+async def cb_hunt_battle(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await start_random_battle_in_area(update, context, state, parts[1])
+
+
+@callback_route("AUTO_HUNT_ON", args="required")
+async def cb_auto_hunt_on(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    if not live_auto_hunt_allowed(state):
+        # Tombol lama di riwayat chat: pemain selalu memakai fast hunt tanpa edit per aksi.
+        await handle_auto_hunt_fast_forward(update, context, state, parts[1])
+        return
+    await handle_auto_hunt_toggle(update, context, state, parts[1], True)
+
+
+@callback_route("AUTO_HUNT_FAST", args="required")
+async def cb_auto_hunt_fast(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await handle_auto_hunt_fast_forward(update, context, state, parts[1])
+
+
+@callback_route("AUTO_HUNT_OFF")
+async def cb_auto_hunt_off(update, context, state, data):
+    await handle_auto_hunt_toggle(update, context, state, state.auto_hunt_area, False)
+
+
+# MENU KOTA
+@callback_route("MENU_STATUS")
+async def cb_menu_status(update, context, state, data):
+    lines = ["=== STATUS PARTY ==="]
+    for cid in state.party_order:
+        c = state.party.get(cid)
+        if not c:
+            continue
+        lines.append(format_effective_stat_summary(c))
+    loc_info = LOCATIONS.get(state.location)
+    loc_name = loc_info.get("name") if loc_info else state.location
+    lines.append(f"\nGold: {state.gold}")
+    lines.append(f"Lokasi: {loc_name}")
+    lines.append(f"Main Quest: {state.main_progress}")
+    text = "\n".join(lines)
+    keyboard = make_keyboard([("Kembali ke kota", "BACK_CITY_MENU")])
+    await safe_edit_text(update.callback_query, text=text, reply_markup=keyboard)
+
+
+@callback_route("BACK_CITY_MENU")
+async def cb_back_city_menu(update, context, state, data):
+    await send_city_menu(update, context, state)
+
+
+@callback_route("MENU_SHOP")
+async def cb_menu_shop(update, context, state, data):
+    await send_shop_menu(update, context, state)
+
+
+@callback_route("SHOP_BUY")
+async def cb_shop_buy(update, context, state, data):
+    await send_shop_buy_menu(update, context, state)
+
+
+@callback_route("SHOP_SELL")
+async def cb_shop_sell(update, context, state, data):
+    await send_shop_sell_menu(update, context, state)
+
+
+@callback_route("BUY_ITEM", args="required")
+async def cb_buy_item(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await handle_buy_item(update, context, state, parts[1])
+
+
+@callback_route("SELL_ITEM", args="required")
+async def cb_sell_item(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await handle_sell_item(update, context, state, parts[1])
+
+
+@callback_route("MENU_INN")
+async def cb_menu_inn(update, context, state, data):
+    cost = CITY_FEATURES.get(state.location, {}).get("inn_cost", 0)
+    if cost > state.gold:
+        text = f"Biaya penginapan {cost} Gold, tapi Gold-mu tidak cukup."
+    else:
+        state.gold -= cost
+        for cid in state.party_order:
+            c = state.party.get(cid)
+            if not c:
+                continue
+            c.hp = get_effective_max_hp(c)
+            c.mp = get_effective_max_mp(c)
+        if cost == 0:
+            text = "Kamu beristirahat gratis. HP & MP seluruh party pulih."
+        else:
+            text = (
+                f"Kamu membayar {cost} Gold dan beristirahat di penginapan. "
+                "HP & MP seluruh party pulih."
+            )
+    keyboard = make_keyboard([("Kembali ke kota", "BACK_CITY_MENU")])
+    await safe_edit_text(update.callback_query, text=text, reply_markup=keyboard)
+
+
+@callback_route("MENU_CLINIC")
+async def cb_menu_clinic(update, context, state, data):
+    query = update.callback_query
+    if state.location != "SIAK":
+        await safe_edit_text(query,
+            "Klinik hanya ada di Siak.",
+            reply_markup=make_keyboard([("Kembali", "BACK_CITY_MENU")]),
+        )
+        return
+    if not state.flags.get("HAS_UMAR"):
+        await render_scene(update, context, state, "CH1_UMAR_CLINIC")
+    else:
+        hero_name = state.player_name or (
+            state.party.get("ARUNA").name if state.party.get("ARUNA") else "Ksatria"
+        )
+        text = (
+            f"Umar: \"Jaga dirimu baik-baik, {hero_name}. Aku di sini kalau kau butuh bantuan.\"\n"
+        )
+        keyboard = make_keyboard([("Kembali ke kota", "BACK_CITY_MENU")])
+        await safe_edit_text(query, text=text, reply_markup=keyboard)
+
+
+@callback_route("MENU_EQUIPMENT")
+async def cb_menu_equipment(update, context, state, data):
+    await send_equipment_menu(update, context, state)
+
+
+@callback_route("EQUIP_CHAR", args="required")
+async def cb_equip_char(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    _, char_id = parts[:2]
+    await send_character_equipment_menu(update, context, state, char_id)
+
+
+@callback_route("EQUIP_WEAPON", "EQUIP_ARMOR", "EQUIP_ITEM", args="required")
+async def cb_equip_item(update, context, state, data):
+    parts = parse_callback_parts(data, 3)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    action, char_id, item_id = parts[:3]
+    if action == "EQUIP_WEAPON":
+        slot_type = "weapon"
+    elif action == "EQUIP_ARMOR":
+        slot_type = "armor"
+    else:
+        item = ITEMS.get(item_id)
+        slot_type = item.get("type") if item else "weapon"
+    await handle_equip_item_selection(
+        update, context, state, char_id, item_id, slot_type=slot_type
+    )
+
+
+@callback_route("UNEQUIP", args="required")
+async def cb_unequip(update, context, state, data):
+    parts = parse_callback_parts(data, 3)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    _, char_id, slot = parts[:3]
+    await handle_unequip_selection(update, context, state, char_id, slot)
+
+
+@callback_route("MENU_INVENTORY")
+async def cb_menu_inventory(update, context, state, data):
+    await send_inventory_menu(update, context, state)
+
+
+@callback_route("USE_ITEM_OUTSIDE", args="required")
+async def cb_use_item_outside(update, context, state, data):
+    parts = parse_callback_parts(data, 2)
+    if not parts:
+        await notify_unknown_callback(update)
+        return
+    await handle_use_item_outside(update, context, state, parts[1])
+
+
+# EVENT & QUEST SAMPINGAN
+@callback_route("EVENT_SIAK_GATE")
+async def cb_event_siak_gate(update, context, state, data):
+    await render_scene(update, context, state, "CH1_GATE_ALERT")
+
+
+@callback_route("EVENT_PEKANBARU_CAFE")
+async def cb_event_pekanbaru_cafe(update, context, state, data):
+    state.flags["PEKANBARU_RUMOR_DONE"] = True
+    await render_scene(update, context, state, "CH3_PEKANBARU_ENTRY")
+
+
+@callback_route("EVENT_KASTIL_ENTRY")
+async def cb_event_kastil_entry(update, context, state, data):
+    await render_scene(update, context, state, "CH4_CASTLE_APPROACH")
+
+
+@callback_route("QUEST_UMAR")
+async def cb_quest_umar(update, context, state, data):
+    await render_scene(update, context, state, "SQ_UMAR_INTRO")
+
+
+@callback_route("QUEST_REZA")
+async def cb_quest_reza(update, context, state, data):
+    await render_scene(update, context, state, "SQ_REZA_INTRO")
+
+
+@callback_route("QUEST_HARSAN_BLADE")
+async def cb_quest_harsan_blade(update, context, state, data):
+    state.flags["QUEST_WEAPON_STARTED"] = True
+    state.flags["WEAPON_QUEST_STARTED"] = True
+    await render_scene(update, context, state, "SQ_HARSAN_BLADE_INTRO")
+
+
+@callback_route("GO_TO_WORLD_MAP")
+async def cb_go_to_world_map(update, context, state, data):
+    await send_world_map(update, context, state)
+
+
+# ==========================
+# OUTBOX PER CHAT (KIRIM DI LUAR LOCK USER)
+# ==========================
+
+DEFERRABLE_METHODS = frozenset(
+    {
+        "answer",
+        "delete",
+        "delete_message",
+        "edit_message_reply_markup",
+        "edit_message_text",
+        "edit_reply_markup",
+        "edit_text",
+        "reply_text",
+        "send_message",
+    }
+)
+DEFERRED_PROXY_ATTRS = frozenset({"bot", "callback_query", "effective_chat", "effective_message", "message"})
+DEFERRED_EDIT_METHODS = frozenset({"edit_message_text", "edit_text"})
+# (nama metode, metode terikat, args, kwargs, Future hasil atau None bila hasilnya tidak ditunggu)
+DeferredOp = Tuple[str, Callable[..., Any], Tuple[Any, ...], Dict[str, Any], Optional[asyncio.Future]]
+
+
+class DeferredSends:
+    """Buffer panggilan Bot API milik satu task selama fase mutasi state.
+
+    Hanya task yang memanggil begin() yang ditunda; task lain (loop auto
+    hunting, MessageEditScheduler) yang memegang objek proxy yang sama tetap
+    mengirim langsung. Kirim yang ditunda mengembalikan None; kode yang butuh
+    Message hasil kirim memakai defer() dan menunggu Future-nya di luar fase ini.
+    """
+
+    def __init__(self):
+        self.ops: List[DeferredOp] = []
+        self._owner: Optional[asyncio.Task] = None
+
+    def begin(self) -> None:
+        self._owner = asyncio.current_task()
+
+    def end(self) -> None:
+        self._owner = None
+
+    def deferring(self) -> bool:
+        return self._owner is not None and asyncio.current_task() is self._owner
+
+    def wrap(self, name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        async def call(*args, **kwargs):
+            if self.deferring():
+                self.ops.append((name, method, args, kwargs, None))
+                return None
+            return await method(*args, **kwargs)
+
+        return call
+
+    def defer(self, name: str, method: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> asyncio.Future:
+        """Tunda satu panggilan; Future-nya berisi hasil kirim (None bila gagal) setelah outbox mengirim."""
+
+        result = asyncio.get_running_loop().create_future()
+        self.ops.append((name, method, args, kwargs, result))
+        return result
+
+    def drain(self) -> List[DeferredOp]:
+        ops, self.ops = self.ops, []
+        return ops
+
+
+class DeferringProxy:
+    """Bungkus Update/CallbackContext/Message/Bot agar metode kirim masuk ke DeferredSends."""
+
+    __slots__ = ("_target", "_sends")
+
+    def __init__(self, target: Any, sends: DeferredSends):
+        self._target = target
+        self._sends = sends
+
+    def defers_sends(self) -> bool:
+        """True jika kirim dari task ini sedang ditunda (bukan dikirim langsung)."""
+
+        return self._sends.deferring()
+
+    def defer_call(self, name: str, *args, **kwargs) -> asyncio.Future:
+        return self._sends.defer(name, getattr(self._target, name), args, kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if name in DEFERRABLE_METHODS and callable(value):
+            return self._sends.wrap(name, value)
+        if name in DEFERRED_PROXY_ATTRS and value is not None:
+            return DeferringProxy(value, self._sends)
+        return value
+
+
+class ChatOutbox:
+    """Menjaga urutan kirim per chat setelah lock user dilepas.
+
+    reserve() dipanggil selagi lock user masih dipegang dan mengambil posisi
+    antrian; deliver() menunggu giliran posisi sebelumnya lalu mengirim.
+    """
+
+    def __init__(self):
+        self._tails: Dict[int, asyncio.Future] = {}
+        self.stats = {"batches": 0, "sent": 0, "failed": 0}
+
+    def reserve(self, chat_id: int) -> Tuple[int, Optional[asyncio.Future], asyncio.Future]:
+        previous = self._tails.get(chat_id)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[chat_id] = done
+        return chat_id, previous, done
+
+    async def deliver(
+        self,
+        ticket: Tuple[int, Optional[asyncio.Future], asyncio.Future],
+        ops: List[DeferredOp],
+    ) -> None:
+        chat_id, previous, done = ticket
+        try:
+            if previous is not None and not previous.done():
+                await asyncio.shield(previous)
+            if ops:
+                self.stats["batches"] += 1
+            for name, method, args, kwargs, result in ops:
+                value = await self._send(chat_id, name, method, args, kwargs)
+                if result is not None and not result.done():
+                    result.set_result(value)
+        finally:
+            # Penunggu Future tidak boleh menggantung bila pengiriman terhenti di tengah.
+            for op in ops:
+                if op[4] is not None and not op[4].done():
+                    op[4].set_result(None)
+            if not done.done():
+                done.set_result(None)
+            if self._tails.get(chat_id) is done:
+                del self._tails[chat_id]
+
+    async def _send(self, chat_id: int, name: str, method, args, kwargs) -> Any:
+        try:
+            with METRICS.timer("telegram_api_seconds", method=name, source="outbox"):
+                value = await method(*args, **kwargs)
+            self.stats["sent"] += 1
+            return value
+        except BadRequest as exc:
+            if name in DEFERRED_EDIT_METHODS:
+                failed = await handle_edit_failure(exc, edit_fallback_message(method), f"outbox:{name}", chat_id)
+            else:
+                failed = "message is not modified" not in str(exc).lower()
+                if failed:
+                    logger.warning("Gagal %s di chat %s: %s", name, chat_id, exc)
+            if failed:
+                self.stats["failed"] += 1
+        except Exception:
+            self.stats["failed"] += 1
+            logger.exception("Gagal %s di chat %s", name, chat_id)
+        return None
+
+    def metrics(self) -> Dict[str, int]:
+        snapshot = dict(self.stats)
+        snapshot["chats"] = len(self._tails)
+        return snapshot
+
+
+def edit_fallback_message(method: Callable[..., Any]) -> Any:
+    """Message untuk balasan fallback dari metode edit terikat (CallbackQuery atau Message)."""
+
+    owner = getattr(method, "__self__", None)
+    if owner is None:
+        return None
+    if hasattr(owner, "edit_message_text"):
+        return getattr(owner, "message", None)
+    return owner
+
+
+CHAT_OUTBOX = ChatOutbox()
+
+
+# ==========================
+# CALLBACK QUERY HANDLER
+# ==========================
+
+async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Dua fase: ubah state & render di bawah lock user, kirim ke Telegram setelah lock dilepas."""
+
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    chat_id = query.message.chat_id if query.message else user_id
+    sends = DeferredSends()
+    deferred_update = DeferringProxy(update, sends)
+    deferred_context = DeferringProxy(context, sends)
+    try:
+        async with get_user_lock(user_id):
+            state = get_game_state(user_id)
+            data = query.data
+            sends.begin()
+            try:
+                await CALLBACK_ROUTER.dispatch(deferred_update, deferred_context, state, data)
             except Exception:
                 logger.exception("Error di callback handler untuk user %s dengan data %s", user_id, data)
-                await safe_edit_text(query, 
+                await safe_edit_text(deferred_update.callback_query,
                     "Terjadi kesalahan tak terduga. Silakan coba lagi. Jika masalah berlanjut, hubungi admin."
                 )
-                return
-
-            if not handled:
-                logger.warning("Callback tak dikenal dari user %s: %s", user_id, data)
-                await safe_edit_text(query, 
-                    "Maaf, terjadi kesalahan saat memproses pilihanmu. Kamu akan dikembalikan ke peta dunia."
-                )
-                await send_world_map(update, context, state)
+            finally:
+                sends.end()
+                # Tiket diambil selagi lock masih dipegang supaya urutan kirim = urutan mutasi.
+                ticket = CHAT_OUTBOX.reserve(chat_id)
+        await CHAT_OUTBOX.deliver(ticket, sends.drain())
     except Exception:
         logger.exception("Error umum di callback handler untuk user %s", user_id)
-        await safe_edit_text(query, 
+        await safe_edit_text(query,
             "Terjadi kesalahan tak terduga. Silakan coba lagi. Jika masalah berlanjut, hubungi admin."
         )
 
@@ -6826,24 +10569,1083 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # MAIN
 # ==========================
 
-def main():
-    application = ApplicationBuilder().token(TOKEN_BOT).build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("status", status_cmd))
-    application.add_handler(CommandHandler("map", map_cmd))
-    application.add_handler(CommandHandler("save", save_cmd))
-    application.add_handler(CommandHandler("load", load_cmd))
-    application.add_handler(CommandHandler("inventory", inventory_cmd))
-    application.add_handler(CommandHandler("quests", quests_cmd))
-    application.add_handler(CommandHandler("help", help_cmd))
-    application.add_handler(CommandHandler("force_save", force_save_cmd))
-    application.add_handler(CommandHandler("show_state", show_state_cmd))
+# ==========================
+# MODE WEBHOOK
+# ==========================
+
+
+def stop_all_auto_hunts(reason: str) -> int:
+    """Minta semua loop auto hunting berhenti (dipakai saat shutdown)."""
+
+    stopped = 0
+    for state in list(SESSION_CACHE.states.values()):
+        if state.auto_hunt:
+            state.auto_hunt = False
+            if state.auto_hunt_stats:
+                state.auto_hunt_stats["stop_reason"] = reason
+            stopped += 1
+    return stopped
+
+
+def build_webhook_app(application, path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET_TOKEN):
+    """Aplikasi aiohttp: POST update Telegram ke `path`, GET health di WEBHOOK_HEALTH_PATH."""
+
+    status = {"accepting": True, "received": 0, "rejected": 0, "misrouted": 0}
+
+    async def handle_update(request):
+        if not status["accepting"]:
+            return web.Response(status=503, text="shutting down")
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            status["rejected"] += 1
+            return web.Response(status=403)
+        try:
+            payload = await request.json()
+            update = Update.de_json(payload, application.bot)
+        except Exception:
+            status["rejected"] += 1
+            logger.warning("Payload webhook tidak valid dari %s", request.remote)
+            return web.Response(status=400)
+        if SHARD_INDEX is not None and not update_belongs_to_shard(payload, SHARD_INDEX):
+            # State user ini dimiliki shard lain; memprosesnya di sini akan memecah state.
+            status["misrouted"] += 1
+            logger.warning("Update %s salah shard (shard %s)", payload.get("update_id"), SHARD_INDEX)
+            return web.Response(status=421, text="misrouted")
+        status["received"] += 1
+        await application.update_queue.put(update)
+        return web.Response(text="ok")
+
+    async def handle_health(request):
+        body = {
+            "status": "ok" if status["accepting"] else "stopping",
+            "received": status["received"],
+            "rejected": status["rejected"],
+            "misrouted": status["misrouted"],
+            "shard": SHARD_INDEX,
+            "update_queue": application.update_queue.qsize(),
+            "sessions": len(SESSION_CACHE),
+            "autosave": AUTOSAVE_QUEUE.metrics(),
+        }
+        return web.json_response(body, status=200 if status["accepting"] else 503)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get(WEBHOOK_HEALTH_PATH, handle_health)
+    app.router.add_get(METRICS_PATH, handle_metrics_request)
+    app["status"] = status
+    return app
+
+
+async def run_webhook_server(application, host: str, port: int) -> None:
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    if WEBHOOK_URL and SHARD_INDEX is None:  # di mode sharding webhook milik proses front
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    webhook_app = build_webhook_app(application)
+    runner = web.AppRunner(webhook_app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Webhook aktif di http://%s:%s%s", host, port, WEBHOOK_PATH)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Webhook berhenti: menolak update baru dan menyelesaikan antrian...")
+        webhook_app["status"]["accepting"] = False
+        await site.stop()
+        stopped = stop_all_auto_hunts("Server sedang dimatikan. Auto hunting dihentikan.")
+        if stopped:
+            logger.info("%s sesi auto hunting diminta berhenti", stopped)
+        # Application.stop() memproses sisa update_queue dan menunggu task yang berjalan.
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await runner.cleanup()
+
+
+# ==========================
+# SHARDING MULTI-PROSES
+# ==========================
+
+UPDATE_USER_KEYS = (
+    "callback_query",
+    "message",
+    "edited_message",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+    "channel_post",
+    "edited_channel_post",
+)
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ShardRing:
+    """Consistent hash ring: user_id -> shard. Menambah shard hanya memindah ~1/N user."""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        if shard_count < 1:
+            raise ValueError("Jumlah shard minimal 1")
+        self.shard_count = shard_count
+        points = sorted(
+            (_ring_hash(f"shard-{shard}#{node}"), shard)
+            for shard in range(shard_count)
+            for node in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id: Optional[int]) -> int:
+        if self.shard_count == 1 or user_id is None:
+            return 0
+        index = bisect.bisect(self._hashes, _ring_hash(str(user_id))) % len(self._hashes)
+        return self._shards[index]
+
+
+_SHARD_RINGS: Dict[int, ShardRing] = {}
+
+
+def get_shard_ring(shard_count: int) -> ShardRing:
+    ring = _SHARD_RINGS.get(shard_count)
+    if ring is None:
+        ring = ShardRing(shard_count)
+        _SHARD_RINGS[shard_count] = ring
+    return ring
+
+
+def extract_update_user_id(payload: Dict[str, Any]) -> Optional[int]:
+    """user_id pemilik update Telegram mentah (dict); chat.id bila tidak ada pengirim."""
+
+    for key in UPDATE_USER_KEYS:
+        body = payload.get(key)
+        if not isinstance(body, dict):
+            continue
+        sender = body.get("from") or body.get("user")
+        if isinstance(sender, dict) and "id" in sender:
+            return int(sender["id"])
+        chat = body.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return None
+
+
+def update_belongs_to_shard(payload: Dict[str, Any], shard_index: int, shard_count: Optional[int] = None) -> bool:
+    shard_count = SHARD_COUNT if shard_count is None else shard_count
+    return get_shard_ring(shard_count).shard_for(extract_update_user_id(payload)) == shard_index
+
+
+def apply_shard_config(shard_index: int, shard_count: int) -> None:
+    """Konfigurasi proses worker shard: label shard di log.
+
+    Semua shard memakai penyimpanan save yang sama (file per user atau satu database
+    WAL berkunci user_id). Saat --shards berubah, user yang pindah shard tetap
+    menemukan save-nya; setiap proses hanya membuka koneksinya sendiri.
+    """
+
+    global SHARD_INDEX, SHARD_COUNT
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"--shard-index harus 0..{shard_count - 1}")
+    SHARD_INDEX = shard_index
+    SHARD_COUNT = shard_count
+    for handler in logger.handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT.replace("%(name)s", f"%(name)s[shard {shard_index}]")))
+
+
+class ShardForwarder:
+    """Antrian per shard di proses front; satu pengirim per shard menjaga urutan update per user."""
+
+    def __init__(self, targets: List[str], secret_token: str = WEBHOOK_SECRET_TOKEN):
+        self.targets = targets
+        self.ring = get_shard_ring(len(targets))
+        self.secret_token = secret_token
+        self.queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._session = None
+        self.stats = [Counter() for _ in targets]
+
+    def start(self, session) -> None:
+        self._session = session
+        self.queues = [asyncio.Queue(maxsize=SHARD_FORWARD_QUEUE_MAX) for _ in self.targets]
+        self._tasks = [asyncio.create_task(self._sender(shard)) for shard in range(len(self.targets))]
+
+    def submit(self, payload: Dict[str, Any]) -> bool:
+        shard = self.ring.shard_for(extract_update_user_id(payload))
+        try:
+            self.queues[shard].put_nowait(payload)
+        except asyncio.QueueFull:
+            self.stats[shard]["queue_full"] += 1
+            return False
+        self.stats[shard]["queued"] += 1
+        return True
+
+    async def _sender(self, shard: int) -> None:
+        queue = self.queues[shard]
+        url = self.targets[shard]
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret_token} if self.secret_token else {}
+        stats = self.stats[shard]
+        while True:
+            payload = await queue.get()
+            while True:
+                try:
+                    async with self._session.post(url, json=payload, headers=headers) as response:
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                    stats["retries"] += 1
+                    logger.warning("Shard %s tidak bisa dihubungi (%s), mencoba lagi", shard, exc)
+                    await asyncio.sleep(SHARD_FORWARD_RETRY_DELAY)
+                    continue
+                if status == 200:
+                    stats["forwarded"] += 1
+                elif status == 503:
+                    # Worker sedang shutdown/restart; tahan urutan dan coba lagi.
+                    stats["retries"] += 1
+                    await asyncio.sleep(SHARD_FORWARD_RETRY_DELAY)
+                    continue
+                else:
+                    stats["dropped"] += 1
+                    logger.warning("Shard %s menolak update %s (HTTP %s)", shard, payload.get("update_id"), status)
+                break
+            queue.task_done()
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Masih ada update yang belum diteruskan saat front berhenti.")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        return [
+            {"shard": shard, "target": target, "depth": queue.qsize(), **dict(self.stats[shard])}
+            for shard, (target, queue) in enumerate(zip(self.targets, self.queues))
+        ]
+
+
+def build_shard_front_app(forwarder: ShardForwarder, path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET_TOKEN):
+    status = {"accepting": True, "received": 0, "rejected": 0}
+
+    async def handle_update(request):
+        if not status["accepting"]:
+            return web.Response(status=503, text="shutting down")
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            status["rejected"] += 1
+            return web.Response(status=403)
+        try:
+            payload = await request.json()
+        except Exception:
+            status["rejected"] += 1
+            return web.Response(status=400)
+        if not isinstance(payload, dict) or not forwarder.submit(payload):
+            # 503 membuat Telegram mengirim ulang update ini nanti.
+            return web.Response(status=503, text="busy")
+        status["received"] += 1
+        return web.Response(text="ok")
+
+    async def handle_health(request):
+        body = {
+            "status": "ok" if status["accepting"] else "stopping",
+            "role": "front",
+            "received": status["received"],
+            "rejected": status["rejected"],
+            "shards": forwarder.metrics(),
+        }
+        return web.json_response(body, status=200 if status["accepting"] else 503)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get(WEBHOOK_HEALTH_PATH, handle_health)
+    app["status"] = status
+    return app
+
+
+def telegram_api_url(method: str, api_base_url: str = TELEGRAM_API_BASE_URL) -> str:
+    base = api_base_url or "https://api.telegram.org/bot"
+    return f"{base}{TOKEN_BOT}/{method}"
+
+
+async def poll_updates_to_shards(forwarder: ShardForwarder, session, api_base_url: str, stop_event: asyncio.Event) -> None:
+    """getUpdates long polling di front lalu teruskan ke shard (pengganti run_polling)."""
+
+    offset = 0
+    while not stop_event.is_set():
+        try:
+            async with session.post(
+                telegram_api_url("getUpdates", api_base_url),
+                json={"offset": offset, "timeout": 25},
+                timeout=aiohttp.ClientTimeout(total=35),
+            ) as response:
+                body = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+            logger.warning("getUpdates gagal: %s", exc)
+            await asyncio.sleep(1.0)
+            continue
+        for payload in body.get("result", []) if body.get("ok") else []:
+            while not forwarder.submit(payload):
+                await asyncio.sleep(SHARD_FORWARD_RETRY_DELAY)
+            offset = max(offset, int(payload.get("update_id", 0)) + 1)
+
+
+def spawn_shard_workers(shard_count: int, base_port: int, host: str, api_base_url: str) -> List[subprocess.Popen]:
+    """Jalankan worker webhook per shard sebagai proses anak dari script ini."""
+
+    processes = []
+    for shard in range(shard_count):
+        command = [
+            sys.executable,
+            os.path.abspath(sys.argv[0]),
+            "--mode",
+            "webhook",
+            "--host",
+            host,
+            "--port",
+            str(base_port + shard),
+            "--shard-index",
+            str(shard),
+            "--shard-count",
+            str(shard_count),
+        ]
+        if api_base_url:
+            command.extend(["--api-base-url", api_base_url])
+        processes.append(subprocess.Popen(command))
+        logger.info("Worker shard %s dijalankan (pid %s, port %s)", shard, processes[-1].pid, base_port + shard)
+    return processes
+
+
+async def run_shard_front(
+    host: str,
+    port: int,
+    shard_count: int,
+    base_port: int,
+    source: str = "webhook",
+    spawn: bool = False,
+    api_base_url: str = TELEGRAM_API_BASE_URL,
+) -> None:
+    targets = [f"http://{WEBHOOK_LISTEN}:{base_port + shard}{WEBHOOK_PATH}" for shard in range(shard_count)]
+    processes = spawn_shard_workers(shard_count, base_port, WEBHOOK_LISTEN, api_base_url) if spawn else []
+    forwarder = ShardForwarder(targets)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    runner = None
+    async with aiohttp.ClientSession() as session:
+        forwarder.start(session)
+        front_app = build_shard_front_app(forwarder)
+        runner = web.AppRunner(front_app)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        logger.info("Front shard aktif di http://%s:%s%s -> %s shard", host, port, WEBHOOK_PATH, shard_count)
+        poller = None
+        if source == "polling":
+            poller = asyncio.create_task(poll_updates_to_shards(forwarder, session, api_base_url, stop_event))
+        elif WEBHOOK_URL:
+            async with session.post(
+                telegram_api_url("setWebhook", api_base_url),
+                json={"url": WEBHOOK_URL, "secret_token": WEBHOOK_SECRET_TOKEN or None},
+            ) as response:
+                logger.info("setWebhook: HTTP %s", response.status)
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("Front shard berhenti: meneruskan sisa antrian...")
+            front_app["status"]["accepting"] = False
+            if poller is not None:
+                poller.cancel()
+                await asyncio.gather(poller, return_exceptions=True)
+            await site.stop()
+            await forwarder.drain()
+            await forwarder.stop()
+            await runner.cleanup()
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    await asyncio.to_thread(process.wait, 30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+# ==========================
+# FAKE TELEGRAM (UJI LOKAL WEBHOOK)
+# ==========================
+
+
+def build_fake_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"Tester{user_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Tester{user_id}"},
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+
+def build_fake_bot_api_app():
+    """Bot API palsu minimal supaya worker webhook bisa dijalankan tanpa Telegram asli."""
+
+    counters: Counter = Counter()
+    message_ids = {"next": 1}
+
+    async def handle_method(request):
+        method = request.match_info["method"]
+        counters[method] += 1
+        try:
+            params = await request.json()
+        except Exception:
+            params = dict(await request.post())
+        if method == "getMe":
+            result: Any = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Aruna",
+                "username": "fake_aruna_bot",
+                "can_join_groups": False,
+                "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }
+        elif method == "getUpdates":
+            # Update palsu dikirim lewat webhook; long polling cukup menunggu sebentar.
+            await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            result = []
+        elif method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            message_id = params.get("message_id")
+            if not message_id:
+                message_id = message_ids["next"]
+                message_ids["next"] += 1
+            chat_id = int(params.get("chat_id") or 0)
+            result = {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_stats(request):
+        return web.json_response(dict(counters))
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle_method)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+async def run_fake_telegram(
+    api_port: int,
+    target_url: str,
+    count: int,
+    users: int,
+    secret_token: str = WEBHOOK_SECRET_TOKEN,
+) -> None:
+    """Jalankan Bot API palsu lalu kirim `count` update palsu ke webhook target."""
+
+    runner = web.AppRunner(build_fake_bot_api_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+    print(f"Bot API palsu aktif di http://127.0.0.1:{api_port}/bot")
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+    texts = ["/start", "/status", "/help", "/map", "/quests", "/inventory"]
+    statuses: Counter = Counter()
+    health_url = target_url.rsplit("/", 1)[0] + WEBHOOK_HEALTH_PATH
+    async with aiohttp.ClientSession() as session:
+        # Worker baru siap setelah getMe ke Bot API palsu ini berhasil.
+        for _ in range(60):
+            try:
+                async with session.get(health_url) as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+        started = time.perf_counter()
+        for update_id in range(1, count + 1):
+            user_id = 100000 + update_id % max(1, users)
+            payload = build_fake_update(update_id, user_id, texts[update_id % len(texts)])
+            try:
+                async with session.post(target_url, json=payload, headers=headers) as response:
+                    statuses[response.status] += 1
+            except aiohttp.ClientError as exc:
+                statuses[type(exc).__name__] += 1
+        elapsed = time.perf_counter() - started
+        print(f"{count} update terkirim dalam {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f}/s): {dict(statuses)}")
+        try:
+            await asyncio.sleep(1.0)
+            async with session.get(health_url) as response:
+                print(f"Health worker: {await response.text()}")
+        except aiohttp.ClientError as exc:
+            print(f"Health check gagal: {exc}")
+    print("Tekan Ctrl+C untuk mematikan Bot API palsu.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+# ==========================
+# SIMULATOR BALANCE (OFFLINE)
+# ==========================
+
+BALANCE_SIM_CHUNK_SIZE = 2000  # battle per tugas worker; seed diturunkan per chunk
+
+
+@dataclass
+class BalanceSimConfig:
+    level: int = 1
+    party_size: int = 3
+    gear: Tuple[str, ...] = ()
+    battles: int = 10000  # per area
+    seed: int = 0
+
+
+@dataclass
+class BalanceAreaReport:
+    area_id: str
+    battles: int = 0
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+    win_rounds: int = 0
+    hp_lost: int = 0
+    hp_total: int = 0
+    xp: int = 0
+    gold: int = 0
+    seconds: float = 0.0
+
+    def merge(self, other: "BalanceAreaReport") -> None:
+        for name in ("battles", "wins", "losses", "draws", "win_rounds", "hp_lost", "hp_total", "xp", "gold", "seconds"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.battles if self.battles else 0.0
+
+    @property
+    def avg_turns_to_kill(self) -> float:
+        return self.win_rounds / self.wins if self.wins else 0.0
+
+    @property
+    def hp_loss_ratio(self) -> float:
+        return self.hp_lost / self.hp_total if self.hp_total else 0.0
+
+    @property
+    def xp_per_hour(self) -> float:
+        return self.xp * 3600 / self.seconds if self.seconds else 0.0
+
+    @property
+    def gold_per_hour(self) -> float:
+        return self.gold * 3600 / self.seconds if self.seconds else 0.0
+
+
+def build_balance_party(level: int, party_size: int, gear: Iterable[str] = ()) -> GameState:
+    """Party simulasi pada level tertentu, naik level lewat check_level_up seperti di game."""
+
+    state = GameState(user_id=0)
+    state.ensure_aruna()
+    if party_size >= 2:
+        state.add_umar()
+    if party_size >= 3:
+        state.add_reza()
+    for cid in state.party_order:
+        character = state.party[cid]
+        state.xp_pool[cid] = sum(
+            xp_required_for_next_level(lv) for lv in range(character.level, max(level, character.level))
+        )
+    check_level_up(state)
+    for item_id in gear:
+        item = ITEMS.get(item_id)
+        if not item:
+            raise ValueError(f"Item tidak dikenal: {item_id}")
+        for cid in state.party_order:
+            adjust_inventory(state, item_id, 1)
+            ok, _ = equip_item(state, cid, item_id, expected_type=item.get("type"))
+            if not ok:
+                adjust_inventory(state, item_id, -1)
+    for character in state.party.values():
+        character.hp = get_effective_max_hp(character)
+        character.mp = get_effective_max_mp(character)
+    return state
+
+
+def estimate_auto_battle_seconds(rounds: int, party_size: int) -> float:
+    """Perkiraan durasi battle di run_auto_hunt_loop: intro, aksi tiap member, serangan musuh, ringkasan."""
+
+    return AUTO_HUNT_STEP_DELAY * (2 + rounds * (party_size + 1))
+
+
+def simulate_balance_chunk(area_id: str, config: BalanceSimConfig, chunk: int, battles: int) -> BalanceAreaReport:
+    """Jalankan sejumlah battle auto di satu area; tiap battle mulai dengan party penuh."""
+
+    random.seed(f"{config.seed}:{area_id}:{chunk}")
+    state = build_balance_party(config.level, config.party_size, config.gear)
+    members = [state.party[cid] for cid in state.party_order]
+    full = [(member.hp, member.mp) for member in members]
+    hp_total = sum(hp for hp, _ in full)
+    report = BalanceAreaReport(area_id)
+    for _ in range(battles):
+        for member, (hp, mp) in zip(members, full):
+            member.hp = hp
+            member.mp = mp
+        result = simulate_auto_hunt_battle(state, area_id)
+        report.battles += 1
+        report.hp_total += hp_total
+        report.hp_lost += hp_total - sum(max(0, member.hp) for member in members)
+        report.seconds += estimate_auto_battle_seconds(result.rounds, len(members))
+        if result.outcome == "WIN":
+            report.wins += 1
+            report.win_rounds += result.rounds
+            report.xp += result.enemy.get("xp", 0)
+            report.gold += result.enemy.get("gold", 0)
+        elif result.outcome == "LOSE":
+            report.losses += 1
+        else:
+            report.draws += 1
+    state.in_battle = False
+    state.battle_enemies = []
+    return report
+
+
+def _run_balance_task(task: Tuple[str, BalanceSimConfig, int, int]) -> BalanceAreaReport:
+    return simulate_balance_chunk(*task)
+
+
+def run_balance_simulation(
+    config: BalanceSimConfig,
+    area_ids: Optional[Iterable[str]] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, BalanceAreaReport]:
+    """Simulasi Monte Carlo per HUNTING_AREAS, dibagi per chunk ke process pool.
+
+    Seed tiap chunk diturunkan dari (seed, area, nomor chunk), jadi hasilnya sama
+    berapa pun jumlah worker dan urutan selesainya.
+    """
+
+    area_ids = list(area_ids or HUNTING_AREAS)
+    for area_id in area_ids:
+        if area_id not in HUNTING_AREAS:
+            raise ValueError(f"Area berburu tidak dikenal: {area_id}")
+    for item_id in config.gear:
+        if item_id not in ITEMS:
+            raise ValueError(f"Item tidak dikenal: {item_id}")
+    tasks: List[Tuple[str, BalanceSimConfig, int, int]] = []
+    for area_id in area_ids:
+        remaining = config.battles
+        chunk = 0
+        while remaining > 0:
+            size = min(BALANCE_SIM_CHUNK_SIZE, remaining)
+            tasks.append((area_id, config, chunk, size))
+            remaining -= size
+            chunk += 1
+    if workers == 1:
+        results = [_run_balance_task(task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_balance_task, tasks))
+    reports = {area_id: BalanceAreaReport(area_id) for area_id in area_ids}
+    for result in results:
+        reports[result.area_id].merge(result)
+    return reports
+
+
+def print_balance_report(config: BalanceSimConfig, reports: Dict[str, BalanceAreaReport]) -> None:
+    gear = ", ".join(config.gear) or "-"
+    print(
+        f"Simulasi balance: Lv {config.level}, party {config.party_size}, gear {gear}, "
+        f"{config.battles} battle/area, seed {config.seed}"
+    )
+    print(
+        f"{'area':<20}{'battle':>8}{'menang':>9}{'draw':>7}{'giliran':>9}"
+        f"{'HP hilang':>11}{'XP/jam':>10}{'gold/jam':>10}"
+    )
+    for area_id, report in reports.items():
+        print(
+            f"{area_id:<20}{report.battles:>8}{report.win_rate:>8.1%}"
+            f"{report.draws / report.battles if report.battles else 0:>7.1%}"
+            f"{report.avg_turns_to_kill:>9.2f}{report.hp_loss_ratio:>11.1%}"
+            f"{report.xp_per_hour:>10.0f}{report.gold_per_hour:>10.0f}"
+        )
+
+
+# ==========================
+# ALAT CLI (KONVERSI SAVE & BENCHMARK)
+# ==========================
+
+
+def build_sample_game_state(user_id: int = 0) -> GameState:
+    """State contoh dengan party lengkap, inventory dan quest aktif."""
+
+    state = GameState(user_id=user_id)
+    state.player_name = "Aruna"
+    state.ensure_aruna()
+    state.add_umar()
+    state.add_reza()
+    state.scene_id = "CH2_REZA_TOWER"
+    state.location = "RENGAT"
+    state.main_progress = "RENGAT"
+    state.gold = 1234
+    state.inventory = {item_id: 3 for item_id in list(ITEMS)[:12]}
+    for cid in state.party_order:
+        state.xp_pool[cid] = 420
+    for flag in ("SIAK_GATE_EVENT_DONE", "VISITED_SIAK", "VISITED_RENGAT", "UMAR_QUEST_DONE"):
+        state.flags[flag] = True
+    for quest_id, quest in list(GUILD_QUESTS.items())[:2]:
+        state.quests_active[quest_id] = QuestState(
+            id=quest_id,
+            type=quest.get("type", "HUNT"),
+            target=quest.get("target"),
+            required_amount=quest.get("required_amount", 0),
+            progress=1,
+            reward_gold=quest.get("reward_gold", 0),
+            reward_items=dict(quest.get("reward_items", {})),
+            description=quest.get("description", ""),
+        )
+    return state
+
+
+def benchmark_save_formats(iterations: int = 500) -> Dict[str, Dict[str, float]]:
+    """Bandingkan ukuran serta waktu simpan/muat format json dan compact."""
+
+    state = build_sample_game_state()
+    results: Dict[str, Dict[str, float]] = {}
+    for save_format in ("json", "compact"):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            blob = encode_save_blob(serialize_game_state(state), save_format)
+        encode_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(iterations):
+            GameState.from_dict(user_id=0, data=decode_save_blob(blob))
+        decode_seconds = time.perf_counter() - started
+        results[save_format] = {
+            "bytes": len(blob),
+            "save_us": encode_seconds / iterations * 1_000_000,
+            "load_us": decode_seconds / iterations * 1_000_000,
+        }
+    return results
+
+
+def run_save_conversion(remove_source: bool = False) -> None:
+    if SAVE_BACKEND == SqliteSaveBackend.name:
+        source: SaveBackend = SqliteSaveBackend(SAVE_DB_PATH, save_format="json")
+        target: SaveBackend = SqliteSaveBackend(SAVE_DB_PATH, save_format="compact")
+    else:
+        source = JsonFileSaveBackend(SAVE_DIR, save_format="json")
+        target = JsonFileSaveBackend(SAVE_DIR, save_format="compact")
+    converted, failed = convert_saves(source, target, remove_source=remove_source)
+    source.close()
+    target.close()
+    print(f"Konversi save selesai: {converted} berhasil, {failed} gagal.")
+    print('Set SAVE_FORMAT = "compact" agar save baru memakai format ini.')
+
+
+def print_save_benchmark(iterations: int) -> None:
+    codec = "msgpack" if msgpack is not None else "json+zlib"
+    print(f"Benchmark format save ({iterations} iterasi, codec compact: {codec})")
+    print(f"{'format':<10}{'ukuran':>10}{'simpan (us)':>14}{'muat (us)':>12}")
+    for save_format, result in benchmark_save_formats(iterations).items():
+        print(
+            f"{save_format:<10}{int(result['bytes']):>10}"
+            f"{result['save_us']:>14.1f}{result['load_us']:>12.1f}"
+        )
+
+
+def parse_cli_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Legends of Aruna: Journey to Kampar (bot Telegram)")
+    parser.add_argument(
+        "--convert-saves",
+        action="store_true",
+        help="Ubah semua save JSON ke format compact lalu keluar.",
+    )
+    parser.add_argument(
+        "--remove-json",
+        action="store_true",
+        help="Dipakai dengan --convert-saves: hapus file .json setelah berhasil dikonversi.",
+    )
+    parser.add_argument(
+        "--bench-save-format",
+        type=int,
+        nargs="?",
+        const=500,
+        metavar="ITERASI",
+        help="Bandingkan format save json vs compact lalu keluar.",
+    )
+    parser.add_argument(
+        "--simulate-balance",
+        action="store_true",
+        help="Jalankan simulasi balance Monte Carlo per area berburu (tanpa Telegram) lalu keluar.",
+    )
+    parser.add_argument("--sim-battles", type=int, default=10000, help="Jumlah battle per area.")
+    parser.add_argument("--sim-level", type=int, default=1, help="Level party simulasi.")
+    parser.add_argument("--sim-party", type=int, choices=(1, 2, 3), default=3, help="Jumlah anggota party.")
+    parser.add_argument("--sim-gear", nargs="*", default=[], metavar="ITEM_ID", help="Equipment yang dipasang.")
+    parser.add_argument("--sim-areas", nargs="*", default=None, metavar="AREA_ID", help="Batasi area berburu.")
+    parser.add_argument("--sim-workers", type=int, default=None, help="Jumlah proses (default: jumlah CPU).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed simulasi supaya hasil bisa diulang.")
+    parser.add_argument(
+        "--mode",
+        choices=("polling", "webhook", "shard-front"),
+        default=BOT_MODE,
+        help="Cara menerima update Telegram.",
+    )
+    parser.add_argument("--host", default=WEBHOOK_LISTEN, help="Alamat listen mode webhook.")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="Port endpoint Prometheus di mode polling (0 = nonaktif). Mode webhook memakai port webhook.",
+    )
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT, help="Port listen mode webhook.")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help="Jumlah worker shard (mode shard-front).")
+    parser.add_argument("--shard-base-port", type=int, default=SHARD_BASE_PORT, help="Port worker shard pertama.")
+    parser.add_argument(
+        "--shard-source",
+        choices=("webhook", "polling"),
+        default="webhook",
+        help="Sumber update proses front: terima webhook atau getUpdates.",
+    )
+    parser.add_argument("--spawn-shards", action="store_true", help="Front ikut menjalankan worker shard lokal.")
+    parser.add_argument("--shard-index", type=int, default=None, help="Dipakai worker: nomor shard proses ini.")
+    parser.add_argument("--shard-count", type=int, default=None, help="Dipakai worker: total shard.")
+    parser.add_argument(
+        "--concurrent-updates",
+        type=int,
+        default=WEBHOOK_CONCURRENT_UPDATES,
+        help="Jumlah update yang diproses paralel di mode webhook.",
+    )
+    parser.add_argument(
+        "--api-base-url",
+        default=TELEGRAM_API_BASE_URL,
+        help="Base URL Bot API (mis. http://127.0.0.1:8090/bot untuk Bot API palsu).",
+    )
+    parser.add_argument(
+        "--fake-telegram",
+        action="store_true",
+        help="Jalankan Bot API palsu dan kirim update palsu ke --webhook-target.",
+    )
+    parser.add_argument(
+        "--watch-content",
+        type=float,
+        default=CONTENT_WATCH_INTERVAL,
+        metavar="DETIK",
+        help="Reload scene/tabel data otomatis saat file berubah (interval polling).",
+    )
+    parser.add_argument(
+        "--export-content",
+        action="store_true",
+        help="Tulis tabel data bawaan ke data/tables/*.json agar bisa diedit lalu di-/reload.",
+    )
+    parser.add_argument(
+        "--check-scenes",
+        action="store_true",
+        help="Analisis graf scene: referensi putus, scene tak terjangkau, index flag (exit 1 bila ada error).",
+    )
+    parser.add_argument(
+        "--scene-index-out",
+        default=None,
+        help="Tulis index adjacency & dependensi flag hasil --check-scenes ke file JSON ini.",
+    )
+    parser.add_argument("--fake-api-port", type=int, default=8090)
+    parser.add_argument(
+        "--webhook-target",
+        default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}",
+    )
+    parser.add_argument("--fake-updates", type=int, default=100, help="Jumlah update palsu.")
+    parser.add_argument("--fake-users", type=int, default=10, help="Jumlah user palsu berbeda.")
+    return parser.parse_args(argv)
+
+
+async def on_application_init(application) -> None:
+    if METRICS_PORT and BOT_MODE == "polling":
+        application.bot_data["metrics_runner"] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if CONTENT_WATCH_INTERVAL > 0:
+        application.bot_data["content_watcher"] = asyncio.create_task(watch_content_files(CONTENT_WATCH_INTERVAL))
+
+
+async def on_application_shutdown(application) -> None:
+    """Pastikan semua autosave yang masih antre tertulis sebelum proses berhenti."""
+
+    metrics_runner = application.bot_data.pop("metrics_runner", None)
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    content_watcher = application.bot_data.pop("content_watcher", None)
+    if content_watcher is not None:
+        content_watcher.cancel()
+    await EDIT_SCHEDULER.stop()
+    await AUTOSAVE_QUEUE.stop()
+    logger.info("Antrian autosave sudah dikosongkan: %s", AUTOSAVE_QUEUE.metrics())
+
+
+def build_application(concurrent_updates=False, api_base_url: str = TELEGRAM_API_BASE_URL):
+    builder = (
+        ApplicationBuilder()
+        .token(TOKEN_BOT)
+        .concurrent_updates(concurrent_updates)
+        .post_init(on_application_init)
+        .post_shutdown(on_application_shutdown)
+    )
+    if api_base_url:
+        builder = builder.base_url(api_base_url)
+    builder = builder.request(InstrumentedHTTPXRequest())
+    application = builder.build()
+
+    commands = {
+        "start": start,
+        "status": status_cmd,
+        "map": map_cmd,
+        "save": save_cmd,
+        "load": load_cmd,
+        "inventory": inventory_cmd,
+        "quests": quests_cmd,
+        "help": help_cmd,
+        "force_save": force_save_cmd,
+        "show_state": show_state_cmd,
+        "metrics": metrics_cmd,
+        "locks": locks_cmd,
+        "reload": reload_content_cmd,
+    }
+    for command, handler in commands.items():
+        application.add_handler(CommandHandler(command, timed_handler(command, handler)))
 
     text_filter = filters.TEXT & (~filters.COMMAND)
-    application.add_handler(MessageHandler(text_filter, handle_text_message))
-    application.add_handler(CallbackQueryHandler(button))
+    application.add_handler(MessageHandler(text_filter, timed_handler("text_message", handle_text_message)))
+    application.add_handler(CallbackQueryHandler(timed_handler("button", button)))
+    return application
+
+
+def main():
+    global BOT_MODE, METRICS_PORT, CONTENT_WATCH_INTERVAL
+    args = parse_cli_args()
+    BOT_MODE = args.mode
+    METRICS_PORT = args.metrics_port
+    CONTENT_WATCH_INTERVAL = args.watch_content
+    if args.check_scenes:
+        report = analyze_scene_graph()
+        print_scene_graph_report(report)
+        if args.scene_index_out:
+            with open(args.scene_index_out, "w", encoding="utf-8") as f:
+                json.dump(report.to_index(), f, ensure_ascii=False, indent=2)
+            print(f"Index ditulis ke {args.scene_index_out}")
+        if report.errors:
+            raise SystemExit(1)
+        return
+    if args.export_content:
+        written = export_content_tables()
+        print("\n".join(written) if written else f"Semua tabel sudah ada di {CONTENT_TABLE_DIR}.")
+        return
+    if args.convert_saves:
+        run_save_conversion(remove_source=args.remove_json)
+        return
+    if args.bench_save_format:
+        print_save_benchmark(args.bench_save_format)
+        return
+    if args.simulate_balance:
+        config = BalanceSimConfig(
+            level=args.sim_level,
+            party_size=args.sim_party,
+            gear=tuple(args.sim_gear),
+            battles=args.sim_battles,
+            seed=args.seed,
+        )
+        try:
+            reports = run_balance_simulation(config, args.sim_areas, args.sim_workers)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+        print_balance_report(config, reports)
+        return
+    if args.fake_telegram:
+        if web is None:
+            raise SystemExit("Mode fake Telegram butuh aiohttp: pip install aiohttp")
+        try:
+            asyncio.run(
+                run_fake_telegram(
+                    api_port=args.fake_api_port,
+                    target_url=args.webhook_target,
+                    count=args.fake_updates,
+                    users=args.fake_users,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.shard_index is not None:
+        try:
+            apply_shard_config(args.shard_index, args.shard_count or args.shards)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+        if args.mode != "webhook":
+            raise SystemExit("Worker shard harus berjalan dengan --mode webhook.")
+    if args.mode == "shard-front":
+        if web is None:
+            raise SystemExit("Mode shard-front butuh aiohttp: pip install aiohttp")
+        try:
+            asyncio.run(
+                run_shard_front(
+                    args.host,
+                    args.port,
+                    args.shards,
+                    args.shard_base_port,
+                    source=args.shard_source,
+                    spawn=args.spawn_shards,
+                    api_base_url=args.api_base_url,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.mode == "webhook":
+        if web is None:
+            raise SystemExit("Mode webhook butuh aiohttp: pip install aiohttp")
+        application = build_application(
+            concurrent_updates=args.concurrent_updates,
+            api_base_url=args.api_base_url,
+        )
+        logger.info("Bot Legends of Aruna berjalan (webhook, port %s)...", args.port)
+        asyncio.run(run_webhook_server(application, args.host, args.port))
+        return
 
+    application = build_application(api_base_url=args.api_base_url)
     logger.info("Bot Legends of Aruna berjalan...")
     application.run_polling()
 
@@ -0,0 +1,279 @@
+"""
+Benchmark hot path bot (battle, scene, persistence, encounter) tanpa Telegram.
+
+Butuh pytest-benchmark:
+    pip install pytest pytest-benchmark
+    pytest benchmarks/ --benchmark-autosave            # simpan baseline
+    pytest benchmarks/ --benchmark-compare             # bandingkan dengan baseline terakhir
+    pytest benchmarks/ -k scene                        # hanya benchmark tertentu
+
+Alokasi per operasi (peak byte dan jumlah blok) dicatat di extra_info tiap
+benchmark lewat fixture `allocations`, terpisah dari pengukuran waktu.
+"""
+
+import asyncio
+import logging
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna  # noqa: E402
+
+BENCH_ROUNDS = 2000
+ALLOC_SAMPLES = 200
+BENCH_ENEMY_KEYS = ("SHADOW_SLIME", "MIST_WOLF", "SCARRED_PANTHER")
+
+
+# ==========================
+# TELEGRAM PALSU
+# ==========================
+
+
+class FakeBot:
+    """Bot palsu yang mencatat pesan/edit alih-alih mengirim ke Telegram."""
+
+    def __init__(self) -> None:
+        self.sent: List[Dict[str, Any]] = []
+        self.edits: List[Dict[str, Any]] = []
+        self._next_message_id = 1
+
+    def _new_message(self, chat_id: int, text: str) -> "FakeMessage":
+        message = FakeMessage(self, chat_id, self._next_message_id, text)
+        self._next_message_id += 1
+        return message
+
+    async def send_message(self, chat_id: int, text: str, reply_markup=None, **kwargs) -> "FakeMessage":
+        self.sent.append({"chat_id": chat_id, "text": text, "reply_markup": reply_markup})
+        return self._new_message(chat_id, text)
+
+    async def edit_message_text(
+        self, text: str, chat_id: Optional[int] = None, message_id: Optional[int] = None, reply_markup=None, **kwargs
+    ) -> bool:
+        self.edits.append({"chat_id": chat_id, "message_id": message_id, "text": text, "reply_markup": reply_markup})
+        return True
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int, message_id: int, text: str = "") -> None:
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+
+    async def reply_text(self, text: str, reply_markup=None, **kwargs) -> "FakeMessage":
+        return await self.bot.send_message(self.chat_id, text, reply_markup=reply_markup)
+
+    async def edit_text(self, text: str, reply_markup=None, **kwargs) -> bool:
+        return await self.bot.edit_message_text(text, self.chat_id, self.message_id, reply_markup=reply_markup)
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, user_id: int, data: str = "") -> None:
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, first_name="Bench")
+        self.message = FakeMessage(bot, user_id, 0)
+
+    async def answer(self, *args, **kwargs) -> bool:
+        return True
+
+    async def edit_message_text(self, text: str, reply_markup=None, **kwargs) -> bool:
+        return await self.message.edit_text(text, reply_markup=reply_markup)
+
+
+def build_fake_update_context(user_id: int = 0, callback_data: Optional[str] = None) -> Tuple[Any, Any]:
+    """Pasangan (update, context) palsu; callback_data=None berarti update pesan biasa."""
+
+    bot = FakeBot()
+    query = FakeCallbackQuery(bot, user_id, callback_data) if callback_data is not None else None
+    update = SimpleNamespace(
+        update_id=0,
+        callback_query=query,
+        message=None if query else FakeMessage(bot, user_id, 0),
+        effective_user=SimpleNamespace(id=user_id, first_name="Bench"),
+        effective_chat=SimpleNamespace(
+            id=user_id, send_message=lambda text, **kw: bot.send_message(user_id, text, **kw)
+        ),
+    )
+    context = SimpleNamespace(bot=bot, args=[], user_data={}, chat_data={}, application=None)
+    return update, context
+
+
+# ==========================
+# STATE BENCHMARK
+# ==========================
+
+
+def build_bench_party(party_size: int) -> "aruna.GameState":
+    state = aruna.build_sample_game_state()
+    for cid in list(state.party_order)[party_size:]:
+        state.party_order.remove(cid)
+        state.party.pop(cid, None)
+    return state
+
+
+def build_bench_battle(party_size: int, enemy_count: int) -> "aruna.GameState":
+    """Battle yang tidak selesai dalam satu giliran supaya yang diukur hanya satu putaran."""
+
+    state = build_bench_party(party_size)
+    state.in_battle = True
+    state.battle_enemies = []
+    for index in range(enemy_count):
+        enemy = aruna.create_enemy_from_key(BENCH_ENEMY_KEYS[index % len(BENCH_ENEMY_KEYS)])
+        enemy["hp"] = enemy["max_hp"] = 10 ** 6
+        enemy["spd"] = 10 ** 3 - index  # musuh bergerak sebelum player berikutnya
+        state.battle_enemies.append(enemy)
+    for character in state.party.values():
+        character.hp = character.max_hp = 10 ** 6
+    aruna.initialize_battle_turn_state(state)
+    return state
+
+
+def build_bench_buffs(party_size: int) -> "aruna.GameState":
+    state = build_bench_party(party_size)
+    for cid in state.party_order:
+        aruna.apply_temporary_modifier(state, aruna.make_char_buff_key(cid), "atk", 2, 3)
+        aruna.apply_temporary_modifier(state, aruna.make_char_buff_key(cid), "defense", 1, 1)
+    state.scratch.mana_shield = {cid: 2 for cid in state.party_order}
+    state.scratch.light_buff_turns = 2
+    return state
+
+
+# ==========================
+# FIXTURE
+# ==========================
+
+
+@pytest.fixture(autouse=True)
+def isolated_saves(monkeypatch, tmp_path):
+    # Checkpoint di send_scene tidak boleh menulis save/ ke checkout: autosave dimatikan dan
+    # backend diarahkan ke tmp_path untuk jalur yang tetap menyimpan langsung.
+    monkeypatch.setattr(aruna, "AUTOSAVE_ENABLED", False)
+    monkeypatch.setattr(aruna, "SAVE_DIR", str(tmp_path))
+    monkeypatch.setattr(aruna, "_save_backend", aruna.JsonFileSaveBackend(str(tmp_path)))
+
+
+@pytest.fixture(autouse=True)
+def quiet_game_logger(request):
+    # Log battle per iterasi tidak ikut diukur; RNG di-seed per benchmark supaya bisa diulang.
+    previous_level = aruna.logger.level
+    aruna.logger.setLevel(logging.WARNING)
+    random.seed(request.node.name)
+    yield
+    aruna.logger.setLevel(previous_level)
+
+
+@pytest.fixture(scope="module")
+def event_loop_runner():
+    # Satu loop untuk semua benchmark: task latar (mis. antrian autosave) tetap di loop yang sama.
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture
+def allocations(benchmark):
+    """Ukur peak byte dan blok baru per operasi dengan tracemalloc, dicatat ke benchmark.extra_info."""
+
+    def measure(setup: Callable[[], Tuple[Any, ...]], call: Callable[..., Any], samples: int = ALLOC_SAMPLES) -> None:
+        peak_total = 0
+        blocks_total = 0
+        tracemalloc.start()
+        try:
+            for _ in range(samples):
+                args = setup()
+                tracemalloc.reset_peak()
+                before_snapshot = tracemalloc.take_snapshot()
+                before_current, _ = tracemalloc.get_traced_memory()
+                call(*args)
+                _, peak = tracemalloc.get_traced_memory()
+                after_snapshot = tracemalloc.take_snapshot()
+                peak_total += max(0, peak - before_current)
+                blocks_total += sum(
+                    max(0, stat.count_diff) for stat in after_snapshot.compare_to(before_snapshot, "lineno")
+                )
+                del args
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_bytes_per_op"] = peak_total / samples
+        benchmark.extra_info["blocks_per_op"] = blocks_total / samples
+
+    return measure
+
+
+def run_hot_path(benchmark, allocations, setup: Callable[[], Tuple[Any, ...]], call: Callable[..., Any]) -> None:
+    """Waktu per operasi (setup tidak ikut diukur), lalu alokasinya secara terpisah."""
+
+    benchmark.pedantic(call, setup=lambda: (setup(), {}), rounds=BENCH_ROUNDS, warmup_rounds=50)
+    allocations(setup, call)
+
+
+# ==========================
+# BENCHMARK
+# ==========================
+
+
+@pytest.mark.parametrize("party_size,enemy_count", [(1, 1), (1, 3), (3, 1), (3, 3)])
+def test_conclude_player_turn(benchmark, allocations, event_loop_runner, party_size, enemy_count):
+    def setup() -> Tuple[Any, ...]:
+        update, context = build_fake_update_context(callback_data="BATTLE_ATTACK")
+        return update, context, build_bench_battle(party_size, enemy_count), []
+
+    def call(update, context, state, log) -> None:
+        event_loop_runner(aruna.conclude_player_turn(update, context, state, log))
+
+    run_hot_path(benchmark, allocations, setup, call)
+
+
+@pytest.mark.parametrize("party_size", [1, 3])
+def test_tick_buffs(benchmark, allocations, party_size):
+    run_hot_path(benchmark, allocations, lambda: (build_bench_buffs(party_size),), aruna.tick_buffs)
+
+
+def test_send_scene(benchmark, allocations, event_loop_runner):
+    scene_ids = sorted(aruna.SCENES)
+    scene_cycle = {"index": 0}
+
+    def setup() -> Tuple[Any, ...]:
+        update, context = build_fake_update_context(callback_data="SCENE")
+        state = build_bench_party(3)
+        state.scene_id = scene_ids[scene_cycle["index"] % len(scene_ids)]
+        scene_cycle["index"] += 1
+        return update, context, state
+
+    def call(update, context, state) -> None:
+        event_loop_runner(aruna.send_scene(update, context, state))
+
+    run_hot_path(benchmark, allocations, setup, call)
+
+
+@pytest.mark.parametrize("party_size", [1, 3])
+def test_game_state_to_dict(benchmark, allocations, party_size):
+    state = build_bench_party(party_size)
+    run_hot_path(benchmark, allocations, lambda: (state,), aruna.GameState.to_dict)
+
+
+@pytest.mark.parametrize("party_size", [1, 3])
+def test_game_state_from_dict(benchmark, allocations, party_size):
+    payload = build_bench_party(party_size).to_dict()
+    run_hot_path(benchmark, allocations, lambda: (0, payload), aruna.GameState.from_dict)
+
+
+@pytest.mark.parametrize("area_id", sorted(aruna.HUNTING_AREAS))
+def test_pick_random_monster(benchmark, allocations, area_id):
+    area_key = aruna.HUNTING_AREAS[area_id].get("area_key", area_id)
+    run_hot_path(benchmark, allocations, lambda: (area_key, 5), aruna.pick_random_monster_for_area)
@@ -0,0 +1,78 @@
+"""
+Fixture bersama untuk test perilaku bot (tanpa Telegram sungguhan).
+
+    pip install pytest
+    pytest tests/
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("telegram")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_saves(monkeypatch, tmp_path):
+    # Setiap test punya folder save dan antrian autosave sendiri; checkout tidak pernah ditulisi.
+    monkeypatch.setattr(aruna, "SAVE_DIR", str(tmp_path))
+    monkeypatch.setattr(aruna, "_save_backend", aruna.JsonFileSaveBackend(str(tmp_path)))
+    monkeypatch.setattr(aruna, "AUTOSAVE_QUEUE", aruna.AutosaveQueue(flush_interval=0))
+    monkeypatch.setattr(aruna, "AUTOSAVE_RETRY_BACKOFF", 0.0)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def quiet_game_logger():
+    previous_level = aruna.logger.level
+    aruna.logger.setLevel(logging.CRITICAL)
+    yield
+    aruna.logger.setLevel(previous_level)
+
+
+class FlakySaveBackend(aruna.SaveBackend):
+    """Backend di memori yang gagal untuk `failures` panggilan save_many pertama."""
+
+    name = "flaky"
+
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls = 0
+        self.data = {}
+
+    def save_many(self, entries):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return 0
+        for user_id, data in entries:
+            self.data[user_id] = data
+        return len(entries)
+
+    def load(self, user_id):
+        return self.data.get(user_id)
+
+    def load_many(self, user_ids=None):
+        targets = self.data if user_ids is None else user_ids
+        return {user_id: self.data[user_id] for user_id in targets if user_id in self.data}
+
+    def list_user_ids(self):
+        return sorted(self.data)
+
+    def exists(self, user_id):
+        return user_id in self.data
+
+
+@pytest.fixture
+def flaky_backend(monkeypatch):
+    def install(failures: int = 0) -> FlakySaveBackend:
+        backend = FlakySaveBackend(failures)
+        monkeypatch.setattr(aruna, "_save_backend", backend)
+        return backend
+
+    return install
@@ -0,0 +1,182 @@
+"""Antrian autosave write-behind: penggabungan, kegagalan backend, percobaan ulang, dan pembuangan."""
+
+import asyncio
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def stop_queue():
+    await aruna.AUTOSAVE_QUEUE.stop()
+
+
+def test_enqueue_without_loop_writes_directly(flaky_backend):
+    backend = flaky_backend()
+    state = aruna.build_sample_game_state(user_id=1)
+
+    assert aruna.AUTOSAVE_QUEUE.enqueue(state)
+    assert backend.data[1] == state.to_dict()
+    assert not state.has_unsaved_changes()
+
+
+def test_enqueue_keeps_state_dirty_until_written(flaky_backend):
+    backend = flaky_backend()
+    state = aruna.build_sample_game_state(user_id=1)
+
+    async def scenario():
+        queue = aruna.AUTOSAVE_QUEUE
+        assert queue.enqueue(state)
+        assert state.has_unsaved_changes()
+        assert queue.peek(1) is not None
+        await queue.flush()
+        assert not state.has_unsaved_changes()
+        assert queue.peek(1) is None
+        await stop_queue()
+
+    run(scenario())
+    assert backend.data[1] == state.to_dict()
+
+
+def test_enqueue_coalesces_per_user(flaky_backend):
+    backend = flaky_backend()
+    state = aruna.build_sample_game_state(user_id=1)
+
+    async def scenario():
+        queue = aruna.AUTOSAVE_QUEUE
+        queue.enqueue(state)
+        queue.enqueue(state)  # belum ada perubahan baru
+        state.gold = 5
+        queue.enqueue(state)
+        assert queue.depth == 1
+        assert queue.stats["coalesced"] == 1
+        assert queue.stats["skipped_clean"] == 1
+        await queue.flush()
+        await stop_queue()
+
+    run(scenario())
+    assert backend.calls == 1
+    assert backend.data[1]["gold"] == 5
+
+
+def test_changes_during_write_stay_dirty(flaky_backend, monkeypatch):
+    backend = flaky_backend()
+    state = aruna.build_sample_game_state(user_id=1)
+    original_save_many = backend.save_many
+
+    def save_while_player_moves(entries):
+        state.gold += 100  # handler lain mengubah state selama thread menulis
+        return original_save_many(entries)
+
+    monkeypatch.setattr(backend, "save_many", save_while_player_moves)
+
+    async def scenario():
+        aruna.AUTOSAVE_QUEUE.enqueue(state)
+        await aruna.AUTOSAVE_QUEUE.flush()
+        await stop_queue()
+
+    run(scenario())
+    assert state.has_unsaved_changes()
+    assert backend.data[1]["gold"] == state.gold - 100
+
+
+def test_save_now_reports_failure_and_keeps_state_dirty(flaky_backend):
+    backend = flaky_backend(failures=aruna.AUTOSAVE_MAX_RETRIES)
+    state = aruna.build_sample_game_state(user_id=1)
+
+    async def scenario():
+        saved = await aruna.save_game_state_now(state)
+        await stop_queue()
+        return saved
+
+    assert run(scenario()) is False
+    assert state.has_unsaved_changes()
+    assert 1 not in backend.data
+
+
+def test_save_now_succeeds_after_transient_failure(flaky_backend):
+    backend = flaky_backend(failures=1)
+    state = aruna.build_sample_game_state(user_id=1)
+
+    async def scenario():
+        first = await aruna.save_game_state_now(state)
+        second = await aruna.save_game_state_now(state)
+        await stop_queue()
+        return first, second
+
+    assert run(scenario()) == (False, True)
+    assert not state.has_unsaved_changes()
+    assert backend.data[1] == state.to_dict()
+
+
+def test_worker_retries_failed_batch_on_its_own(flaky_backend):
+    backend = flaky_backend(failures=1)
+    state = aruna.build_sample_game_state(user_id=1)
+
+    async def scenario():
+        queue = aruna.AUTOSAVE_QUEUE
+        queue.enqueue(state)
+        for _ in range(100):
+            if 1 in backend.data:
+                break
+            await asyncio.sleep(0.01)
+        await stop_queue()
+        return queue.metrics()
+
+    metrics = run(scenario())
+    assert backend.calls == 2
+    assert metrics["failed"] == 1
+    assert metrics["written"] == 1
+    assert not state.has_unsaved_changes()
+
+
+def test_dropped_autosave_marks_whole_state_dirty(flaky_backend):
+    backend = flaky_backend(failures=aruna.AUTOSAVE_MAX_RETRIES)
+    state = aruna.build_sample_game_state(user_id=1)
+
+    async def scenario():
+        queue = aruna.AUTOSAVE_QUEUE
+        queue.enqueue(state)
+        await queue.flush()
+        assert queue.depth == 0
+        assert queue.stats["dropped"] == 1
+        await stop_queue()
+
+    run(scenario())
+    assert state.has_unsaved_changes()
+    # Save berikutnya tanpa loop menulis ulang state lengkap.
+    assert aruna.save_game_state(1, state)
+    assert backend.data[1] == state.to_dict()
+
+
+def test_retry_delay_backs_off_per_attempt(monkeypatch):
+    monkeypatch.setattr(aruna, "AUTOSAVE_RETRY_BACKOFF", 1.5)
+    queue = aruna.AutosaveQueue(flush_interval=0)
+    state = aruna.build_sample_game_state(user_id=1)
+    item = aruna.PendingAutosave({}, "test", 0.0, state, state.save_generations())
+    queue._pending[1] = item
+
+    assert queue._retry_delay() == 0.0
+    item.attempts = 1
+    assert queue._retry_delay() == 1.5
+    item.attempts = 2
+    assert queue._retry_delay() == 3.0
+
+
+def test_load_prefers_pending_snapshot(flaky_backend):
+    backend = flaky_backend()
+    state = aruna.build_sample_game_state(user_id=1)
+    aruna.save_game_state(1, state)
+
+    async def scenario():
+        state.gold = 999
+        aruna.AUTOSAVE_QUEUE.enqueue(state)
+        loaded = aruna.load_game_state(1)
+        assert aruna.has_saved_game(1)
+        await stop_queue()
+        return loaded
+
+    assert run(scenario()).gold == 999
+    assert backend.data[1]["gold"] == 999
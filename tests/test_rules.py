@@ -0,0 +1,159 @@
+"""Syarat scene/pilihan yang dikompilasi dan urutan prioritas CallbackRouter."""
+
+import asyncio
+
+import pytest
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna
+
+
+def build_state(flags=(), level=1, inventory=None):
+    state = aruna.GameState(user_id=1)
+    state.ensure_aruna()
+    state.party["ARUNA"].level = level
+    state.inventory = dict(inventory or {})
+    for name in flags:
+        state.flags[name] = True
+    return state
+
+
+# ==========================
+# SYARAT
+# ==========================
+
+
+def test_empty_requirements_are_always_met():
+    assert aruna.compile_requirements(None) is aruna.ALWAYS_MET
+    assert aruna.compile_requirements({}) is aruna.ALWAYS_MET
+    assert aruna.requirements_met({}, build_state())
+
+
+@pytest.mark.parametrize(
+    "requirements,flags,expected",
+    [
+        ({"flags": ["VISITED_SIAK", "VISITED_RENGAT"]}, ["VISITED_SIAK"], False),
+        ({"flags": ["VISITED_SIAK", "VISITED_RENGAT"]}, ["VISITED_SIAK", "VISITED_RENGAT"], True),
+        ({"any_flags": ["VISITED_SIAK", "VISITED_RENGAT"]}, [], False),
+        ({"any_flags": ["VISITED_SIAK", "VISITED_RENGAT"]}, ["VISITED_RENGAT"], True),
+        ({"not_flags": ["UMAR_QUEST_DONE"]}, [], True),
+        ({"not_flags": ["UMAR_QUEST_DONE"]}, ["UMAR_QUEST_DONE"], False),
+    ],
+)
+def test_flag_requirements(requirements, flags, expected):
+    predicate = aruna.compile_requirements(requirements)
+    assert predicate.needs_flags
+    assert predicate.test(build_state(flags)) is expected
+
+
+def test_level_and_item_requirements():
+    predicate = aruna.compile_requirements({"min_level": 5, "items": {"POTION_SMALL": 2}})
+
+    assert not predicate.needs_flags
+    assert not predicate.test(build_state(level=4, inventory={"POTION_SMALL": 2}))
+    assert not predicate.test(build_state(level=5, inventory={"POTION_SMALL": 1}))
+    assert predicate.test(build_state(level=5, inventory={"POTION_SMALL": 2}))
+
+
+def test_any_of_alternatives():
+    predicate = aruna.compile_requirements(
+        {"any_of": [{"flags": ["VISITED_RENGAT"]}, {"min_level": 10}]}
+    )
+
+    assert not predicate.test(build_state())
+    assert predicate.test(build_state(flags=["VISITED_RENGAT"]))
+    assert predicate.test(build_state(level=10))
+
+
+def test_precomputed_flag_mask_is_used():
+    predicate = aruna.compile_requirements({"flags": ["VISITED_SIAK"]})
+    state = build_state()
+    mask = aruna.STORY_FLAGS.mask(["VISITED_SIAK"])
+
+    assert not predicate.test(state)
+    assert predicate.test(state, mask)
+
+
+# ==========================
+# ROUTER
+# ==========================
+
+
+@pytest.fixture
+def dispatch_log(monkeypatch):
+    """Catat jalur yang dipilih router; pilihan scene aktif hanya "CHOICE"."""
+
+    calls = []
+
+    async def handle_scene_choice(update, context, state, data):
+        calls.append(("scene_choice", data))
+
+    async def render_scene(update, context, state, scene_id):
+        calls.append(("scene", scene_id))
+
+    monkeypatch.setattr(aruna, "get_scene_choice", lambda scene_id, data: data.startswith("CHOICE"))
+    monkeypatch.setattr(aruna, "handle_scene_choice", handle_scene_choice)
+    monkeypatch.setattr(aruna, "render_scene", render_scene)
+    monkeypatch.setattr(aruna, "SCENES", {"SOME_SCENE": {}})
+    return calls
+
+
+def build_router(calls):
+    router = aruna.CallbackRouter()
+
+    def handler(name):
+        async def handle(update, context, state, data):
+            calls.append((name, data))
+
+        return handle
+
+    router.route("CHOICE_EARLY", before_scene=True)(handler("early"))
+    router.route("CHOICE_LATE", "SOME_SCENE")(handler("late"))
+    router.route("TARGET", args="required")(handler("target"))
+    router.route("MENU", args="any")(handler("menu"))
+    return router
+
+
+def dispatch(router, data):
+    asyncio.run(router.dispatch(None, None, build_state(), data))
+
+
+@pytest.mark.parametrize(
+    "data,expected",
+    [
+        ("CHOICE_EARLY", ("early", "CHOICE_EARLY")),  # before_scene mengalahkan pilihan scene
+        ("CHOICE_LATE", ("scene_choice", "CHOICE_LATE")),  # pilihan scene mengalahkan route biasa
+        ("SOME_SCENE", ("late", "SOME_SCENE")),  # route biasa mengalahkan scene dengan id sama
+        ("TARGET|2", ("target", "TARGET|2")),
+        ("MENU", ("menu", "MENU")),
+        ("MENU|x", ("menu", "MENU|x")),
+    ],
+)
+def test_dispatch_precedence(dispatch_log, data, expected):
+    dispatch(build_router(dispatch_log), data)
+    assert dispatch_log == [expected]
+
+
+def test_scene_and_story_fallbacks(dispatch_log):
+    router = aruna.CallbackRouter()
+    dispatch(router, "SOME_SCENE")
+    dispatch(router, "TARGET|2")
+
+    assert dispatch_log == [("scene", "SOME_SCENE"), ("scene_choice", "TARGET|2")]
+    assert router.fallback_stats == {"scene": 1, "story_fallback": 1}
+
+
+def test_route_argument_modes(dispatch_log):
+    router = build_router(dispatch_log)
+
+    assert router.resolve("TARGET") is None  # argumen wajib
+    assert router.resolve("CHOICE_LATE|1") is None  # tanpa argumen
+    assert router.resolve("TARGET|1").name == "TARGET"
+
+
+def test_duplicate_route_and_bad_mode_are_rejected():
+    router = aruna.CallbackRouter()
+    router.route("A")(lambda *args: None)
+    with pytest.raises(ValueError):
+        router.route("A")(lambda *args: None)
+    with pytest.raises(ValueError):
+        router.route("B", args="maybe")
@@ -0,0 +1,218 @@
+"""Format save: migrasi skema, save compact, backend JSON/SQLite, dan pelacakan bagian yang berubah."""
+
+import pytest
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna
+
+
+def build_v1_save():
+    # Save JSON lama: tanpa schema_version, flags masih dict campuran cerita + scratch.
+    return {
+        "scene_id": "CH1_SIAK_GATE",
+        "location": "SIAK",
+        "player_name": "Aruna",
+        "gold": 77,
+        "party": {"ARUNA": aruna.CharacterState.from_dict({"id": "ARUNA", "name": "Aruna"}).to_dict()},
+        "party_order": ["ARUNA"],
+        "inventory": {"POTION_SMALL": 2},
+        "xp_pool": {"ARUNA": 5},
+        "flags": {
+            "VISITED_SIAK": True,
+            "UMAR_QUEST_DONE": False,
+            "DEFENDING": True,
+            "LAST_HUNT_AREA": "HUTAN_SIAK",
+            "AWAITING_PLAYER_NAME": True,
+        },
+    }
+
+
+# ==========================
+# MIGRASI
+# ==========================
+
+
+def test_migrate_v1_to_current_moves_scratch_out_of_flags():
+    data = aruna.migrate_save_data(build_v1_save())
+
+    assert data["schema_version"] == aruna.SAVE_SCHEMA_VERSION
+    assert data["flags"] == ["VISITED_SIAK"]
+    assert data["last_hunt_area"] == "HUTAN_SIAK"
+    assert data["awaiting_player_name"] is True
+
+
+def test_migrate_does_not_mutate_source():
+    source = build_v1_save()
+    aruna.migrate_save_data(source)
+    assert isinstance(source["flags"], dict)
+    assert "schema_version" not in source
+
+
+def test_migrate_keeps_newer_version_as_is():
+    data = {"schema_version": aruna.SAVE_SCHEMA_VERSION + 1, "flags": {"X": True}}
+    assert aruna.migrate_save_data(data) is data
+
+
+def test_migrate_without_registered_step_raises(monkeypatch):
+    monkeypatch.delitem(aruna.SAVE_MIGRATIONS, 1)
+    with pytest.raises(ValueError):
+        aruna.migrate_save_data({"flags": {}})
+
+
+def test_v1_save_loads_into_game_state():
+    state = aruna.GameState.from_dict(user_id=5, data=build_v1_save())
+
+    assert state.gold == 77
+    assert state.flags.get("VISITED_SIAK") is True
+    assert "DEFENDING" not in state.flags
+    assert state.last_hunt_area == "HUTAN_SIAK"
+    assert state.awaiting_player_name is True
+
+
+# ==========================
+# SAVE COMPACT
+# ==========================
+
+
+def test_compact_round_trip_matches_json():
+    data = aruna.build_sample_game_state(user_id=9).to_dict()
+    blob = aruna.encode_save_blob(data, "compact")
+
+    assert blob.startswith(aruna.COMPACT_SAVE_MAGIC)
+    assert aruna.decode_save_blob(blob) == data
+
+
+def test_compact_json_zlib_codec_without_msgpack(monkeypatch):
+    monkeypatch.setattr(aruna, "msgpack", None)
+    data = aruna.build_sample_game_state().to_dict()
+    blob = aruna.encode_compact_save(data)
+
+    _, codec, version = aruna.COMPACT_SAVE_HEADER.unpack_from(blob)
+    assert codec == aruna.COMPACT_CODEC_JSON_ZLIB
+    assert version == aruna.SAVE_SCHEMA_VERSION
+    assert aruna.decode_save_blob(blob) == data
+
+
+def test_compact_unknown_codec_is_rejected():
+    blob = aruna.COMPACT_SAVE_HEADER.pack(aruna.COMPACT_SAVE_MAGIC, 99, aruna.SAVE_SCHEMA_VERSION) + b"x"
+    with pytest.raises(ValueError):
+        aruna.decode_save_blob(blob)
+
+
+def test_plain_json_blob_still_decodes():
+    data = aruna.build_sample_game_state().to_dict()
+    assert aruna.decode_save_blob(aruna.encode_save_blob(data, "json")) == data
+
+
+# ==========================
+# BACKEND
+# ==========================
+
+
+def make_backend(kind, tmp_path, save_format):
+    if kind == "json":
+        return aruna.JsonFileSaveBackend(str(tmp_path), save_format=save_format)
+    return aruna.SqliteSaveBackend(str(tmp_path / "saves.db"), save_format=save_format)
+
+
+@pytest.mark.parametrize("save_format", ["json", "compact"])
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_backend_round_trip(tmp_path, kind, save_format):
+    backend = make_backend(kind, tmp_path, save_format)
+    states = {user_id: aruna.build_sample_game_state(user_id) for user_id in (3, 1, 2)}
+    try:
+        assert backend.save_many([(uid, state.to_dict()) for uid, state in states.items()]) == 3
+        assert backend.list_user_ids() == [1, 2, 3]
+        assert backend.exists(2) and not backend.exists(4)
+        assert backend.load(4) is None
+        assert backend.load(1) == states[1].to_dict()
+        assert set(backend.load_many([1, 4])) == {1}
+
+        loaded = aruna.GameState.from_dict(user_id=3, data=backend.load(3))
+        assert loaded.to_dict() == states[3].to_dict()
+    finally:
+        backend.close()
+
+
+def test_json_backend_reads_other_format_during_migration(tmp_path):
+    data = aruna.build_sample_game_state().to_dict()
+    aruna.JsonFileSaveBackend(str(tmp_path), save_format="json").save(8, data)
+
+    compact = aruna.JsonFileSaveBackend(str(tmp_path), save_format="compact")
+    assert compact.exists(8)
+    assert compact.load(8) == data
+
+
+def test_convert_saves_migrates_and_removes_source(tmp_path):
+    source = aruna.JsonFileSaveBackend(str(tmp_path / "json"), save_format="json")
+    source.save(1, build_v1_save())
+    source.save(2, aruna.build_sample_game_state(2).to_dict())
+    target = aruna.SqliteSaveBackend(str(tmp_path / "saves.db"), save_format="compact")
+    try:
+        assert aruna.convert_saves(source, target, remove_source=True) == (2, 0)
+        assert source.list_user_ids() == []
+        assert target.list_user_ids() == [1, 2]
+        assert target.load(1)["flags"] == ["VISITED_SIAK"]
+        assert target.load(1)["schema_version"] == aruna.SAVE_SCHEMA_VERSION
+    finally:
+        target.close()
+
+
+def test_save_backend_requires_all_methods():
+    class Partial(aruna.SaveBackend):
+        def save_many(self, entries):
+            return len(entries)
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+# ==========================
+# BAGIAN YANG BERUBAH
+# ==========================
+
+
+def test_new_state_is_unsaved_until_saved():
+    state = aruna.build_sample_game_state(user_id=4)
+    assert state.has_unsaved_changes()
+
+    assert aruna.save_game_state(4, state)
+    assert not state.has_unsaved_changes()
+    assert aruna.get_save_backend().load(4) == state.to_dict()
+
+
+def test_nested_changes_mark_state_dirty():
+    state = aruna.build_sample_game_state()
+    state.mark_saved()
+
+    state.inventory["POTION_SMALL"] = 9
+    assert state.has_unsaved_changes()
+
+    state.mark_saved()
+    state.flags["VISITED_PEKANBARU"] = True
+    assert state.has_unsaved_changes()
+
+
+def test_mark_saved_keeps_sections_changed_after_snapshot():
+    state = aruna.build_sample_game_state()
+    generations = state.save_generations()
+    snapshot = state.to_dict()
+
+    state.gold += 1  # berubah selama snapshot sedang ditulis
+    state.mark_saved(generations)
+
+    assert state.has_unsaved_changes()
+    assert state.to_dict()["gold"] == snapshot["gold"] + 1
+    state.mark_saved(state.save_generations())
+    assert not state.has_unsaved_changes()
+
+
+def test_to_dict_reuses_clean_sections_but_sees_changes():
+    state = aruna.build_sample_game_state()
+    first = state.to_dict()
+    state.mark_saved()
+
+    state.party["ARUNA"].hp = 1
+    second = state.to_dict()
+
+    assert second["party"]["ARUNA"]["hp"] == 1
+    assert second["inventory"] == first["inventory"]
@@ -0,0 +1,132 @@
+"""Sharding multi-proses: hash ring, pemilik update Telegram mentah, dan konfigurasi worker shard."""
+
+import pytest
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna
+
+USER_IDS = range(1, 20001)
+
+
+@pytest.fixture(autouse=True)
+def restore_shard_config(monkeypatch):
+    # apply_shard_config mengubah global dan formatter log; dikembalikan setelah tiap test.
+    monkeypatch.setattr(aruna, "SHARD_INDEX", None)
+    monkeypatch.setattr(aruna, "SHARD_COUNT", 1)
+    formatters = [(handler, handler.formatter) for handler in aruna.logger.handlers]
+    yield
+    for handler, formatter in formatters:
+        handler.setFormatter(formatter)
+
+
+# ==========================
+# HASH RING
+# ==========================
+
+
+def test_ring_is_deterministic_across_instances():
+    first, second = aruna.ShardRing(4), aruna.ShardRing(4)
+    assert [first.shard_for(uid) for uid in USER_IDS] == [second.shard_for(uid) for uid in USER_IDS]
+
+
+def test_ring_spreads_users_over_all_shards():
+    ring = aruna.ShardRing(4)
+    counts = [0] * 4
+    for uid in USER_IDS:
+        counts[ring.shard_for(uid)] += 1
+    expected = len(USER_IDS) / 4
+    assert all(0.6 * expected < count < 1.4 * expected for count in counts)
+
+
+def test_adding_shard_moves_only_its_share():
+    before, after = aruna.ShardRing(4), aruna.ShardRing(5)
+    moved = [uid for uid in USER_IDS if before.shard_for(uid) != after.shard_for(uid)]
+
+    # Idealnya 1/5 user pindah, dan semuanya pindah ke shard baru.
+    assert len(moved) < 0.3 * len(USER_IDS)
+    assert all(after.shard_for(uid) == 4 for uid in moved)
+
+
+def test_single_shard_and_unknown_user_go_to_zero():
+    assert aruna.ShardRing(1).shard_for(12345) == 0
+    assert aruna.ShardRing(3).shard_for(None) == 0
+
+
+def test_ring_rejects_zero_shards():
+    with pytest.raises(ValueError):
+        aruna.ShardRing(0)
+
+
+def test_get_shard_ring_is_cached():
+    assert aruna.get_shard_ring(3) is aruna.get_shard_ring(3)
+
+
+# ==========================
+# PEMILIK UPDATE
+# ==========================
+
+
+@pytest.mark.parametrize(
+    "payload,expected",
+    [
+        ({"update_id": 1, "message": {"from": {"id": 11}, "chat": {"id": -100}}}, 11),
+        ({"update_id": 2, "callback_query": {"from": {"id": 12}, "message": {"chat": {"id": 99}}}}, 12),
+        ({"update_id": 3, "edited_message": {"from": {"id": 13}, "chat": {"id": 13}}}, 13),
+        ({"update_id": 4, "poll_answer": {"user": {"id": 14}}}, 14),
+        ({"update_id": 5, "channel_post": {"chat": {"id": -200}}}, -200),
+        ({"update_id": 6, "unknown_kind": {"from": {"id": 15}}}, None),
+        ({"update_id": 7, "message": "bukan dict"}, None),
+    ],
+)
+def test_extract_update_user_id(payload, expected):
+    assert aruna.extract_update_user_id(payload) == expected
+
+
+def test_update_belongs_to_exactly_one_shard():
+    for uid in (1, 42, 987654321):
+        payload = {"message": {"from": {"id": uid}, "chat": {"id": uid}}}
+        owners = [index for index in range(4) if aruna.update_belongs_to_shard(payload, index, 4)]
+        assert owners == [aruna.get_shard_ring(4).shard_for(uid)]
+
+
+def test_update_belongs_to_shard_uses_configured_count():
+    aruna.apply_shard_config(1, 3)
+    payload = {"callback_query": {"from": {"id": 777}}}
+    assert aruna.update_belongs_to_shard(payload, 1) == (aruna.get_shard_ring(3).shard_for(777) == 1)
+
+
+# ==========================
+# KONFIGURASI WORKER
+# ==========================
+
+
+def test_apply_shard_config_sets_globals_and_keeps_save_store():
+    backend = aruna.get_save_backend()
+    save_dir = aruna.SAVE_DIR
+
+    aruna.apply_shard_config(2, 4)
+
+    assert (aruna.SHARD_INDEX, aruna.SHARD_COUNT) == (2, 4)
+    # Semua shard berbagi penyimpanan: user yang pindah shard tetap menemukan save-nya.
+    assert aruna.get_save_backend() is backend
+    assert aruna.SAVE_DIR == save_dir
+
+
+@pytest.mark.parametrize("shard_index,shard_count", [(-1, 2), (2, 2), (0, 0)])
+def test_apply_shard_config_rejects_bad_index(shard_index, shard_count):
+    with pytest.raises(ValueError):
+        aruna.apply_shard_config(shard_index, shard_count)
+    assert aruna.SHARD_INDEX is None
+
+
+def test_save_survives_shard_count_change(tmp_path):
+    # Dua worker (shard lama dan baru) membuka database yang sama lewat koneksi masing-masing.
+    db_path = str(tmp_path / "saves.db")
+    old_worker = aruna.SqliteSaveBackend(db_path)
+    new_worker = aruna.SqliteSaveBackend(db_path)
+    state = aruna.build_sample_game_state(user_id=4242)
+    try:
+        assert old_worker.save(4242, state.to_dict())
+        assert new_worker.load(4242) == state.to_dict()
+    finally:
+        old_worker.close()
+        new_worker.close()
@@ -0,0 +1,93 @@
+"""Endpoint webhook aiohttp: secret token, payload rusak, update salah shard, dan shutdown."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+import LEGENDS_OF_ARUNA_JOURNEY_TO_KAMPAR as aruna  # noqa: E402
+
+SECRET = "rahasia"
+PATH = "/telegram"
+
+
+def message_payload(user_id: int) -> dict:
+    return {"update_id": user_id, "message": {"from": {"id": user_id}, "chat": {"id": user_id}, "text": "/start"}}
+
+
+@pytest.fixture(autouse=True)
+def plain_updates(monkeypatch):
+    # Update.de_json cukup meneruskan payload; yang diuji hanya routing HTTP-nya.
+    monkeypatch.setattr(aruna, "Update", SimpleNamespace(de_json=lambda payload, bot: payload))
+    monkeypatch.setattr(aruna, "SHARD_INDEX", None)
+    monkeypatch.setattr(aruna, "SHARD_COUNT", 1)
+
+
+def post_updates(requests, accepting: bool = True):
+    """Kirim (payload, headers) berurutan; hasil: daftar status HTTP dan isi update_queue."""
+
+    async def scenario():
+        application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        app = aruna.build_webhook_app(application, path=PATH, secret_token=SECRET)
+        app["status"]["accepting"] = accepting
+        async with TestClient(TestServer(app)) as client:
+            statuses = []
+            for body, headers in requests:
+                response = await client.post(PATH, data=body, headers=headers)
+                statuses.append(response.status)
+        queued = []
+        while not application.update_queue.empty():
+            queued.append(application.update_queue.get_nowait())
+        return statuses, queued, app["status"]
+
+    return asyncio.run(scenario())
+
+
+def signed(payload, secret: str = SECRET):
+    return json.dumps(payload), {"X-Telegram-Bot-Api-Secret-Token": secret}
+
+
+def test_valid_update_is_queued():
+    statuses, queued, status = post_updates([signed(message_payload(1))])
+    assert statuses == [200]
+    assert queued == [message_payload(1)]
+    assert status["received"] == 1
+
+
+def test_wrong_or_missing_secret_is_forbidden():
+    body, _ = signed(message_payload(1))
+    statuses, queued, status = post_updates([signed(message_payload(1), "salah"), (body, {})])
+    assert statuses == [403, 403]
+    assert queued == []
+    assert status["rejected"] == 2
+
+
+def test_invalid_json_is_bad_request():
+    statuses, queued, _ = post_updates([("{bukan json", {"X-Telegram-Bot-Api-Secret-Token": SECRET})])
+    assert statuses == [400]
+    assert queued == []
+
+
+def test_shutdown_returns_service_unavailable():
+    statuses, queued, _ = post_updates([signed(message_payload(1))], accepting=False)
+    assert statuses == [503]
+    assert queued == []
+
+
+def test_update_for_other_shard_is_misdirected(monkeypatch):
+    monkeypatch.setattr(aruna, "SHARD_COUNT", 4)
+    ring = aruna.get_shard_ring(4)
+    mine = next(uid for uid in range(1, 1000) if ring.shard_for(uid) == 0)
+    other = next(uid for uid in range(1, 1000) if ring.shard_for(uid) != 0)
+    monkeypatch.setattr(aruna, "SHARD_INDEX", 0)
+
+    statuses, queued, status = post_updates([signed(message_payload(mine)), signed(message_payload(other))])
+
+    assert statuses == [200, 421]
+    assert queued == [message_payload(mine)]
+    assert status["misrouted"] == 1